@@ -22,6 +22,9 @@ class UserAdmin(BaseUserAdmin):
     inlines = (StudentInline, TeacherInline)
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'get_user_type')
     list_filter = ('is_staff', 'is_superuser', 'is_active')
+    # get_user_type() reads both profiles
+    list_select_related = ('student_profile', 'teacher_profile')
+    show_full_result_count = False
     
     def get_user_type(self, obj):
         if hasattr(obj, 'student_profile'):
@@ -44,6 +47,9 @@ class StudentAdmin(admin.ModelAdmin):
     list_display = ['enrollment_number', 'get_full_name', 'get_email', 'phone_number', 'created_at']
     search_fields = ['enrollment_number', 'user__first_name', 'user__last_name', 'user__email']
     list_filter = ['created_at']
+    list_select_related = ['user']
+    show_full_result_count = False
+    raw_id_fields = ['user']
     readonly_fields = ['created_at', 'updated_at']
     
     fieldsets = (
@@ -59,6 +65,10 @@ class StudentAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # Also what the Class roster autocomplete lists, by __str__
+        return super().get_queryset(request).select_related('user')
+    
     def get_full_name(self, obj):
         return obj.full_name
     get_full_name.short_description = 'Full Name'
@@ -73,6 +83,9 @@ class TeacherAdmin(admin.ModelAdmin):
     list_display = ['employee_id', 'get_full_name', 'specialization', 'get_email', 'created_at']
     search_fields = ['employee_id', 'user__first_name', 'user__last_name', 'specialization']
     list_filter = ['specialization', 'created_at']
+    list_select_related = ['user']
+    show_full_result_count = False
+    raw_id_fields = ['user']
     readonly_fields = ['created_at', 'updated_at']
     
     fieldsets = (
@@ -88,6 +101,10 @@ class TeacherAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # Also what the Class autocomplete lists, by __str__
+        return super().get_queryset(request).select_related('user')
+    
     def get_full_name(self, obj):
         return obj.full_name
     get_full_name.short_description = 'Full Name'
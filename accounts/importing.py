@@ -0,0 +1,275 @@
+"""
+Bulk account provisioning, for intakes of thousands of users.
+
+UserImporter reads records in chunks. For each chunk it:
+
+1. drops invalid records and usernames that already exist
+2. hashes the passwords in a process pool, since PBKDF2 dominates the cost
+3. bulk_create()s the User rows and then the Student/Teacher profiles,
+   in one transaction
+
+bulk_create() sends no post_save, so create_user_profile never runs; the
+profiles get the same default numbers it would give them. The
+bookkeeping the profile signals do elsewhere is done once per chunk
+instead: core.stats totals, the catalog cache version and the
+invalidation bus event (core.bus).
+
+Because existing usernames are skipped, an interrupted import can simply
+be run again. The checkpoint file also lets it skip the records already
+committed without reading them back from the database.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import Student, Teacher
+
+ROLES = ('student', 'teacher')
+CHUNK_SIZE = 500
+
+USER_FIELDS = ('first_name', 'last_name', 'email')
+PROFILE_FIELDS = {
+    'student': ('enrollment_number', 'date_of_birth', 'phone_number'),
+    'teacher': ('employee_id', 'specialization', 'phone_number', 'bio'),
+}
+
+
+def read_records(path, format=None):
+    """
+    Yield (record number, dict) for each record of a CSV file (with a
+    header row) or a JSONL file (one object per line), streamed
+    """
+    format = format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            for number, row in enumerate(csv.DictReader(f), 1):
+                yield number, {key: value for key, value in row.items() if value not in ('', None)}
+        elif format == 'jsonl':
+            number = 0
+            for line in f:
+                if line.strip():
+                    number += 1
+                    yield number, json.loads(line)
+        else:
+            raise ValueError(f'Unknown format "{format}"; use csv or jsonl')
+
+
+def _init_worker():
+    # Spawned (rather than forked) workers start without Django configured
+    import django
+    from django.conf import settings
+
+    if not settings.configured:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    django.setup()
+
+
+def _clean_field(model, name, value):
+    """`value` converted and validated as `model`'s field `name`"""
+    return model._meta.get_field(name).clean(value, None)
+
+
+def _hash(password):
+    # Accounts without a password get an unusable one, like create_user()
+    return make_password(password or None)
+
+
+class ImportReport:
+    def __init__(self):
+        self.records = 0
+        self.created = {role: 0 for role in ROLES}
+        self.existing = 0
+        self.invalid = []  # (record number, message)
+        self.hash_seconds = 0.0
+        self.write_seconds = 0.0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        """Records per second"""
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'records': self.records, 'created': self.created, 'existing': self.existing,
+            'invalid': len(self.invalid),
+        }
+
+
+class Checkpoint:
+    """How far into `source` the import has committed, in a JSON file"""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+
+    def load(self):
+        """Records already committed, or 0 without a checkpoint for this source"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+        if state.get('source') != self.source:
+            raise ValueError(f'Checkpoint {self.path} belongs to {state.get("source")}')
+        return state['records']
+
+    def save(self, records, report):
+        state = {'source': self.source, 'records': records, 'report': report.as_dict()}
+        # Written aside and renamed, so a crash never leaves half a file
+        with open(f'{self.path}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{self.path}.tmp', self.path)
+
+
+class UserImporter:
+
+    def __init__(self, role='student', chunk_size=CHUNK_SIZE, workers=None,
+                 using='default', log=None):
+        if role not in ROLES:
+            raise ValueError(f'Unknown role "{role}"')
+        self.role = role
+        self.chunk_size = chunk_size
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.using = using
+        self.log = log or (lambda message: None)
+
+    def run(self, records, checkpoint=None, skip=0):
+        """
+        Import the (number, dict) `records`, skipping the first `skip`.
+        Returns an ImportReport.
+        """
+        report = ImportReport()
+        records = islice(records, skip, None)
+        done = skip
+        pool = ProcessPoolExecutor(self.workers, initializer=_init_worker) if self.workers > 1 else None
+        try:
+            while chunk := list(islice(records, self.chunk_size)):
+                self._import_chunk(chunk, report, pool)
+                done += len(chunk)
+                if checkpoint is not None:
+                    checkpoint.save(done, report)
+                self.log(
+                    f'{done} records: {sum(report.created.values())} created, '
+                    f'{report.existing} existing, {len(report.invalid)} invalid '
+                    f'({report.rate:.0f} records/s)'
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return report
+
+    def _clean(self, record):
+        """(role, user fields, profile fields), or a ValidationError"""
+        role = record.get('role') or self.role
+        if role not in ROLES:
+            raise ValidationError(f'unknown role "{role}"')
+        username = str(record.get('username') or '').strip()
+        if not username:
+            raise ValidationError('missing username')
+        user = {'username': _clean_field(User, 'username', username),
+                'password': str(record.get('password') or '')}
+        for field in USER_FIELDS:
+            if record.get(field):
+                user[field] = _clean_field(User, field, record[field])
+        model = Teacher if role == 'teacher' else Student
+        profile = {field: _clean_field(model, field, record[field])
+                   for field in PROFILE_FIELDS[role] if record.get(field)}
+        return role, user, profile
+
+    def _import_chunk(self, chunk, report, pool):
+        report.records += len(chunk)
+        rows = []
+        seen = set()
+        for number, record in chunk:
+            try:
+                role, user, profile = self._clean(record)
+            except ValidationError as e:
+                report.invalid.append((number, '; '.join(e.messages)))
+                continue
+            if user['username'] in seen:
+                report.invalid.append((number, f'duplicate username "{user["username"]}"'))
+                continue
+            seen.add(user['username'])
+            rows.append((number, role, user, profile))
+
+        existing = set(User.objects.using(self.using).filter(
+            username__in=seen
+        ).values_list('username', flat=True))
+        report.existing += len(existing)
+        rows = [row for row in rows if row[2]['username'] not in existing]
+        if not rows:
+            return
+
+        started = time.perf_counter()
+        passwords = [user.pop('password') for _, _, user, _ in rows]
+        if pool is not None:
+            hashes = list(pool.map(_hash, passwords, chunksize=max(1, len(passwords) // self.workers)))
+        else:
+            hashes = [_hash(password) for password in passwords]
+        report.hash_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            with transaction.atomic(using=self.using):
+                self._write(rows, hashes, report)
+        except IntegrityError:
+            # A profile number clashes with an existing one: find which
+            for row, password in zip(rows, hashes):
+                try:
+                    with transaction.atomic(using=self.using):
+                        self._write([row], [password], report)
+                except IntegrityError as e:
+                    report.invalid.append((row[0], str(e)))
+        report.write_seconds += time.perf_counter() - started
+
+    def _write(self, rows, hashes, report):
+        from core import stats
+        from core.bus import bus
+        from core.caching import bump_versions
+        from core.refdata import reference_data
+
+        users = User.objects.using(self.using).bulk_create([
+            User(password=password, is_staff=(role == 'teacher'), **user)
+            for (_, role, user, _), password in zip(rows, hashes)
+        ])
+        students, teachers = [], []
+        for (_, role, _, profile), user in zip(rows, users):
+            # The defaults create_user_profile would have set
+            if role == 'teacher':
+                profile.setdefault('employee_id', f'T{user.pk:05d}')
+                profile.setdefault('specialization', 'General')
+                teachers.append(Teacher(user=user, **profile))
+            else:
+                profile.setdefault('enrollment_number', f'S{user.pk:05d}')
+                students.append(Student(user=user, **profile))
+        Student.objects.using(self.using).bulk_create(students)
+        Teacher.objects.using(self.using).bulk_create(teachers)
+
+        report.created['student'] += len(students)
+        report.created['teacher'] += len(teachers)
+
+        def changed():
+            stats.adjust_totals(self.using, total_students=len(students),
+                                total_teachers=len(teachers))
+            bump_versions()
+            if teachers:
+                reference_data.changed('teacher')
+            for model, profiles in (('student', students), ('teacher', teachers)):
+                if profiles:
+                    bus.publish(model, 'import', [p.pk for p in profiles],
+                                user_ids=[p.user_id for p in profiles])
+
+        transaction.on_commit(changed, using=self.using)
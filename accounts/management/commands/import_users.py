@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from accounts.importing import CHUNK_SIZE, ROLES, Checkpoint, UserImporter, read_records
+
+# Invalid records listed in the report; the rest are only counted
+SHOWN_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = 'Creates students and teachers in bulk from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with a header row, or JSONL with one object per line')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--role', choices=ROLES, default='student',
+                            help='Role for records without a "role" field (default: student)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Records per transaction (default: {CHUNK_SIZE})')
+        parser.add_argument('--workers', type=int,
+                            help='Password hashing processes (default: one per CPU)')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file (default: PATH.checkpoint)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the records the checkpoint says are already imported')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to import into (default: "default")')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        checkpoint = Checkpoint(options['checkpoint'] or f'{path}.checkpoint', path)
+        try:
+            skip = checkpoint.load() if options['resume'] else 0
+            importer = UserImporter(
+                role=options['role'], chunk_size=options['chunk_size'],
+                workers=options['workers'], using=options['database'], log=self.stdout.write,
+            )
+            if skip:
+                self.stdout.write(f'Resuming after record {skip}')
+            report = importer.run(read_records(path, options['format']), checkpoint, skip)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        for number, message in report.invalid[:SHOWN_ERRORS]:
+            self.stderr.write(f'  record {number}: {message}')
+        if len(report.invalid) > SHOWN_ERRORS:
+            self.stderr.write(f'  ... and {len(report.invalid) - SHOWN_ERRORS} more')
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.records} records in {report.elapsed:.1f}s '
+            f'({report.rate:.0f} records/s): '
+            f'{report.created["student"]} students and {report.created["teacher"]} teachers created, '
+            f'{report.existing} already existed, {len(report.invalid)} invalid'
+        ))
+        self.stdout.write(
+            f'  hashing {report.hash_seconds:.1f}s with {importer.workers} workers, '
+            f'writing {report.write_seconds:.1f}s'
+        )
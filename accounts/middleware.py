@@ -0,0 +1,23 @@
+from django.utils.functional import SimpleLazyObject
+
+from .principals import Role
+
+
+class RoleMiddleware:
+    """
+    Sets `request.role` (accounts.principals.Role), resolved on first use.
+
+    Resolving primes `request.user.student_profile` / `teacher_profile`
+    too, so views and templates stop paying a query (and a DoesNotExist)
+    per hasattr() check. It costs at most one query and none while the
+    principal cache is warm. Being lazy, DRF views see the user their own
+    authentication classes resolved (e.g. bearer tokens), and views that
+    never look at the role pay nothing.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: Role.for_user(request.user))
+        return self.get_response(request)
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Teacher and Student order by their user's first and last name. auth_user
+    belongs to django.contrib.auth, so the index is created here rather than
+    declared on a model.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX accounts_user_name_idx ON auth_user (first_name, last_name)',
+            'DROP INDEX accounts_user_name_idx',
+        ),
+    ]
@@ -0,0 +1,192 @@
+"""
+Resolved principals: a User together with its Student/Teacher profile.
+
+Role is the lightweight view of the same data that views use via
+`request.role` (see accounts.middleware.RoleMiddleware).
+
+load_principal() fetches the user and both reverse one-to-one profiles in
+a single query and primes the relation caches, so `request.user.student_profile`
+and `hasattr(request.user, 'teacher_profile')` no longer hit the database.
+
+get_principal() keeps the loaded rows in a short-TTL, per-process cache
+that is invalidated whenever the user or one of its profiles is saved or
+deleted. Every call returns fresh model instances, so callers may mutate
+what they get back.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Student, Teacher
+
+
+class PrincipalCache:
+    """Thread-safe {user_id: (expires_at, rows)} map with a fixed TTL"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, rows = entry
+        if expires_at < time.monotonic():
+            self.invalidate(user_id)
+            return None
+        return rows
+
+    def set(self, user_id, rows):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, rows)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(ttl=getattr(settings, 'PRINCIPAL_CACHE_TTL', 30))
+
+
+def _dump(obj):
+    if obj is None:
+        return None
+    return obj._state.db, tuple(getattr(obj, f.attname) for f in obj._meta.concrete_fields)
+
+
+def _load(model, dumped):
+    if dumped is None:
+        return None
+    db, values = dumped
+    return model.from_db(db, [f.attname for f in model._meta.concrete_fields], values)
+
+
+def _prime(user, student_row, teacher_row):
+    student = _load(Student, student_row)
+    teacher = _load(Teacher, teacher_row)
+
+    # Prime both sides of the one-to-one relations; None marks "no profile"
+    User.student_profile.related.set_cached_value(user, student)
+    User.teacher_profile.related.set_cached_value(user, teacher)
+    for profile in (student, teacher):
+        if profile is not None:
+            type(profile).user.field.set_cached_value(profile, user)
+    return user
+
+
+def _assemble(rows):
+    user_row, student_row, teacher_row = rows
+    return _prime(_load(User, user_row), student_row, teacher_row)
+
+
+def load_principal(user_id):
+    """The user with its profiles in one query, or None if it does not exist"""
+    user = User.objects.select_related('student_profile', 'teacher_profile').filter(
+        pk=user_id
+    ).first()
+    if user is None:
+        return None
+    return (
+        _dump(user),
+        _dump(getattr(user, 'student_profile', None)),
+        _dump(getattr(user, 'teacher_profile', None)),
+    )
+
+
+def _cached_rows(user_id):
+    rows = principal_cache.get(user_id)
+    if rows is None:
+        rows = load_principal(user_id)
+        if rows is not None:
+            principal_cache.set(user_id, rows)
+    return rows
+
+
+def get_principal(user_id):
+    """Cached load_principal() returning a ready-to-use User instance"""
+    rows = _cached_rows(user_id)
+    if rows is None:
+        return None
+    return _assemble(rows)
+
+
+def attach_profiles(user):
+    """
+    Prime an already loaded user's profile relations from the principal
+    cache (at most one query), so later profile access is free
+    """
+    if (User.student_profile.related.is_cached(user)
+            and User.teacher_profile.related.is_cached(user)):
+        return user
+    rows = _cached_rows(user.pk)
+    if rows is None:
+        return _prime(user, None, None)
+    return _prime(user, rows[1], rows[2])
+
+
+class Role:
+    """
+    What the current user is, as far as views care: a student, a teacher
+    or neither, and the id of that profile. A user with both profiles is
+    treated as a student, matching the views' historical checks.
+    """
+    __slots__ = ('student_id', 'teacher_id')
+
+    def __init__(self, student_id=None, teacher_id=None):
+        self.student_id = student_id
+        self.teacher_id = teacher_id
+
+    @classmethod
+    def for_user(cls, user):
+        if not user.is_authenticated:
+            return cls()
+        attach_profiles(user)
+        student = getattr(user, 'student_profile', None)
+        teacher = getattr(user, 'teacher_profile', None)
+        return cls(
+            student_id=student.pk if student is not None else None,
+            teacher_id=teacher.pk if teacher is not None else None,
+        )
+
+    @property
+    def is_student(self):
+        return self.student_id is not None
+
+    @property
+    def is_teacher(self):
+        return self.teacher_id is not None
+
+    @property
+    def kind(self):
+        if self.is_student:
+            return 'student'
+        if self.is_teacher:
+            return 'teacher'
+        return None
+
+    def __repr__(self):
+        return f'<Role {self.kind} student_id={self.student_id} teacher_id={self.teacher_id}>'
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_principal(sender, instance, **kwargs):
+    principal_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def invalidate_profile_principal(sender, instance, **kwargs):
+    principal_cache.invalidate(instance.user_id)
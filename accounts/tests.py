@@ -1,3 +1,152 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.importing import Checkpoint, UserImporter, read_records
+from accounts.models import Student, Teacher
+from accounts.principals import principal_cache
+from core.tests import CatalogTestData
+
+
+class ImportUsersTests(TestCase):
+    """accounts.importing: bulk-created accounts, like create_user_profile's"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_csv_import(self):
+        User.objects.create_user('taken', password='x')
+        path = self.write('users.csv', (
+            'username,password,first_name,role,specialization,date_of_birth\n'
+            'new.student,secret1,Ana,,,2001-02-03\n'
+            'new.teacher,secret2,Bruno,teacher,Physics,\n'
+            'taken,x,,,,\n'
+            'bad name!,x,,,,\n'
+            'new.student,x,,,,\n'
+        ))
+        report = UserImporter(workers=1).run(read_records(path))
+
+        self.assertEqual(report.created, {'student': 1, 'teacher': 1})
+        self.assertEqual(report.existing, 1)
+        self.assertEqual([number for number, _ in report.invalid], [4, 5])
+
+        student = Student.objects.get(user__username='new.student')
+        self.assertEqual(student.enrollment_number, f'S{student.user_id:05d}')
+        self.assertEqual(str(student.date_of_birth), '2001-02-03')
+        teacher = Teacher.objects.get(user__username='new.teacher')
+        self.assertEqual(teacher.employee_id, f'T{teacher.user_id:05d}')
+        self.assertEqual(teacher.specialization, 'Physics')
+        self.assertTrue(teacher.user.is_staff)
+        self.assertTrue(self.client.login(username='new.student', password='secret1'))
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('users.jsonl', ''.join(
+            json.dumps({'username': f'intake{n}', 'password': 'pw'}) + '\n' for n in range(5)
+        ))
+        checkpoint = Checkpoint(f'{path}.checkpoint', path)
+        UserImporter(chunk_size=2, workers=1).run(
+            (record for record in read_records(path) if record[0] <= 2), checkpoint
+        )
+        self.assertEqual(checkpoint.load(), 2)
+
+        report = UserImporter(chunk_size=2, workers=1).run(
+            read_records(path), checkpoint, skip=checkpoint.load()
+        )
+        self.assertEqual(report.records, 3)
+        self.assertEqual(report.created['student'], 3)
+        self.assertEqual(checkpoint.load(), 5)
+        self.assertEqual(User.objects.filter(username__startswith='intake').count(), 5)
+        with self.assertRaises(ValueError):
+            Checkpoint(checkpoint.path, 'other.jsonl').load()
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class StudentAdminTests(TestCase):
+    """The Student admin runs a fixed number of queries however many students there are"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        cls.students = [
+            User.objects.create_user(f'student{i}', first_name='Ana', last_name=f'Lima{i}').student_profile
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist(self):
+        response = self.client.get(reverse('admin:accounts_student_changelist'))
+        self.assertContains(response, 'Ana Lima4')
+
+    def test_change_page(self):
+        student = self.students[0]
+        response = self.client.get(reverse('admin:accounts_student_change', args=[student.pk]))
+        self.assertContains(response, 'vForeignKeyRawIdAdminField')
+
+    def test_roster_autocomplete(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'core', 'model_name': 'class_students', 'field_name': 'student',
+            'term': 'Lima',
+        })
+        self.assertEqual(len(response.json()['results']), 5)
+
+
+class RoleMiddlewareTests(CatalogTestData, TestCase):
+    """accounts.middleware.RoleMiddleware: request.role, resolved once per request"""
+
+    def setUp(self):
+        super().setUp()
+        principal_cache.clear()
+
+    def get(self, name, *args, user=None, queries):
+        if user is not None:
+            self.client.force_login(user)
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse(name, args=args))
+        self.assertEqual(response.status_code, 200)
+        return response.wsgi_request.role
+
+    def test_anonymous(self):
+        # No session, so no user and no profiles: the class and its roster
+        role = self.get('classes:detail', self.classes[3].pk, queries=3)
+        self.assertEqual((role.kind, role.student_id, role.teacher_id), (None, None, None))
+        # Semester versions, the statistics row, then the cold fragments'
+        # semester figures and subjects
+        role = self.get('classes:dashboard', queries=4)
+        self.assertFalse(role.is_student or role.is_teacher)
+
+    def test_student(self):
+        # As anonymous, plus session, user, profiles and the student's figures
+        role = self.get('classes:dashboard', user=self.student_user, queries=8)
+        self.assertEqual((role.kind, role.student_id, role.teacher_id),
+                         ('student', self.students[0].pk, None))
+        # The principal cache is warm now: session and user on top of the
+        # anonymous page
+        role = self.get('classes:detail', self.classes[3].pk, queries=5)
+        self.assertTrue(role.is_student)
+
+    def test_teacher(self):
+        role = self.get('classes:dashboard', user=self.teacher_user, queries=8)
+        self.assertEqual((role.kind, role.student_id, role.teacher_id),
+                         ('teacher', None, self.teachers[0].pk))
+        role = self.get('classes:detail', self.classes[3].pk, queries=5)
+        self.assertTrue(role.is_teacher)
+        self.assertFalse(role.is_student)
+
+    def test_user_without_a_profile(self):
+        # Session, user and the profiles lookup, which finds neither, then
+        # the class and its roster
+        role = self.get('classes:detail', self.classes[3].pk, user=self.admin, queries=6)
+        self.assertIsNone(role.kind)
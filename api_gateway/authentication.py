@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import salted_hmac
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from accounts.principals import get_principal
+
+TOKEN_SALT = 'api_gateway.authentication.BearerTokenAuthentication'
+
+
+def token_version(user):
+    """Changes with the password hash, so a password change revokes old tokens"""
+    return salted_hmac(TOKEN_SALT, user.password).hexdigest()[:12]
+
+
+def issue_token(user):
+    """Signed, timestamped bearer token for `user`"""
+    return signing.dumps({'uid': user.pk, 'v': token_version(user)}, salt=TOKEN_SALT)
+
+
+class BearerTokenAuthentication(BaseAuthentication):
+    """
+    Stateless signed-token authentication for machine clients.
+
+        Authorization: Bearer <token from issue_token()>
+
+    The user and its student/teacher profile come from the principal cache
+    (accounts.principals), so a warm request authenticates without queries.
+    Tokens expire after settings.API_TOKEN_MAX_AGE seconds.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid bearer header.')
+
+        try:
+            payload = signing.loads(
+                auth[1].decode(), salt=TOKEN_SALT,
+                max_age=getattr(settings, 'API_TOKEN_MAX_AGE', 24 * 60 * 60)
+            )
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Token expired.')
+        except (signing.BadSignature, UnicodeDecodeError):
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        user = get_principal(payload.get('uid'))
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        if payload.get('v') != token_version(user):
+            raise exceptions.AuthenticationFailed('Token revoked.')
+
+        return (user, payload)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,101 @@
+"""
+Precompiled row encoders for the hot list endpoints.
+
+A RowEncoder describes each output field of a serializer as the database
+columns it reads plus a Python expression over them. For a given set of
+fields it fetches a single values_list() query and compiles one function
+that turns each row tuple straight into the dict the serializer would have
+produced, skipping the per-field to_representation() dispatch.
+"""
+from functools import lru_cache
+
+
+def full_name(first_name, last_name, username):
+    """Same result as Student/Teacher.full_name without loading the User"""
+    return ('%s %s' % (first_name, last_name)).strip() or username
+
+
+class RowEncoder:
+    """
+    Column-oriented encoder mirroring a serializer's output.
+
+    `fields` is a sequence of (name, columns, expression) where
+    `expression` refers to its columns as {0}, {1}, ... in order.
+    """
+
+    def __init__(self, fields, helpers=None):
+        self.fields = tuple(fields)
+        self.field_names = [name for name, _, _ in self.fields]
+        self.helpers = dict(helpers or {})
+
+    def columns_for(self, names=None):
+        """values_list() lookups needed to render the given fields"""
+        return self._compile(self._key(names))[0]
+
+    def rows(self, queryset, names=None):
+        """The queryset reduced to the row tuples the encoder consumes"""
+        return queryset.values_list(*self.columns_for(names))
+
+    def encode(self, rows, names=None):
+        """Turn row tuples from rows() into a list of serializer-shaped dicts"""
+        return self._compile(self._key(names))[1](rows)
+
+    def _key(self, names):
+        if names is None:
+            return tuple(self.field_names)
+        return tuple(name for name in self.field_names if name in names)
+
+    @lru_cache(maxsize=64)
+    def _compile(self, names):
+        columns = []
+        items = []
+        for name, field_columns, expression in self.fields:
+            if name not in names:
+                continue
+            refs = []
+            for column in field_columns:
+                if column not in columns:
+                    columns.append(column)
+                refs.append('r[%d]' % columns.index(column))
+            items.append('%r: %s' % (name, expression.format(*refs)))
+
+        source = 'def encode(rows):\n    return [{%s} for r in rows]\n' % ', '.join(items)
+        namespace = dict(self.helpers)
+        exec(compile(source, '<RowEncoder %s>' % ','.join(names), 'exec'), namespace)
+        return tuple(columns), namespace['encode']
+
+
+TEACHER_NAME_COLUMNS = ('teacher__user__first_name', 'teacher__user__last_name',
+                        'teacher__user__username')
+USER_NAME_COLUMNS = ('user__first_name', 'user__last_name', 'user__username')
+
+# ClassListSerializer; seat fields read the student_count annotation
+CLASS_LIST_ENCODER = RowEncoder([
+    ('id', ('id',), '{0}'),
+    ('subject_code', ('subject__code',), '{0}'),
+    ('subject_name', ('subject__name',), '{0}'),
+    ('teacher_name', TEACHER_NAME_COLUMNS, 'full_name({0}, {1}, {2})'),
+    ('schedule', ('schedule',), '{0}'),
+    ('room', ('room',), '{0}'),
+    ('semester', ('semester',), '{0}'),
+    ('max_students', ('max_students',), '{0}'),
+    ('enrolled_count', ('student_count',), '{0}'),
+    ('available_seats', ('max_students', 'student_count'), '{0} - {1}'),
+    ('is_full', ('student_count', 'max_students'), '{0} >= {1}'),
+    ('is_active', ('is_active',), '{0}'),
+], helpers={'full_name': full_name})
+
+STUDENT_ENCODER = RowEncoder([
+    ('id', ('id',), '{0}'),
+    ('enrollment_number', ('enrollment_number',), '{0}'),
+    ('full_name', USER_NAME_COLUMNS, 'full_name({0}, {1}, {2})'),
+    ('email', ('user__email',), '{0}'),
+], helpers={'full_name': full_name})
+
+TEACHER_ENCODER = RowEncoder([
+    ('id', ('id',), '{0}'),
+    ('employee_id', ('employee_id',), '{0}'),
+    ('full_name', USER_NAME_COLUMNS, 'full_name({0}, {1}, {2})'),
+    ('specialization', ('specialization',), '{0}'),
+    ('email', ('user__email',), '{0}'),
+], helpers={'full_name': full_name})
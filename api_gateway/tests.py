@@ -1,3 +1,285 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import Student, Teacher
+from accounts.principals import principal_cache
+from api_gateway import renderers
+from api_gateway.authentication import BearerTokenAuthentication, issue_token
+from api_gateway.views import (
+    ClassDetailSerializer, ClassListSerializer, StudentSerializer, TeacherSerializer,
+)
+from core.autocomplete import autocomplete_index
+from core.models import Class
+from core.tests import CatalogTestData, url_names
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class ApiQueryBudgetTests(CatalogTestData, TestCase):
+    """
+    Every view in api_gateway/urls.py against the budgets pinned in
+    settings.QUERY_BUDGETS; QueryBudgetMiddleware raises when one is exceeded.
+    """
+
+    def test_every_view_has_a_budget(self):
+        missing = url_names('api_gateway.urls', 'api') - set(settings.QUERY_BUDGETS)
+        self.assertFalse(missing, f'No query budget for {sorted(missing)}')
+
+    def get(self, name, *args, user=None, status=200, **params):
+        if user is not None:
+            self.client.force_login(user)
+        response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def post(self, name, *args, user=None, data=None, status=200):
+        if user is not None:
+            self.client.force_login(user)
+        response = self.client.post(reverse(name, args=args), data or {},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_api_root(self):
+        self.get('api:api-root')
+
+    def test_class_list(self):
+        self.get('api:class-list')
+        self.get('api:class-list', fields='id,available_seats')
+        self.post('api:class-list', user=self.teacher_user, status=201, data={
+            'subject_id': self.subjects[1].pk, 'teacher_id': self.teachers[0].pk,
+            'schedule': 'FRI 08:00-10:00', 'semester': '2025.1',
+        })
+
+    def test_class_detail(self):
+        self.get('api:class-detail', self.classes[3].pk)
+        self.get('api:class-detail', self.classes[3].pk, expand='')
+        self.get('api:class-detail', self.classes[3].pk, expand='subject,teacher,students')
+        self.get('api:class-detail', self.classes[3].pk, fields='id,students', expand='students')
+
+    def test_class_enroll(self):
+        self.post('api:class-enroll', self.classes[0].pk, user=self.student_users[3])
+
+    def test_class_unenroll(self):
+        self.post('api:class-unenroll', self.classes[3].pk, user=self.student_user)
+
+    def test_subject_list(self):
+        self.get('api:subject-list')
+        self.get('api:subject-list', expand='classes')
+
+    def test_subject_detail(self):
+        self.get('api:subject-detail', self.subjects[0].pk)
+        self.get('api:subject-detail', self.subjects[0].pk, expand='classes')
+
+    def test_student_list(self):
+        self.get('api:student-list', user=self.teacher_user)
+
+    def test_student_detail(self):
+        self.get('api:student-detail', self.students[0].pk, user=self.teacher_user)
+
+    def test_teacher_list(self):
+        self.get('api:teacher-list')
+        self.get('api:teacher-list', expand='classes')
+        self.get('api:teacher-list', fields='id,classes', expand='classes')
+
+    def test_teacher_detail(self):
+        self.get('api:teacher-detail', self.teachers[0].pk)
+        self.get('api:teacher-detail', self.teachers[0].pk, expand='classes')
+
+    def test_my_classes(self):
+        self.get('api:my_classes', user=self.student_user)
+        self.get('api:my_classes', user=self.teacher_user)
+
+    def test_autocomplete(self):
+        autocomplete_index.reset()
+        self.get('api:autocomplete', q='cs')
+        with self.assertNumQueries(0):
+            response = self.get('api:autocomplete', q='cs1')
+        self.assertEqual(response.json()['results'], [
+            {'type': 'subject', 'id': self.subjects[1].pk, 'label': 'CS101 - Subject 1'},
+        ])
+
+    def test_token(self):
+        self.student_user.set_password('secret-pass')
+        self.student_user.save()
+        response = self.client.post(reverse('api:token'),
+                                    {'username': 'student0', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', response.json())
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class SparseFieldsTests(CatalogTestData, TestCase):
+    """?fields= and ?expand= (SparseFieldsMixin and SparseFieldsViewMixin)"""
+
+    def get(self, name, *args, **params):
+        response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_fields_prune_the_response(self):
+        rows = self.get('api:class-list', fields='id,room,is_full')['results']
+        self.assertEqual([set(row) for row in rows], [{'id', 'room', 'is_full'}] * 4)
+        detail = self.get('api:class-detail', self.classes[3].pk, fields='id,available_seats')
+        self.assertEqual(detail, {'id': self.classes[3].pk, 'available_seats': 26})
+        teacher = self.get('api:teacher-detail', self.teachers[0].pk, fields='full_name')
+        self.assertEqual(teacher, {'full_name': 'Prof 0'})
+        subject = self.get('api:subject-detail', self.subjects[0].pk, fields='code,class_count')
+        self.assertEqual(subject, {'code': 'CS001', 'class_count': 2})
+
+    def test_collapsed_relations_are_primary_keys(self):
+        class_obj = self.classes[3]
+        detail = self.get('api:class-detail', class_obj.pk, expand='')
+        self.assertEqual(detail['subject'], class_obj.subject_id)
+        self.assertEqual(detail['teacher'], class_obj.teacher_id)
+        self.assertEqual(sorted(detail['students']), sorted(s.pk for s in self.students))
+
+        detail = self.get('api:class-detail', class_obj.pk, expand='teacher',
+                          fields='subject,teacher')
+        self.assertEqual(detail['subject'], class_obj.subject_id)
+        self.assertEqual(detail['teacher']['id'], class_obj.teacher_id)
+        self.assertEqual(detail['teacher']['full_name'], 'Prof 1')
+        self.assertEqual(set(detail), {'subject', 'teacher'})
+
+    def test_expanded_relations_are_nested(self):
+        # Without ?expand= the class keeps its default shape, all nested
+        detail = self.get('api:class-detail', self.classes[3].pk)
+        self.assertEqual(detail['subject']['code'], 'CS001')
+        self.assertEqual(len(detail['students']), 4)
+        self.assertEqual(set(detail['students'][0]),
+                         {'id', 'enrollment_number', 'full_name', 'email'})
+
+        teacher = self.get('api:teacher-detail', self.teachers[0].pk)
+        self.assertNotIn('classes', teacher)
+        teacher = self.get('api:teacher-detail', self.teachers[0].pk, expand='classes')
+        self.assertEqual([c['id'] for c in teacher['classes']],
+                         [self.classes[0].pk, self.classes[2].pk])
+        self.assertEqual(teacher['classes'][0]['enrolled_count'], 1)
+
+        subjects = self.get('api:subject-list', expand='classes', fields='code,classes')
+        self.assertEqual(subjects['results'][0]['code'], 'CS001')
+        self.assertEqual([c['subject_code'] for c in subjects['results'][0]['classes']],
+                         ['CS001', 'CS001'])
+
+
+class RenderingTests(CatalogTestData, TestCase):
+    """
+    The row encoders (api_gateway.encoders) and FastJSONRenderer, with and
+    without orjson, give the bytes JSONRenderer gives for the serializers
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Non-ASCII, and a line separator JSONRenderer escapes
+        User.objects.filter(pk=self.teacher_user.pk).update(first_name='Zo\u00eb\u2028')
+
+    def assertRendersAs(self, name, args, data, **params):
+        expected = JSONRenderer().render(data)
+        for orjson in (renderers.orjson, None):
+            with mock.patch.object(renderers, 'orjson', orjson):
+                response = self.client.get(reverse(name, args=args), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, expected, f'{name} {params} orjson={orjson}')
+
+    @staticmethod
+    def page(serializer):
+        data = serializer.data
+        return {'count': len(data), 'next': None, 'previous': None, 'results': data}
+
+    def test_class_list(self):
+        classes = Class.objects.filter(is_active=True).with_stats().select_related(
+            'subject', 'teacher', 'teacher__user'
+        )
+        self.assertRendersAs('api:class-list', [],
+                             self.page(ClassListSerializer(classes, many=True)))
+        fields = {'id', 'teacher_name', 'available_seats', 'is_full'}
+        self.assertRendersAs('api:class-list', [],
+                             self.page(ClassListSerializer(classes, many=True, fields=fields)),
+                             fields=','.join(sorted(fields)))
+
+    def test_class_detail(self):
+        class_obj = Class.objects.with_stats().get(pk=self.classes[3].pk)
+        self.assertRendersAs('api:class-detail', [class_obj.pk],
+                             ClassDetailSerializer(class_obj).data)
+        fields = {'id', 'teacher', 'students', 'available_seats'}
+        self.assertRendersAs('api:class-detail', [class_obj.pk],
+                             ClassDetailSerializer(class_obj, fields=fields).data,
+                             fields=','.join(sorted(fields)))
+
+    def test_student_list_and_detail(self):
+        # The student endpoints have no sparse fields: ?fields= is ignored
+        self.client.force_login(self.teacher_user)
+        students = Student.objects.select_related('user')
+        for params in ({}, {'fields': 'id'}):
+            self.assertRendersAs('api:student-list', [],
+                                 self.page(StudentSerializer(students, many=True)), **params)
+            self.assertRendersAs('api:student-detail', [self.students[0].pk],
+                                 StudentSerializer(self.students[0]).data, **params)
+
+    def test_teacher_list_and_detail(self):
+        teachers = Teacher.objects.select_related('user')
+        teacher = teachers.get(pk=self.teachers[0].pk)
+        self.assertRendersAs('api:teacher-list', [],
+                             self.page(TeacherSerializer(teachers, many=True)))
+        self.assertRendersAs('api:teacher-detail', [teacher.pk], TeacherSerializer(teacher).data)
+        fields = {'id', 'full_name', 'email'}
+        self.assertRendersAs('api:teacher-list', [],
+                             self.page(TeacherSerializer(teachers, many=True, fields=fields)),
+                             fields=','.join(sorted(fields)))
+        self.assertRendersAs('api:teacher-detail', [teacher.pk],
+                             TeacherSerializer(teacher, fields=fields).data,
+                             fields=','.join(sorted(fields)))
+
+
+class BearerTokenAuthenticationTests(CatalogTestData, TestCase):
+
+    def setUp(self):
+        principal_cache.clear()
+        self.auth = BearerTokenAuthentication()
+
+    def request_for(self, user):
+        return APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {issue_token(user)}')
+
+    def test_warm_path_runs_no_queries(self):
+        request = self.request_for(self.student_user)
+        with self.assertNumQueries(1):
+            self.auth.authenticate(request)
+        with self.assertNumQueries(0):
+            user, _ = self.auth.authenticate(request)
+            self.assertEqual(user.student_profile.pk, self.students[0].pk)
+            self.assertFalse(hasattr(user, 'teacher_profile'))
+
+    def test_profile_save_invalidates_cached_principal(self):
+        request = self.request_for(self.teacher_user)
+        self.auth.authenticate(request)
+        self.teachers[0].specialization = 'Compilers'
+        self.teachers[0].save()
+        user, _ = self.auth.authenticate(request)
+        self.assertEqual(user.teacher_profile.specialization, 'Compilers')
+
+    def test_password_change_revokes_token(self):
+        request = self.request_for(self.student_user)
+        self.student_user.set_password('changed')
+        self.student_user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate(request)
+
+    def test_unauthenticated_requests_get_a_bearer_challenge(self):
+        url = reverse('api:class-enroll', args=[self.classes[0].pk])
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer not-a-token'}):
+            response = self.client.post(url, **headers)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_enroll_with_bearer_token(self):
+        response = self.client.post(
+            reverse('api:class-enroll', args=[self.classes[0].pk]),
+            HTTP_AUTHORIZATION=f'Bearer {issue_token(self.student_users[3])}'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
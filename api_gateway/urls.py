@@ -14,4 +14,6 @@ urlpatterns = [
     path('', include(router.urls)),
     # Additional custom endpoints
     path('my-classes/', views.MyClassesView.as_view(), name='my_classes'),
+    path('auth/token/', views.ObtainTokenView.as_view(), name='token'),
+    path('autocomplete/', views.AutocompleteView.as_view(), name='autocomplete'),
 ]
\ No newline at end of file
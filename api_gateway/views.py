@@ -2,35 +2,91 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
+from django.conf import settings
+from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Prefetch
 
 from core.models import Class, Subject
+from core.autocomplete import DEFAULT_LIMIT, MAX_LIMIT, autocomplete_index
+from core.search import search_classes
 from accounts.models import Student, Teacher
+from backend_service import feed
 from backend_service.services import EnrollmentService, ClassService
+from .authentication import issue_token
+from .encoders import CLASS_LIST_ENCODER, STUDENT_ENCODER, TEACHER_ENCODER
 
 
 # Serializers
 from rest_framework import serializers
 
-class SubjectSerializer(serializers.ModelSerializer):
+
+def parse_field_list(value):
+    """Split a comma-separated query parameter into a set (None when absent)"""
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin for ?fields= and ?expand= support.
+
+    `fields` keeps only the listed top-level fields. `expand` lists the
+    relations rendered as nested objects: relations in `collapsible_fields`
+    fall back to primary keys when not expanded, and relations in
+    `expandable_fields` are only present when expanded. When `expand` is
+    None the serializer keeps its default shape.
+    """
+    collapsible_fields = {}
+    expandable_fields = {}
+    
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        if expand is not None:
+            for name, collapsed in self.collapsible_fields.items():
+                if name not in expand and name in self.fields:
+                    self.fields[name] = collapsed()
+            for name, expanded in self.expandable_fields.items():
+                if name in expand:
+                    self.fields[name] = expanded()
+        
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SubjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Subject
         fields = ['id', 'code', 'name', 'description', 'credits', 'class_count']
     
+    expandable_fields = {
+        'classes': lambda: ClassListSerializer(many=True, read_only=True),
+    }
+    
     def get_class_count(self, obj):
+        if hasattr(obj, 'class_count'):
+            return obj.class_count
         return obj.classes.count()
 
 
-class TeacherSerializer(serializers.ModelSerializer):
+class TeacherSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     full_name = serializers.CharField(read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
     
     class Meta:
         model = Teacher
         fields = ['id', 'employee_id', 'full_name', 'specialization', 'email']
+    
+    expandable_fields = {
+        'classes': lambda: ClassListSerializer(many=True, read_only=True),
+    }
 
 
 class StudentSerializer(serializers.ModelSerializer):
@@ -42,7 +98,7 @@ class StudentSerializer(serializers.ModelSerializer):
         fields = ['id', 'enrollment_number', 'full_name', 'email']
 
 
-class ClassListSerializer(serializers.ModelSerializer):
+class ClassListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     subject_code = serializers.CharField(source='subject.code', read_only=True)
     subject_name = serializers.CharField(source='subject.name', read_only=True)
     teacher_name = serializers.CharField(source='teacher.full_name', read_only=True)
@@ -59,7 +115,7 @@ class ClassListSerializer(serializers.ModelSerializer):
         ]
 
 
-class ClassDetailSerializer(serializers.ModelSerializer):
+class ClassDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     subject = SubjectSerializer(read_only=True)
     teacher = TeacherSerializer(read_only=True)
     students = StudentSerializer(many=True, read_only=True)
@@ -73,36 +129,210 @@ class ClassDetailSerializer(serializers.ModelSerializer):
             'semester', 'max_students', 'enrolled_count', 'available_seats',
             'is_active', 'created_at'
         ]
+    
+    collapsible_fields = {
+        'subject': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        'teacher': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        'students': lambda: serializers.PrimaryKeyRelatedField(many=True, read_only=True),
+    }
+
+
+# Columns each serializer field reads, used to prune querysets to ?fields=
+CLASS_FIELD_COLUMNS = {
+    'subject_code': ['subject__code'],
+    'subject_name': ['subject__name'],
+    'teacher_name': ['teacher__user__first_name', 'teacher__user__last_name',
+                     'teacher__user__username'],
+    'available_seats': ['max_students'],
+    'is_full': ['max_students'],
+}
+TEACHER_USER_COLUMNS = ['teacher__user__first_name', 'teacher__user__last_name',
+                        'teacher__user__username', 'teacher__user__email']
+CLASS_COUNT_FIELDS = {'enrolled_count', 'available_seats', 'is_full'}
+
+
+class SparseFieldsViewMixin:
+    """
+    ViewSet mixin that reads ?fields= and ?expand= and hands them to the
+    serializer, so querysets can be pruned to what will actually be rendered
+    """
+    
+    @property
+    def requested_fields(self):
+        return parse_field_list(self.request.query_params.get('fields'))
+    
+    @property
+    def requested_expand(self):
+        return parse_field_list(self.request.query_params.get('expand'))
+    
+    def wants(self, name):
+        fields = self.requested_fields
+        return fields is None or name in fields
+    
+    def expands(self, name, default=False):
+        expand = self.requested_expand
+        if expand is None:
+            return default
+        return name in expand
+    
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields)
+        kwargs.setdefault('expand', self.requested_expand)
+        return super().get_serializer(*args, **kwargs)
+
+
+class EncodedListMixin:
+    """
+    ViewSet mixin that renders `list` through a precompiled RowEncoder
+    instead of the serializer; both produce the same data
+    """
+    row_encoder = None
+    
+    def can_encode(self):
+        return True
+    
+    def list(self, request, *args, **kwargs):
+        if self.row_encoder is None or not self.can_encode():
+            return super().list(request, *args, **kwargs)
+        
+        fields = getattr(self, 'requested_fields', None)
+        rows = self.row_encoder.rows(self.filter_queryset(self.get_queryset()), fields)
+        
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.row_encoder.encode(page, fields))
+        return Response(self.row_encoder.encode(rows, fields))
 
 
 # ViewSets (keep the same as before)
-class ClassViewSet(viewsets.ModelViewSet):
+class ClassViewSet(EncodedListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for classes
+    
+    Supports ?fields=a,b to select top-level fields and, on retrieve,
+    ?expand=subject,teacher,students to choose which relations are nested
+    (the others are rendered as primary keys). ?search= filters through
+    the full-text index (core.search), best match first.
     """
     permission_classes = [IsAuthenticatedOrReadOnly]
+    row_encoder = CLASS_LIST_ENCODER
     
     def get_queryset(self):
-        queryset = Class.objects.filter(is_active=True).select_related(
-            'subject', 'teacher', 'teacher__user'
-        ).prefetch_related('students')
+        queryset = Class.objects.all()
         
         semester = self.request.query_params.get('semester')
-        if semester:
+        if semester and self.action == 'list':
+            # Archived semesters are listed from the archive tables
+            queryset = Class.objects.for_semester(semester)
+        elif semester:
             queryset = queryset.filter(semester=semester)
+        queryset = queryset.filter(is_active=True)
+        
+        search = self.request.query_params.get('search')
+        if search:
+            queryset = search_classes(queryset, search)
+        
+        if self.action == 'retrieve':
+            return self._prune_detail_queryset(queryset)
+        if self.action == 'list':
+            return self._prune_list_queryset(queryset)
+        
+        return queryset.select_related(
+            'subject', 'teacher', 'teacher__user'
+        ).prefetch_related('students')
+    
+    def _prune_list_queryset(self, queryset):
+        fields = self.requested_fields
+        if fields is None:
+            return queryset.with_stats().select_related(
+                'subject', 'teacher', 'teacher__user'
+            )
+        
+        columns = self._only_columns(fields)
+        related = []
+        if {'subject_code', 'subject_name'} & fields:
+            related.append('subject')
+        if 'teacher_name' in fields:
+            related += ['teacher', 'teacher__user']
+        
+        queryset = queryset.select_related(*related).only(*columns)
+        if CLASS_COUNT_FIELDS & fields:
+            queryset = queryset.with_stats()
+        return queryset
+    
+    def _prune_detail_queryset(self, queryset):
+        fields = self.requested_fields
+        
+        related = []
+        columns = self._only_columns(fields or ())
+        for name, lookups, nested_columns in (
+            ('subject', ['subject'], self._nested_columns('subject', Subject)),
+            ('teacher', ['teacher', 'teacher__user'],
+             self._nested_columns('teacher', Teacher) + TEACHER_USER_COLUMNS),
+        ):
+            if not self.wants(name):
+                continue
+            if self.expands(name, default=True):
+                related += lookups
+                columns.update(nested_columns)
+            else:
+                columns.add(name)
+        
+        queryset = queryset.select_related(*related)
+        if fields is not None:
+            queryset = queryset.only(*columns)
+        
+        if self.wants('students'):
+            # The prefetched roster also answers the seat counts
+            if self.expands('students', default=True):
+                roster = Student.objects.select_related('user')
+            else:
+                roster = Student.objects.only('id')
+            queryset = queryset.prefetch_related(Prefetch('students', queryset=roster))
+        elif CLASS_COUNT_FIELDS & fields:
+            queryset = queryset.with_stats()
         
         return queryset
     
+    @staticmethod
+    def _only_columns(fields):
+        """Map requested serializer fields to the Class columns they read"""
+        concrete = {f.name for f in Class._meta.concrete_fields}
+        columns = {'id'}
+        for name in fields:
+            if name in CLASS_FIELD_COLUMNS:
+                columns.update(CLASS_FIELD_COLUMNS[name])
+            elif name in concrete:
+                columns.add(name)
+        return columns
+    
+    @staticmethod
+    def _nested_columns(prefix, model):
+        return [f'{prefix}__{f.name}' for f in model._meta.concrete_fields]
+    
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ClassDetailSerializer
         return ClassListSerializer
     
+    def perform_update(self, serializer):
+        # Edits and deletes are recorded for the gRPC read model, as
+        # ClassService records creations
+        with transaction.atomic():
+            feed.record_class(serializer.save())
+    
+    def perform_destroy(self, instance):
+        class_id = instance.pk
+        with transaction.atomic():
+            instance.delete()
+            feed.record_class_deleted(class_id)
+    
     def create(self, request):
         result = ClassService.create_class(request.data)
         
         if result['success']:
-            class_obj = Class.objects.get(id=result['class_id'])
+            # Loaded as retrieve() loads it, rather than a query per relation
+            class_obj = self._prune_detail_queryset(Class.objects.all()).get(id=result['class_id'])
             serializer = ClassDetailSerializer(class_obj)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
@@ -113,14 +343,13 @@ class ClassViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def enroll(self, request, pk=None):
-        if not hasattr(request.user, 'student_profile'):
+        if not request.role.is_student:
             return Response(
                 {'error': 'Only students can enroll'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        student_id = request.user.student_profile.id
-        result = EnrollmentService.enroll_student(pk, student_id)
+        result = EnrollmentService.enroll_student(pk, request.role.student_id)
         
         if result['success']:
             return Response(result, status=status.HTTP_200_OK)
@@ -129,14 +358,13 @@ class ClassViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def unenroll(self, request, pk=None):
-        if not hasattr(request.user, 'student_profile'):
+        if not request.role.is_student:
             return Response(
                 {'error': 'Only students can unenroll'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        student_id = request.user.student_profile.id
-        result = EnrollmentService.unenroll_student(pk, student_id)
+        result = EnrollmentService.unenroll_student(pk, request.role.student_id)
         
         if result['success']:
             return Response(result, status=status.HTTP_200_OK)
@@ -144,37 +372,89 @@ class ClassViewSet(viewsets.ModelViewSet):
             return Response(result, status=status.HTTP_400_BAD_REQUEST)
 
 
-class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Subject.objects.all().order_by('code')
+def class_summary_prefetch(lookup):
+    """Prefetch for relations expanded into ClassListSerializer rows"""
+    return Prefetch(lookup, queryset=Class.objects.with_stats().select_related(
+        'subject', 'teacher', 'teacher__user'
+    ))
+
+
+class SubjectViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for subjects (?fields= and ?expand=classes)
+    """
     serializer_class = SubjectSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    
+    def get_queryset(self):
+        queryset = Subject.objects.all().order_by('code')
+        
+        fields = self.requested_fields
+        if fields is not None:
+            columns = {'id'} | (fields & {f.name for f in Subject._meta.concrete_fields})
+            queryset = queryset.only(*columns)
+        
+        if self.wants('class_count'):
+            queryset = queryset.with_stats()
+        if self.wants('classes') and self.expands('classes'):
+            queryset = queryset.prefetch_related(class_summary_prefetch('classes'))
+        
+        return queryset
 
 
-class StudentViewSet(viewsets.ReadOnlyModelViewSet):
+class StudentViewSet(EncodedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Student.objects.select_related('user').all()
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated]
+    row_encoder = STUDENT_ENCODER
 
 
-class TeacherViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Teacher.objects.select_related('user').all()
+class TeacherViewSet(EncodedListMixin, SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for teachers (?fields= and ?expand=classes)
+    """
     serializer_class = TeacherSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    row_encoder = TEACHER_ENCODER
+    
+    def can_encode(self):
+        # Embedded class summaries still go through the serializer
+        return not self.expands('classes')
+    
+    def get_queryset(self):
+        # The default ordering sorts on user names, so the join stays
+        queryset = Teacher.objects.select_related('user')
+        
+        fields = self.requested_fields
+        if fields is not None:
+            columns = {'id', 'user'} | (fields & {f.name for f in Teacher._meta.concrete_fields})
+            if {'full_name', 'email'} & fields:
+                columns.update(['user__first_name', 'user__last_name', 'user__username'])
+            if 'email' in fields:
+                columns.add('user__email')
+            queryset = queryset.only(*columns)
+        
+        if self.wants('classes') and self.expands('classes'):
+            queryset = queryset.prefetch_related(class_summary_prefetch('classes'))
+        
+        return queryset
 
 
 class MyClassesView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        if hasattr(request.user, 'student_profile'):
-            classes = request.user.student_profile.enrolled_classes.filter(is_active=True)
+        if request.role.is_student:
+            classes = Class.objects.for_student(request.role.student_id).filter(is_active=True).with_stats()
+            classes = classes.select_related('subject', 'teacher', 'teacher__user')
             serializer = ClassListSerializer(classes, many=True)
             return Response({
                 'user_type': 'student',
                 'classes': serializer.data
             })
-        elif hasattr(request.user, 'teacher_profile'):
-            classes = request.user.teacher_profile.classes.filter(is_active=True)
+        elif request.role.is_teacher:
+            classes = Class.objects.for_teacher(request.role.teacher_id).filter(is_active=True).with_stats()
+            classes = classes.select_related('subject', 'teacher', 'teacher__user')
             serializer = ClassListSerializer(classes, many=True)
             return Response({
                 'user_type': 'teacher',
@@ -184,4 +464,55 @@ class MyClassesView(APIView):
             return Response(
                 {'error': 'User has no student or teacher profile'},
                 status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+            )
+
+
+class ObtainTokenView(APIView):
+    """
+    Exchange username/password for a bearer token
+    (see api_gateway.authentication.BearerTokenAuthentication)
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    def post(self, request):
+        user = authenticate(
+            request,
+            username=request.data.get('username'),
+            password=request.data.get('password')
+        )
+        if user is None:
+            return Response(
+                {'error': 'Invalid credentials'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'token': issue_token(user),
+            'expires_in': getattr(settings, 'API_TOKEN_MAX_AGE', 24 * 60 * 60),
+        })
+
+
+class AutocompleteView(APIView):
+    """
+    Subject and teacher suggestions for the class search box:
+    GET /api/autocomplete/?q=cs2&limit=10
+
+    Served from the in-memory trie in core.autocomplete, without queries
+    once the trie is built.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        limit = max(1, min(limit, MAX_LIMIT))
+        
+        return Response({
+            'query': query,
+            'results': autocomplete_index.complete(query, limit),
+        })
@@ -0,0 +1,104 @@
+"""
+The write side of the catalog change feed (backend_service.models.CatalogChange).
+
+EnrollmentService, ClassService and the class edit and delete views call
+these inside the transaction of their write, so an entry exists exactly
+when the change it describes committed. Each payload is the denormalized
+record the gRPC read model stores: a saved class carries its subject and
+teacher, an enrollment the student's details.
+
+The writers also keep the table bounded, whether or not a gRPC server
+follows it: at most every PRUNE_INTERVAL seconds per process, once a
+write commits, a background thread deletes the entries older than
+CATALOG_FEED_RETENTION, so no request waits on it.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import CatalogChange
+
+logger = logging.getLogger('backend_service')
+
+PRUNE_INTERVAL = 60
+
+_prune_lock = threading.Lock()
+_pruned_at = time.monotonic()
+
+
+def prune(using='default'):
+    """Delete the entries older than CATALOG_FEED_RETENTION; returns how many"""
+    cutoff = timezone.now() - timedelta(seconds=settings.CATALOG_FEED_RETENTION)
+    return CatalogChange.objects.using(using).filter(created_at__lt=cutoff).delete()[0]
+
+
+def _prune_in_background(using):
+    def run():
+        try:
+            prune(using)
+        except Exception:
+            logger.exception('Catalog feed: pruning failed')
+        finally:
+            # The thread's own connection
+            connections.close_all()
+
+    threading.Thread(target=run, name='catalog-feed-prune', daemon=True).start()
+
+
+def _record(kind, payload, using):
+    global _pruned_at
+    CatalogChange.objects.using(using).create(kind=kind, payload=payload)
+    now = time.monotonic()
+    with _prune_lock:
+        due = now - _pruned_at >= PRUNE_INTERVAL
+        if due:
+            _pruned_at = now
+    if due:
+        transaction.on_commit(lambda: _prune_in_background(using), using=using)
+
+
+def subject_payload(subject):
+    return {'id': subject.pk, 'code': subject.code, 'name': subject.name,
+            'description': subject.description, 'credits': subject.credits}
+
+
+def teacher_payload(teacher):
+    return {'id': teacher.pk, 'employee_id': teacher.employee_id,
+            'full_name': teacher.full_name, 'specialization': teacher.specialization,
+            'email': teacher.user.email}
+
+
+def student_payload(student):
+    user = student.user
+    return {'id': student.pk, 'enrollment_number': student.enrollment_number,
+            'first_name': user.first_name, 'last_name': user.last_name,
+            'full_name': student.full_name, 'email': user.email}
+
+
+def class_payload(class_obj):
+    return {
+        'id': class_obj.pk, 'subject': subject_payload(class_obj.subject),
+        'teacher': teacher_payload(class_obj.teacher), 'schedule': class_obj.schedule,
+        'room': class_obj.room, 'semester': class_obj.semester,
+        'max_students': class_obj.max_students, 'is_active': class_obj.is_active,
+    }
+
+
+def record_class(class_obj, using='default'):
+    """A class was created or edited; it should have subject and teacher__user loaded"""
+    _record(CatalogChange.CLASS, class_payload(class_obj), using)
+
+
+def record_class_deleted(class_id, using='default'):
+    _record(CatalogChange.CLASS_DELETED, {'id': class_id}, using)
+
+
+def record_enrollment(class_id, student, enrolled=True, using='default'):
+    """`student` (with its user loaded) joined or left class `class_id`"""
+    _record(CatalogChange.ENROLL if enrolled else CatalogChange.UNENROLL,
+            {'class_id': class_id, 'student': student_payload(student)}, using)
@@ -83,10 +83,12 @@ def create_class_grpc(subject_id, teacher_id, schedule, room, semester, max_stud
         }
 
 
-def get_class_grpc(class_id):
-    """Get class details via gRPC"""
+def get_class_grpc(class_id, fields=None):
+    """Get class details via gRPC, optionally limited to the given fields"""
     with GRPCClient() as stub:
         request = classes_pb2.GetClassRequest(class_id=class_id)
+        if fields:
+            request.field_mask.paths.extend(fields)
         response = stub.GetClass(request)
         return response
 
@@ -14,12 +14,132 @@ django.setup()
 # Import generated gRPC code
 from backend_service import classes_pb2, classes_pb2_grpc
 from backend_service.services import EnrollmentService, ClassService
+from backend_service.interceptors import DatabaseRoutingInterceptor, QueryBudgetInterceptor
+from backend_service.read_model import read_model
+from core.bus import bus
 from core.models import Class, Subject
+from core.refdata import reference_data
+from core.shared_catalog import shared_catalog
 from accounts.models import Teacher, Student
 
 
+def _class_summary(c):
+    """ClassSummary of a Class from with_stats() or a read model ClassRecord"""
+    return classes_pb2.ClassSummary(
+        id=c.id,
+        subject_code=c.subject.code,
+        subject_name=c.subject.name,
+        teacher_name=c.teacher.full_name,
+        schedule=c.schedule,
+        room=c.room or '',
+        semester=c.semester,
+        max_students=c.max_students,
+        enrolled_count=c.enrolled_count,
+        available_seats=c.available_seats,
+        is_full=c.is_full,
+        is_active=c.is_active
+    )
+
+
+def _entry_summary(entry):
+    """ClassSummary of a core.shared_catalog ClassEntry (always an active class)"""
+    return classes_pb2.ClassSummary(
+        id=entry.id,
+        subject_code=entry.subject_code,
+        subject_name=entry.subject_name,
+        teacher_name=entry.teacher_name,
+        schedule=entry.schedule,
+        room=entry.room,
+        semester=entry.semester,
+        max_students=entry.max_students,
+        enrolled_count=entry.enrolled_count,
+        available_seats=entry.max_students - entry.enrolled_count,
+        is_full=entry.enrolled_count >= entry.max_students,
+        is_active=True
+    )
+
+
+def _shared_catalog(semester):
+    """
+    The shared catalog file (CATALOG_FILE), if it can list the active
+    classes of `semester`: archived semesters are only in the archive tables
+    """
+    catalog = shared_catalog.get()
+    if catalog is not None and semester:
+        info = reference_data.semester(semester)
+        if info is not None and info.is_archived:
+            return None
+    return catalog
+
+
+def _by_class_ordering(entries):
+    """ClassEntry `entries` in Class's Meta.ordering: semester descending, subject code, pk"""
+    entries = sorted(entries, key=lambda e: (e.subject_code, e.id))
+    return sorted(entries, key=lambda e: e.semester, reverse=True)
+
+
+def _class_detail(class_obj, wanted, teacher_email, students):
+    """
+    ClassDetailResponse with the fields `wanted` of a Class or a read model
+    ClassRecord; `teacher_email` and `students` (of (student, email)
+    pairs) are callables, only called when their field is wanted
+    """
+    scalars = {
+        'schedule': lambda: class_obj.schedule,
+        'room': lambda: class_obj.room or '',
+        'semester': lambda: class_obj.semester,
+        'max_students': lambda: class_obj.max_students,
+        'enrolled_count': lambda: class_obj.enrolled_count,
+        'available_seats': lambda: class_obj.available_seats,
+        'is_active': lambda: class_obj.is_active,
+    }
+    response = classes_pb2.ClassDetailResponse(
+        id=class_obj.id,
+        **{name: value() for name, value in scalars.items() if wanted(name)}
+    )
+    
+    if wanted('subject'):
+        response.subject.CopyFrom(classes_pb2.SubjectInfo(
+            id=class_obj.subject.id,
+            code=class_obj.subject.code,
+            name=class_obj.subject.name,
+            description=class_obj.subject.description,
+            credits=class_obj.subject.credits
+        ))
+    
+    if wanted('teacher'):
+        response.teacher.CopyFrom(classes_pb2.TeacherInfo(
+            id=class_obj.teacher.id,
+            employee_id=class_obj.teacher.employee_id,
+            full_name=class_obj.teacher.full_name,
+            specialization=class_obj.teacher.specialization,
+            email=teacher_email()
+        ))
+    
+    if wanted('students'):
+        response.students.extend(
+            classes_pb2.StudentInfo(
+                id=student.id,
+                enrollment_number=student.enrollment_number,
+                full_name=student.full_name,
+                email=email
+            )
+            for student, email in students()
+        )
+    
+    return response
+
+
 class ClassServiceServicer(classes_pb2_grpc.ClassServiceServicer):
-    """Implementation of ClassService gRPC service"""
+    """
+    Implementation of ClassService gRPC service.
+
+    The read RPCs are served from backend_service.read_model while it is
+    fresh, and from the ORM otherwise. With CATALOG_FILE set, the active
+    class listings (ListClasses with active_only, GetTeacherClasses) come
+    from the catalog file the worker processes share (core.shared_catalog)
+    first.
+    """
     
     def EnrollStudent(self, request, context):
         """Enroll a student in a class"""
@@ -73,147 +193,115 @@ class ClassServiceServicer(classes_pb2_grpc.ClassServiceServicer):
         """Get detailed information about a class"""
         print(f"[gRPC] GetClass called: class_id={request.class_id}")
         
-        try:
-            class_obj = Class.objects.select_related('subject', 'teacher', 'teacher__user').prefetch_related('students', 'students__user').get(id=request.class_id)
-            
-            # Build response
-            subject_info = classes_pb2.SubjectInfo(
-                id=class_obj.subject.id,
-                code=class_obj.subject.code,
-                name=class_obj.subject.name,
-                description=class_obj.subject.description,
-                credits=class_obj.subject.credits
+        # An empty field mask keeps the full response
+        paths = set(request.field_mask.paths) if request.HasField('field_mask') else set()
+        wanted = lambda name: not paths or name in paths
+        
+        if read_model.is_fresh():
+            record = read_model.get_class(request.class_id)
+            if record is None:
+                return self._class_not_found(request, context)
+            return _class_detail(
+                record, wanted, lambda: record.teacher.email,
+                lambda: [(student, student.email) for student in read_model.roster(record.id)],
             )
+        
+        try:
+            queryset = Class.objects.all()
+            related = []
+            if wanted('subject'):
+                related.append('subject')
+            if wanted('teacher'):
+                related += ['teacher', 'teacher__user']
+            queryset = queryset.select_related(*related)
             
-            teacher_info = classes_pb2.TeacherInfo(
-                id=class_obj.teacher.id,
-                employee_id=class_obj.teacher.employee_id,
-                full_name=class_obj.teacher.full_name,
-                specialization=class_obj.teacher.specialization,
-                email=class_obj.teacher.user.email
-            )
+            if wanted('students'):
+                queryset = queryset.prefetch_related('students', 'students__user')
+            elif paths & {'enrolled_count', 'available_seats'}:
+                queryset = queryset.with_stats()
             
-            students_info = [
-                classes_pb2.StudentInfo(
-                    id=student.id,
-                    enrollment_number=student.enrollment_number,
-                    full_name=student.full_name,
-                    email=student.user.email
-                )
-                for student in class_obj.students.all()
-            ]
+            class_obj = queryset.get(id=request.class_id)
             
-            return classes_pb2.ClassDetailResponse(
-                id=class_obj.id,
-                subject=subject_info,
-                teacher=teacher_info,
-                students=students_info,
-                schedule=class_obj.schedule,
-                room=class_obj.room or '',
-                semester=class_obj.semester,
-                max_students=class_obj.max_students,
-                enrolled_count=class_obj.enrolled_count,
-                available_seats=class_obj.available_seats,
-                is_active=class_obj.is_active
+            return _class_detail(
+                class_obj, wanted, lambda: class_obj.teacher.user.email,
+                lambda: [(student, student.user.email) for student in class_obj.students.all()],
             )
             
         except Class.DoesNotExist:
-            context.set_code(grpc.StatusCode.NOT_FOUND)
-            context.set_details(f'Class with id {request.class_id} not found')
-            return classes_pb2.ClassDetailResponse()
+            return self._class_not_found(request, context)
+    
+    def _class_not_found(self, request, context):
+        context.set_code(grpc.StatusCode.NOT_FOUND)
+        context.set_details(f'Class with id {request.class_id} not found')
+        return classes_pb2.ClassDetailResponse()
     
     def ListClasses(self, request, context):
         """List all classes with optional filtering"""
         print(f"[gRPC] ListClasses called: semester={request.semester}, active_only={request.active_only}")
         
-        classes = Class.objects.select_related('subject', 'teacher', 'teacher__user').prefetch_related('students')
-        
-        if request.active_only:
-            classes = classes.filter(is_active=True)
-        
-        if request.semester:
-            classes = classes.filter(semester=request.semester)
-        
-        class_summaries = [
-            classes_pb2.ClassSummary(
-                id=c.id,
-                subject_code=c.subject.code,
-                subject_name=c.subject.name,
-                teacher_name=c.teacher.full_name,
-                schedule=c.schedule,
-                room=c.room or '',
-                semester=c.semester,
-                max_students=c.max_students,
-                enrolled_count=c.enrolled_count,
-                available_seats=c.available_seats,
-                is_full=c.is_full,
-                is_active=c.is_active
-            )
-            for c in classes
-        ]
+        catalog = _shared_catalog(request.semester) if request.active_only else None
+        if catalog is not None:
+            entries = _by_class_ordering(catalog.classes(semester=request.semester or None))
+            return classes_pb2.ListClassesResponse(classes=[_entry_summary(e) for e in entries])
+        
+        if read_model.is_fresh() and read_model.serves_semester(request.semester):
+            classes = read_model.list_classes(request.semester, request.active_only)
+        else:
+            # Archived semesters are listed from the archive tables
+            classes = Class.objects.for_semester(request.semester) if request.semester else Class.objects.all()
+            classes = classes.with_stats().select_related('subject', 'teacher', 'teacher__user')
+            
+            if request.active_only:
+                classes = classes.filter(is_active=True)
         
-        return classes_pb2.ListClassesResponse(classes=class_summaries)
+        return classes_pb2.ListClassesResponse(classes=[_class_summary(c) for c in classes])
     
     def GetTeacherClasses(self, request, context):
         """Get all classes for a specific teacher"""
         print(f"[gRPC] GetTeacherClasses called: teacher_id={request.teacher_id}")
         
-        classes = ClassService.get_teacher_classes(request.teacher_id, request.semester or None)
-        
-        class_summaries = [
-            classes_pb2.ClassSummary(
-                id=c.id,
-                subject_code=c.subject.code,
-                subject_name=c.subject.name,
-                teacher_name=c.teacher.full_name,
-                schedule=c.schedule,
-                room=c.room or '',
-                semester=c.semester,
-                max_students=c.max_students,
-                enrolled_count=c.enrolled_count,
-                available_seats=c.available_seats,
-                is_full=c.is_full,
-                is_active=c.is_active
-            )
-            for c in classes
-        ]
+        catalog = _shared_catalog(request.semester)
+        if catalog is not None:
+            entries = _by_class_ordering(catalog.classes(semester=request.semester or None,
+                                                         teacher_id=request.teacher_id))
+            return classes_pb2.ListClassesResponse(classes=[_entry_summary(e) for e in entries])
+        
+        if read_model.is_fresh() and read_model.serves_semester(request.semester):
+            classes = read_model.teacher_classes(request.teacher_id, request.semester or None)
+        else:
+            classes = ClassService.get_teacher_classes(request.teacher_id, request.semester or None)
         
-        return classes_pb2.ListClassesResponse(classes=class_summaries)
+        return classes_pb2.ListClassesResponse(classes=[_class_summary(c) for c in classes])
     
     def GetStudentClasses(self, request, context):
         """Get all classes for a specific student"""
         print(f"[gRPC] GetStudentClasses called: student_id={request.student_id}")
         
-        classes = ClassService.get_student_classes(request.student_id, request.semester or None)
-        
-        class_summaries = [
-            classes_pb2.ClassSummary(
-                id=c.id,
-                subject_code=c.subject.code,
-                subject_name=c.subject.name,
-                teacher_name=c.teacher.full_name,
-                schedule=c.schedule,
-                room=c.room or '',
-                semester=c.semester,
-                max_students=c.max_students,
-                enrolled_count=c.enrolled_count,
-                available_seats=c.available_seats,
-                is_full=c.is_full,
-                is_active=c.is_active
-            )
-            for c in classes
-        ]
+        if read_model.is_fresh() and read_model.serves_semester(request.semester):
+            classes = read_model.student_classes(request.student_id, request.semester or None)
+        else:
+            classes = ClassService.get_student_classes(request.student_id, request.semester or None)
         
-        return classes_pb2.ListClassesResponse(classes=class_summaries)
+        return classes_pb2.ListClassesResponse(classes=[_class_summary(c) for c in classes])
 
 
 def serve():
     """Start gRPC server"""
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        interceptors=[DatabaseRoutingInterceptor(), QueryBudgetInterceptor()]
+    )
     classes_pb2_grpc.add_ClassServiceServicer_to_server(
         ClassServiceServicer(), server
     )
     server.add_insecure_port('[::]:50051')
+    # Reads are served from memory once the catalog is loaded
+    read_model.start()
+    # The active class listings, from the file the workers share
+    shared_catalog.ensure()
+    print(f"[gRPC Server] Read model loaded: {read_model.stats()['classes']} classes")
+    # Writes made by the web processes, when INVALIDATION_BUS is set
+    bus.start()
     print('[gRPC Server] Starting on port 50051...')
     server.start()
     print('[gRPC Server] Ready to accept connections')
@@ -0,0 +1,59 @@
+import grpc
+
+from core.query_budget import check_budget, ignore_frames_from, record_queries
+from core.routers import routing_scope
+
+ignore_frames_from(__file__)
+
+
+class QueryBudgetInterceptor(grpc.ServerInterceptor):
+    """
+    gRPC counterpart of core.middleware.QueryBudgetMiddleware.
+
+    Budgets are looked up as 'grpc:<Method>', e.g. 'grpc:ListClasses'.
+    """
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+
+        view_name = 'grpc:' + handler_call_details.method.rsplit('/', 1)[-1]
+        behavior = handler.unary_unary
+
+        def counted(request, context):
+            with record_queries() as recorder:
+                response = behavior(request, context)
+            check_budget(view_name, recorder)
+            return response
+
+        return grpc.unary_unary_rpc_method_handler(
+            counted,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+
+class DatabaseRoutingInterceptor(grpc.ServerInterceptor):
+    """
+    Runs each call in its own core.routers.routing_scope(), so a call that
+    writes reads its own writes from the primary without pinning the
+    next call served by the same pool thread.
+    """
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+
+        behavior = handler.unary_unary
+
+        def scoped(request, context):
+            with routing_scope():
+                return behavior(request, context)
+
+        return grpc.unary_unary_rpc_method_handler(
+            scoped,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
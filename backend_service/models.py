@@ -1,3 +1,30 @@
 from django.db import models
 
-# Create your models here.
+
+class CatalogChange(models.Model):
+    """
+    One entry of the change feed the gRPC read model
+    (backend_service.read_model) follows. backend_service.feed writes it
+    in the transaction of the change it describes; the payload carries
+    everything the read model needs, so applying it takes no queries.
+    """
+    CLASS = 'class'
+    CLASS_DELETED = 'class_del'
+    ENROLL = 'enroll'
+    UNENROLL = 'unenroll'
+    KIND_CHOICES = [
+        (CLASS, 'Class saved'),
+        (CLASS_DELETED, 'Class deleted'),
+        (ENROLL, 'Student enrolled'),
+        (UNENROLL, 'Student unenrolled'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind}"
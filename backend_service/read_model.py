@@ -0,0 +1,452 @@
+"""
+The read side of the gRPC backend: an in-memory, denormalized catalog.
+
+Writes go through EnrollmentService and ClassService as before, and
+those record each change in the catalog change feed
+(backend_service.feed). The gRPC server keeps `read_model` in memory and
+serves the read RPCs from it:
+
+- classes, subjects, teachers and students are __slots__ records keyed by
+  id; classes are also indexed by semester and by teacher, and rosters
+  (by class and by student) are the core.matrix enrollment matrix
+- load() bootstraps it with a handful of bulk queries
+- sync() applies the feed entries written since the last one it saw,
+  straight from their payloads. A background thread calls it every
+  CATALOG_FEED_POLL_INTERVAL seconds
+- check() reloads everything and counts the records that had drifted,
+  every CATALOG_READ_MODEL_CHECK_INTERVAL seconds. It repairs the changes
+  the feed does not carry (admin edits, bulk operations, archival,
+  renames). The writers prune the feed (backend_service.feed)
+
+In a deployment with the invalidation bus (core.bus), invalidate()
+hears of every catalog write in the other processes right after it
+commits: it syncs at once, and re-reads the classes and students that
+changed outside the feed, so admin edits and bulk operations need not
+wait for the next check.
+
+Staleness is bounded: is_fresh() is true only while the last successful
+sync() is under CATALOG_READ_MODEL_MAX_STALENESS seconds old, and the
+servicer falls back to the ORM otherwise. Changes made through the
+services are therefore visible within that bound, and any other change
+within the check interval.
+
+SQLite has a single writer, so feed ids commit in order and reading
+"id > last seen" never skips an entry that commits late; the check
+covers that case on databases with concurrent writers.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from accounts.models import Student, Teacher
+from core.bus import bus
+from core.matrix import enrollment_matrix
+from core.models import Class, Semester, Subject
+from core.shared_catalog import shared_catalog
+from .models import CatalogChange
+
+logger = logging.getLogger('backend_service')
+
+
+class SubjectRecord:
+    __slots__ = ('id', 'code', 'name', 'description', 'credits')
+
+    def __init__(self, id, code, name, description, credits):
+        self.id = id
+        self.code = code
+        self.name = name
+        self.description = description
+        self.credits = credits
+
+
+class TeacherRecord:
+    __slots__ = ('id', 'employee_id', 'full_name', 'specialization', 'email')
+
+    def __init__(self, id, employee_id, full_name, specialization, email):
+        self.id = id
+        self.employee_id = employee_id
+        self.full_name = full_name
+        self.specialization = specialization
+        self.email = email
+
+
+class StudentRecord:
+    __slots__ = ('id', 'enrollment_number', 'first_name', 'last_name', 'full_name', 'email')
+
+    def __init__(self, id, enrollment_number, first_name, last_name, full_name, email):
+        self.id = id
+        self.enrollment_number = enrollment_number
+        self.first_name = first_name
+        self.last_name = last_name
+        self.full_name = full_name
+        self.email = email
+
+    @property
+    def sort_key(self):
+        # Student's Meta.ordering
+        return (self.first_name, self.last_name, self.id)
+
+
+class ClassRecord:
+    """
+    A class with its subject and teacher records. Reads the same as a
+    Class from with_stats(), so ClassSummary is built from either.
+    """
+    __slots__ = ('id', 'subject', 'teacher', 'schedule', 'room', 'semester', 'max_students',
+                 'is_active')
+
+    def __init__(self, id, subject, teacher, schedule, room, semester, max_students, is_active):
+        self.id = id
+        self.subject = subject
+        self.teacher = teacher
+        self.schedule = schedule
+        self.room = room
+        self.semester = semester
+        self.max_students = max_students
+        self.is_active = is_active
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def enrolled_count(self):
+        return enrollment_matrix.roster_size(self.id)
+
+    @property
+    def available_seats(self):
+        return self.max_students - self.enrolled_count
+
+    @property
+    def is_full(self):
+        return self.enrolled_count >= self.max_students
+
+    def state(self):
+        """What a consistency check compares"""
+        return (self.subject.id, self.subject.code, self.subject.name, self.teacher.id,
+                self.teacher.full_name, self.schedule, self.room, self.semester,
+                self.max_students, self.is_active)
+
+
+def _ordered(records):
+    """`records` in Class's Meta.ordering: semester descending, subject code, pk"""
+    records = sorted(records, key=lambda c: (c.subject.code, c.id))
+    return sorted(records, key=lambda c: c.semester, reverse=True)
+
+
+def _full_name(first_name, last_name, username):
+    # User.get_full_name() or the username, as Student/Teacher.full_name
+    return f'{first_name} {last_name}'.strip() or username
+
+
+class CatalogReadModel:
+    """
+    Thread-safe: the records are never changed in place, only replaced,
+    so a reader holding one sees a consistent version of it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._thread = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.classes = {}  # id -> ClassRecord
+            self.subjects = {}  # id -> SubjectRecord
+            self.teachers = {}  # id -> TeacherRecord
+            self.students = {}  # id -> StudentRecord
+            self.by_semester = {}  # semester -> {class ids}
+            self.by_teacher = {}  # teacher id -> {class ids}
+            self.archived = set()  # archived semester codes, read from the archive tables
+            self.cursor = None  # id of the last feed entry applied; None until loaded
+            self.synced_at = None  # time.monotonic() of the last successful sync()
+            self.applied = 0
+            self.checks = 0
+            self.drift = 0
+
+    @property
+    def is_loaded(self):
+        return self.cursor is not None
+
+    def is_fresh(self):
+        synced_at = self.synced_at
+        return (synced_at is not None
+                and time.monotonic() - synced_at <= settings.CATALOG_READ_MODEL_MAX_STALENESS)
+
+    # Loading
+
+    def _read(self):
+        """Every record, from a few bulk queries, as a new CatalogReadModel"""
+        fresh = CatalogReadModel()
+        # Taken first: entries committed while loading are applied again
+        # by the next sync(), which is harmless
+        fresh.cursor = CatalogChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        fresh.archived = set(Semester.objects.archived().values_list('code', flat=True))
+        fresh.subjects = {
+            row[0]: SubjectRecord(*row)
+            for row in Subject.objects.order_by().values_list(
+                'id', 'code', 'name', 'description', 'credits'
+            ).iterator()
+        }
+        fresh.teachers = {
+            pk: TeacherRecord(pk, employee_id, _full_name(first, last, username),
+                              specialization, email)
+            for pk, employee_id, first, last, username, specialization, email in (
+                Teacher.objects.order_by().values_list(
+                    'id', 'employee_id', 'user__first_name', 'user__last_name',
+                    'user__username', 'specialization', 'user__email'
+                ).iterator()
+            )
+        }
+        fresh.students = {
+            pk: StudentRecord(pk, number, first, last, _full_name(first, last, username), email)
+            for pk, number, first, last, username, email in (
+                Student.objects.order_by().values_list(
+                    'id', 'enrollment_number', 'user__first_name', 'user__last_name',
+                    'user__username', 'user__email'
+                ).iterator(chunk_size=10000)
+            )
+        }
+        for pk, subject_id, teacher_id, schedule, room, semester, max_students, is_active in (
+            Class.objects.order_by().values_list(
+                'id', 'subject_id', 'teacher_id', 'schedule', 'room', 'semester',
+                'max_students', 'is_active'
+            ).iterator()
+        ):
+            fresh._add_class(ClassRecord(pk, fresh.subjects[subject_id], fresh.teachers[teacher_id],
+                                         schedule, room, semester, max_students, is_active))
+        return fresh
+
+    def _adopt(self, fresh):
+        with self._lock:
+            for name in ('classes', 'subjects', 'teachers', 'students', 'by_semester',
+                         'by_teacher', 'archived', 'cursor'):
+                setattr(self, name, getattr(fresh, name))
+            self.synced_at = time.monotonic()
+
+    def load(self):
+        """Replace the contents with the current rows"""
+        fresh = self._read()
+        enrollment_matrix.build()
+        self._adopt(fresh)
+
+    def check(self):
+        """
+        Reload from the database and swap the result in; returns how many
+        classes were missing, extra or different (roster size included)
+        """
+        with self._lock:
+            before = {pk: (c.state(), c.enrolled_count) for pk, c in self.classes.items()}
+        fresh = self._read()
+        enrollment_matrix.build()
+        after = {pk: (c.state(), c.enrolled_count) for pk, c in fresh.classes.items()}
+        drift = len(before.keys() ^ after.keys()) + sum(
+            1 for pk in before.keys() & after.keys() if before[pk] != after[pk]
+        )
+        self._adopt(fresh)
+        with self._lock:
+            self.checks += 1
+            self.drift += drift
+        if drift:
+            logger.warning('Catalog read model: %d classes had drifted from the database', drift)
+        # The shared catalog file drifts the same way
+        shared_catalog.changed()
+        return drift
+
+    def sync(self):
+        """Apply the feed entries written since the last one seen; returns how many"""
+        cursor = self.cursor
+        if cursor is None:
+            raise RuntimeError('Catalog read model is not loaded')
+        # Read outside the lock, so lookups go on during the query
+        entries = list(
+            CatalogChange.objects.filter(id__gt=cursor).order_by('id').values_list(
+                'id', 'kind', 'payload'
+            )
+        )
+        applied = 0
+        with self._lock:
+            for pk, kind, payload in entries:
+                # Another sync() may have applied it meanwhile
+                if pk <= self.cursor:
+                    continue
+                self._apply(kind, payload)
+                self.cursor = pk
+                applied += 1
+            self.applied += applied
+            self.synced_at = time.monotonic()
+        return applied
+
+    def refresh(self, class_ids=(), student_ids=()):
+        """Re-read the given classes, with their subject and teacher, and students"""
+        classes = list(Class.objects.filter(pk__in=class_ids).order_by().values_list(
+            'id', 'subject_id', 'subject__code', 'subject__name', 'subject__description',
+            'subject__credits', 'teacher_id', 'teacher__employee_id', 'teacher__user__first_name',
+            'teacher__user__last_name', 'teacher__user__username', 'teacher__specialization',
+            'teacher__user__email', 'schedule', 'room', 'semester', 'max_students', 'is_active'
+        )) if class_ids else []
+        students = list(Student.objects.filter(pk__in=student_ids).order_by().values_list(
+            'id', 'enrollment_number', 'user__first_name', 'user__last_name', 'user__username',
+            'user__email'
+        )) if student_ids else []
+        with self._lock:
+            for (pk, subject_id, code, name, description, credits, teacher_id, employee_id,
+                 first, last, username, specialization, email, *values) in classes:
+                subject = self.subjects[subject_id] = SubjectRecord(
+                    subject_id, code, name, description, credits
+                )
+                teacher = self.teachers[teacher_id] = TeacherRecord(
+                    teacher_id, employee_id, _full_name(first, last, username), specialization,
+                    email
+                )
+                self._remove_class(pk)
+                self._add_class(ClassRecord(pk, subject, teacher, *values))
+            for pk in set(class_ids) - {row[0] for row in classes}:
+                self._remove_class(pk)
+            for pk, number, first, last, username, email in students:
+                self.students[pk] = StudentRecord(pk, number, first, last,
+                                                  _full_name(first, last, username), email)
+            for pk in set(student_ids) - {row[0] for row in students}:
+                self.students.pop(pk, None)
+
+    def invalidate(self, event):
+        """Handler for the core.bus events of the other processes"""
+        if not self.is_loaded:
+            return
+        if event.get('reset'):
+            self.check()
+            return
+        self.sync()
+        if event['model'] == 'student':
+            self.refresh(student_ids=event['pks'])
+        elif event['action'] not in ('enroll', 'unenroll'):
+            # The rosters are the matrix, which core.bus.evict() updates
+            self.refresh(class_ids=event['class_ids'])
+
+    # Changes
+
+    def _add_class(self, record):
+        self.classes[record.id] = record
+        self.by_semester.setdefault(record.semester, set()).add(record.id)
+        self.by_teacher.setdefault(record.teacher.id, set()).add(record.id)
+
+    def _remove_class(self, class_id):
+        record = self.classes.pop(class_id, None)
+        if record is not None:
+            self.by_semester[record.semester].discard(class_id)
+            self.by_teacher[record.teacher.id].discard(class_id)
+        return record
+
+    def _student(self, payload):
+        record = StudentRecord(**payload)
+        self.students[record.id] = record
+        return record
+
+    def _apply(self, kind, payload):
+        if kind == CatalogChange.CLASS:
+            subject = self.subjects[payload['subject']['id']] = SubjectRecord(**payload['subject'])
+            teacher = self.teachers[payload['teacher']['id']] = TeacherRecord(**payload['teacher'])
+            values = {key: value for key, value in payload.items()
+                      if key not in ('subject', 'teacher')}
+            record = ClassRecord(subject=subject, teacher=teacher, **values)
+            self._remove_class(record.id)
+            self._add_class(record)
+            enrollment_matrix.update_class(record)
+        elif kind == CatalogChange.CLASS_DELETED:
+            self._remove_class(payload['id'])
+            enrollment_matrix.remove_class(payload['id'])
+        elif kind in (CatalogChange.ENROLL, CatalogChange.UNENROLL):
+            student = self._student(payload['student'])
+            pairs = [(payload['class_id'], student.id)]
+            if kind == CatalogChange.ENROLL:
+                enrollment_matrix.add(pairs)
+            else:
+                enrollment_matrix.remove(pairs)
+
+    # Reads
+
+    def get_class(self, class_id):
+        """The ClassRecord, or None (also for archived classes)"""
+        return self.classes.get(class_id)
+
+    def roster(self, class_id):
+        """StudentRecords of the class's students, in Student's ordering"""
+        with self._lock:
+            students = [self.students[pk] for pk in enrollment_matrix.roster(class_id)
+                        if pk in self.students]
+        return sorted(students, key=lambda s: s.sort_key)
+
+    def serves_semester(self, semester):
+        """False for archived semesters, which only the archive tables hold"""
+        return not semester or semester not in self.archived
+
+    def list_classes(self, semester=None, active_only=False):
+        with self._lock:
+            if semester:
+                records = [self.classes[pk] for pk in self.by_semester.get(semester, ())]
+            else:
+                records = list(self.classes.values())
+        if active_only:
+            records = [c for c in records if c.is_active]
+        return _ordered(records)
+
+    def teacher_classes(self, teacher_id, semester=None):
+        with self._lock:
+            records = [self.classes[pk] for pk in self.by_teacher.get(teacher_id, ())]
+        return _ordered(c for c in records
+                        if c.is_active and (not semester or c.semester == semester))
+
+    def student_classes(self, student_id, semester=None):
+        with self._lock:
+            records = [self.classes[pk] for pk in enrollment_matrix.student_classes(student_id)
+                       if pk in self.classes]
+        return _ordered(c for c in records
+                        if c.is_active and (not semester or c.semester == semester))
+
+    # Background refresh
+
+    def start(self):
+        """Load, then sync and check on a daemon thread"""
+        self.load()
+        bus.subscribe(self.invalidate)
+        self._thread = threading.Thread(target=self._run, name='catalog-read-model', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        checked = time.monotonic()
+        while True:
+            time.sleep(settings.CATALOG_FEED_POLL_INTERVAL)
+            try:
+                if time.monotonic() - checked >= settings.CATALOG_READ_MODEL_CHECK_INTERVAL:
+                    self.check()
+                    checked = time.monotonic()
+                else:
+                    self.sync()
+            except Exception:
+                # is_fresh() turns false and reads go to the database until
+                # a later round succeeds
+                logger.exception('Catalog read model refresh failed')
+            finally:
+                close_old_connections()
+
+    def stats(self):
+        with self._lock:
+            synced_at = self.synced_at
+            return {
+                'classes': len(self.classes),
+                'subjects': len(self.subjects),
+                'teachers': len(self.teachers),
+                'students': len(self.students),
+                'cursor': self.cursor,
+                'applied': self.applied,
+                'checks': self.checks,
+                'drift': self.drift,
+                'staleness': time.monotonic() - synced_at if synced_at is not None else None,
+            }
+
+
+read_model = CatalogReadModel()
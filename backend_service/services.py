@@ -1,7 +1,8 @@
 from django.db import transaction
 from django.core.exceptions import ValidationError
 from accounts.models import Student, Teacher
-from core.models import Subject, Class
+from core.models import Subject, Class, Semester
+from . import feed
 import logging
 
 logger = logging.getLogger('backend_service')
@@ -19,8 +20,8 @@ class EnrollmentService:
         """
         try:
             # Get class and student with row-level locking
-            class_obj = Class.objects.select_for_update().get(id=class_id)
-            student = Student.objects.get(id=student_id)
+            class_obj = Class.objects.select_for_update().with_stats().get(id=class_id)
+            student = Student.objects.select_related('user').get(id=student_id)
             
             # Business rule: Check if class is active
             if not class_obj.is_active:
@@ -31,7 +32,7 @@ class EnrollmentService:
                 return {'success': False, 'message': 'Class is full'}
             
             # Business rule: Check if already enrolled
-            if student in class_obj.students.all():
+            if class_obj.students.filter(pk=student.pk).exists():
                 return {'success': False, 'message': 'Student already enrolled'}
             
             # Business rule: Check schedule conflicts
@@ -44,8 +45,10 @@ class EnrollmentService:
             
             # Enroll student
             class_obj.students.add(student)
+            feed.record_enrollment(class_obj.id, student)
             
-            logger.info(f"Student {student.enrollment_number} enrolled in {class_obj}")
+            # By id: str(class_obj) would load its subject, teacher and user
+            logger.info(f"Student {student.enrollment_number} enrolled in class {class_obj.id}")
             
             return {
                 'success': True,
@@ -71,14 +74,15 @@ class EnrollmentService:
         """
         try:
             class_obj = Class.objects.select_for_update().get(id=class_id)
-            student = Student.objects.get(id=student_id)
+            student = Student.objects.select_related('user').get(id=student_id)
             
-            if student not in class_obj.students.all():
+            if not class_obj.students.filter(pk=student.pk).exists():
                 return {'success': False, 'message': 'Student not enrolled in this class'}
             
             class_obj.students.remove(student)
+            feed.record_enrollment(class_obj.id, student, enrolled=False)
             
-            logger.info(f"Student {student.enrollment_number} unenrolled from {class_obj}")
+            logger.info(f"Student {student.enrollment_number} unenrolled from class {class_obj.id}")
             
             return {
                 'success': True,
@@ -99,10 +103,10 @@ class EnrollmentService:
         Check if student has schedule conflict
         Returns: Conflicting class or None
         """
-        enrolled_classes = student.enrolled_classes.filter(
+        enrolled_classes = Class.objects.for_student(student).filter(
             semester=new_class.semester,
             is_active=True
-        )
+        ).select_related('subject')
         
         for enrolled_class in enrolled_classes:
             if EnrollmentService._schedules_overlap(
@@ -148,7 +152,11 @@ class ClassService:
             
             # Get related objects
             subject = Subject.objects.get(id=data['subject_id'])
-            teacher = Teacher.objects.get(id=data['teacher_id'])
+            teacher = Teacher.objects.select_related('user').get(id=data['teacher_id'])
+            
+            # Business rule: Classes only go into open semesters
+            if not Semester.objects.open().filter(code=data['semester']).exists():
+                return {'success': False, 'message': f"Semester {data['semester']} is not open"}
             
             # Business rule: Check for duplicate class
             existing = Class.objects.filter(
@@ -171,6 +179,7 @@ class ClassService:
                 max_students=data.get('max_students', 40),
                 is_active=data.get('is_active', True)
             )
+            feed.record_class(new_class)
             
             logger.info(f"Class created: {new_class}")
             
@@ -190,33 +199,19 @@ class ClassService:
     
     @staticmethod
     def get_teacher_classes(teacher_id: int, semester: str = None) -> list:
-        """Get all classes for a teacher"""
-        try:
-            teacher = Teacher.objects.get(id=teacher_id)
-            classes = teacher.classes.filter(is_active=True)
-            
-            if semester:
-                classes = classes.filter(semester=semester)
-            
-            return classes
-            
-        except Teacher.DoesNotExist:
-            return []
+        """Get all classes for a teacher, with seat counts"""
+        classes = Class.objects.for_semester(semester) if semester else Class.objects.all()
+        classes = classes.for_teacher(teacher_id).filter(is_active=True)
+        
+        return classes.with_stats().select_related('subject', 'teacher', 'teacher__user')
     
     @staticmethod
     def get_student_classes(student_id: int, semester: str = None) -> list:
-        """Get all enrolled classes for a student"""
-        try:
-            student = Student.objects.get(id=student_id)
-            classes = student.enrolled_classes.filter(is_active=True)
-            
-            if semester:
-                classes = classes.filter(semester=semester)
-            
-            return classes
-            
-        except Student.DoesNotExist:
-            return []
+        """Get all enrolled classes for a student, with seat counts"""
+        classes = Class.objects.for_semester(semester) if semester else Class.objects.all()
+        classes = classes.for_student(student_id).filter(is_active=True)
+        
+        return classes.with_stats().select_related('subject', 'teacher', 'teacher__user')
 
 
 class SubjectService:
@@ -1,3 +1,169 @@
-from django.test import TestCase
+import contextlib
+import io
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from backend_service import classes_pb2, feed
+from backend_service.grpc_server import ClassServiceServicer
+from backend_service.models import CatalogChange
+from backend_service.read_model import read_model
+from backend_service.services import ClassService, EnrollmentService
+from core.matrix import enrollment_matrix
+from core.models import Class
+from core.shared_catalog import shared_catalog
+from core.tests import CatalogTestData
+
+
+class FakeContext:
+    code = None
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+
+class CatalogReadModelTests(CatalogTestData, TestCase):
+    """backend_service.read_model and the read RPCs served from it"""
+
+    def setUp(self):
+        super().setUp()
+        read_model.load()
+        self.servicer = ClassServiceServicer()
+
+    def tearDown(self):
+        read_model.reset()
+        enrollment_matrix.reset()
+        super().tearDown()
+
+    def call(self, method, request):
+        # The servicer prints a line per call
+        with contextlib.redirect_stdout(io.StringIO()):
+            return getattr(self.servicer, method)(request, FakeContext())
+
+    def reads(self):
+        return [
+            self.call('ListClasses', classes_pb2.ListClassesRequest()),
+            self.call('ListClasses', classes_pb2.ListClassesRequest(semester='2025.1',
+                                                                     active_only=True)),
+            self.call('GetClass', classes_pb2.GetClassRequest(class_id=self.classes[3].pk)),
+            self.call('GetTeacherClasses',
+                      classes_pb2.GetTeacherClassesRequest(teacher_id=self.teachers[0].pk)),
+            self.call('GetStudentClasses', classes_pb2.GetStudentClassesRequest(
+                student_id=self.students[1].pk, semester='2025.1')),
+        ]
+
+    def test_reads_match_the_database_without_queries(self):
+        with self.assertNumQueries(0):
+            from_memory = self.reads()
+        with override_settings(CATALOG_READ_MODEL_MAX_STALENESS=-1):
+            self.assertFalse(read_model.is_fresh())
+            from_database = self.reads()
+        self.assertEqual(from_memory, from_database)
+        self.assertEqual(len(from_memory[2].students), 4)
+
+    def test_feed_carries_service_writes(self):
+        self.assertTrue(EnrollmentService.enroll_student(self.classes[0].pk,
+                                                         self.students[3].pk)['success'])
+        self.assertTrue(EnrollmentService.unenroll_student(self.classes[3].pk,
+                                                           self.students[0].pk)['success'])
+        created = ClassService.create_class({
+            'subject_id': self.subjects[2].pk, 'teacher_id': self.teachers[1].pk,
+            'schedule': 'FRI 08:00-10:00', 'semester': '2025.1',
+        })
+        self.assertEqual(read_model.sync(), 3)
+
+        detail = self.call('GetClass', classes_pb2.GetClassRequest(class_id=self.classes[0].pk))
+        self.assertEqual(detail.enrolled_count, 2)
+        self.assertIn(self.students[3].pk, [s.id for s in detail.students])
+        self.assertEqual(read_model.get_class(self.classes[3].pk).enrolled_count, 3)
+        listed = self.call('ListClasses', classes_pb2.ListClassesRequest(semester='2025.1'))
+        self.assertIn(created['class_id'], [c.id for c in listed.classes])
+
+    def test_check_repairs_writes_outside_the_feed(self):
+        Class.objects.filter(pk=self.classes[1].pk).update(room='Lab 9')
+        self.classes[2].students.clear()
+        with self.assertLogs('backend_service', 'WARNING'):
+            self.assertEqual(read_model.check(), 2)
+        self.assertEqual(read_model.get_class(self.classes[1].pk).room, 'Lab 9')
+        self.assertEqual(read_model.get_class(self.classes[2].pk).enrolled_count, 0)
+        self.assertEqual(read_model.check(), 0)
+
+    def test_bus_events_refresh_what_the_feed_does_not_carry(self):
+        Class.objects.filter(pk=self.classes[1].pk).update(room='Lab 9')
+        self.classes[2].delete()
+        user = self.student_users[0]
+        user.first_name = 'Ana'
+        user.save()
+        read_model.invalidate({'model': 'class', 'action': 'bulk', 'pks': [],
+                               'class_ids': [self.classes[1].pk, self.classes[2].pk]})
+        read_model.invalidate({'model': 'student', 'action': 'save',
+                               'pks': [self.students[0].pk], 'class_ids': []})
+        self.assertEqual(read_model.get_class(self.classes[1].pk).room, 'Lab 9')
+        self.assertIsNone(read_model.get_class(self.classes[2].pk))
+        self.assertEqual(read_model.students[self.students[0].pk].full_name, 'Ana 0')
+
+    def test_active_listings_come_from_the_shared_catalog_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'catalog.bin')
+        self.addCleanup(shared_catalog.reset)
+        with override_settings(CATALOG_FILE=path):
+            shared_catalog.ensure()
+            Class.objects.filter(pk=self.classes[1].pk).update(room='Lab 9')
+            listings = [
+                classes_pb2.ListClassesRequest(semester='2025.1', active_only=True),
+                classes_pb2.GetTeacherClassesRequest(teacher_id=self.teachers[1].pk),
+            ]
+            with self.assertNumQueries(1):  # the semester's status
+                from_file = [self.call('ListClasses', listings[0]),
+                             self.call('GetTeacherClasses', listings[1])]
+        self.assertEqual(from_file, [self.call('ListClasses', listings[0]),
+                                     self.call('GetTeacherClasses', listings[1])])
+        # Written before the update
+        self.assertNotIn('Lab 9', [c.room for c in from_file[1].classes])
+
+    def test_writers_prune_the_feed(self):
+        feed.record_class_deleted(0)
+        CatalogChange.objects.update(created_at=timezone.now() - timedelta(days=2))
+        with mock.patch.object(feed, '_prune_in_background') as prune:
+            with self.captureOnCommitCallbacks(execute=True):
+                feed.record_class_deleted(0)
+            prune.assert_not_called()
+            with mock.patch.object(feed, '_pruned_at', time.monotonic() - feed.PRUNE_INTERVAL):
+                with self.captureOnCommitCallbacks(execute=True):
+                    feed.record_class_deleted(0)
+            prune.assert_called_once_with('default')
+        self.assertEqual(feed.prune(), 1)
+        self.assertEqual(CatalogChange.objects.count(), 2)
+        # The recent entries are left for the read model
+        self.assertEqual(read_model.sync(), 2)
+
+    def test_get_class_field_mask(self):
+        request = classes_pb2.GetClassRequest(class_id=self.classes[3].pk)
+        request.field_mask.paths.extend(['room', 'enrolled_count', 'teacher'])
+        from_memory = self.call('GetClass', request)
+        with override_settings(CATALOG_READ_MODEL_MAX_STALENESS=-1):
+            with self.assertNumQueries(1):
+                from_database = self.call('GetClass', request)
+        self.assertEqual(from_memory, from_database)
+
+        self.assertEqual(from_memory.id, self.classes[3].pk)
+        self.assertEqual((from_memory.room, from_memory.enrolled_count), ('Room 3', 4))
+        self.assertEqual(from_memory.teacher.employee_id, self.teachers[1].employee_id)
+        self.assertFalse(from_memory.HasField('subject'))
+        self.assertEqual(len(from_memory.students), 0)
+        self.assertEqual((from_memory.schedule, from_memory.max_students), ('', 0))
+
+    def test_missing_class_is_not_found(self):
+        context = FakeContext()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.servicer.GetClass(classes_pb2.GetClassRequest(class_id=0), context)
+        self.assertEqual(context.code.name, 'NOT_FOUND')
@@ -0,0 +1,106 @@
+"""
+Benchmark: propagation lag of the invalidation bus (core.bus).
+
+For each transport, starts several subscriber processes (standing in for
+web and gRPC workers) and publishes enrollment events from this one at a
+steady rate. Each subscriber applies them as it would in production (the
+cache versions and the enrollment matrix) and reports the lag from
+publish() to applied. Needs no data in the database.
+
+    python benchmarks/bench_invalidation_bus.py
+    python benchmarks/bench_invalidation_bus.py --workers 8 --events 5000 --rate 1000
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Django setup (workers inherit the settings module through the environment)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+
+from django.conf import settings
+
+from core.bus import bus
+
+TRANSPORTS = ['unix', 'sqlite']
+
+
+def configure(transport, path):
+    settings.INVALIDATION_BUS = {'TRANSPORT': transport, 'PATH': path}
+    bus.reset()
+
+
+def subscriber(transport, path, events, ready, results):
+    configure(transport, path)
+    bus.poll(0)  # binds the socket / takes the outbox cursor
+    ready.wait()
+    deadline = time.monotonic() + 60
+    while bus.received < events and time.monotonic() < deadline:
+        bus.poll(settings.INVALIDATION_BUS_POLL_INTERVAL)
+    results.put(bus.stats())
+
+
+def run(transport, workers, events, rate):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bus' if transport == 'unix' else 'bus.sqlite3')
+    configure(transport, path)
+    bus.poll(0)  # creates the outbox before the subscribers read it
+
+    context = multiprocessing.get_context('spawn')
+    ready, results = context.Barrier(workers + 1), context.Queue()
+    processes = [
+        context.Process(target=subscriber, args=(transport, path, events, ready, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    ready.wait()
+    started = time.perf_counter()
+    for i in range(events):
+        class_id = i % 1000 + 1
+        bus.publish('class', 'enroll', [class_id], [class_id], ['2025.1'],
+                    pairs=[[class_id, i + 1]])
+        # Paced to `rate` events per second
+        delay = started + (i + 1) / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    measured = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    bus.reset()
+    for root, dirs, files in os.walk(directory, topdown=False):
+        for name in files:
+            os.remove(os.path.join(root, name))
+        os.rmdir(root)
+
+    received = sum(m['received'] for m in measured)
+    worst = lambda key: max(m[key] or 0 for m in measured)
+    print(f'{transport:<7} {received:6d}/{events * workers:<6d} received   '
+          f'gaps {sum(m["gaps"] for m in measured):3d}   '
+          f'lag p50 {worst("lag_p50_ms"):7.2f} ms   p99 {worst("lag_p99_ms"):7.2f} ms   '
+          f'max {worst("lag_max_ms"):7.2f} ms')
+
+
+def main():
+    workers, events, rate = 4, 2000, 500
+    if '--workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('--workers') + 1])
+    if '--events' in sys.argv:
+        events = int(sys.argv[sys.argv.index('--events') + 1])
+    if '--rate' in sys.argv:
+        rate = float(sys.argv[sys.argv.index('--rate') + 1])
+
+    print(f'{workers} subscriber processes, {events} events at {rate:g}/s; '
+          f'lag is the worst subscriber\'s\n')
+    for transport in TRANSPORTS:
+        run(transport, workers, events, rate)
+
+
+if __name__ == '__main__':
+    main()
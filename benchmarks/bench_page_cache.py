@@ -0,0 +1,98 @@
+"""
+Benchmark: catalog page rendering with and without the page/fragment caches.
+
+For each catalog page, times a full render with an empty cache against a
+render served from core.caching: the whole page for anonymous visitors,
+the versioned {% cache %} fragments for a logged-in student. Uses the
+configured database, so populate it first (create_sample_data).
+
+    python benchmarks/bench_page_cache.py
+    python benchmarks/bench_page_cache.py --repeat 50
+"""
+import logging
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Django setup
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Student
+
+PAGES = [
+    ('list', '/classes/'),
+    ('list ?semester', '/classes/?semester=2025.1'),
+    ('subjects', '/classes/subjects/'),
+    ('dashboard', '/classes/dashboard/'),
+]
+
+
+def best_of(fn, repeat, setup=None):
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def queries(fn):
+    with CaptureQueriesContext(connection) as captured:
+        fn()
+    return len(captured)
+
+
+def bench(label, client, url, repeat):
+    get = lambda: client.get(url)
+    get()  # session, principal and template loading out of the way
+    t_cold, cold = best_of(get, repeat, setup=cache.clear)
+    q_cold = queries(lambda: (cache.clear(), get()))
+    get()
+    t_warm, warm = best_of(get, repeat)
+    q_warm = queries(get)
+
+    assert cold.status_code == warm.status_code == 200, f'{label}: {cold.status_code}'
+    print(f'{label:<30} cold {t_cold * 1000:7.2f} ms ({q_cold:2d} q)   '
+          f'cached {t_warm * 1000:6.2f} ms ({q_warm:2d} q)   x{t_cold / t_warm:5.1f}')
+
+
+def main():
+    repeat = 20
+    if '--repeat' in sys.argv:
+        repeat = int(sys.argv[sys.argv.index('--repeat') + 1])
+
+    settings.ALLOWED_HOSTS = ['*']
+    logging.getLogger('core.query_budget').setLevel(logging.ERROR)
+
+    anonymous = Client()
+    student = Student.objects.select_related('user').first()
+    if student is None:
+        sys.exit('No students in the database; run manage.py create_sample_data first')
+    logged_in = Client()
+    logged_in.force_login(student.user)
+
+    print(f'Best of {repeat}, cache backend {settings.CACHES["default"]["BACKEND"]}\n')
+    print('Anonymous (full page cache)')
+    for label, url in PAGES:
+        bench(f'  {label}', anonymous, url, repeat)
+    print('\nStudent (fragment cache only)')
+    for label, url in PAGES:
+        bench(f'  {label}', logged_in, url, repeat)
+    cache.clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Microbenchmark: list endpoint serialization and JSON rendering.
+
+Compares ClassListSerializer + JSONRenderer (the DRF defaults) with the
+precompiled RowEncoder + FastJSONRenderer on 1k and 10k row pages, and
+checks that both paths produce identical bytes. Runs on in-memory rows,
+no database needed.
+
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py --stdlib   # ignore orjson
+"""
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Django setup
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import Student, Teacher
+from api_gateway import renderers
+from api_gateway.encoders import CLASS_LIST_ENCODER, STUDENT_ENCODER, TEACHER_ENCODER
+from api_gateway.views import ClassListSerializer, StudentSerializer, TeacherSerializer
+from core.models import Class, Subject
+
+
+def make_classes(n):
+    """Unsaved Class instances and the equivalent encoder rows"""
+    objects, rows = [], []
+    for i in range(n):
+        user = User(id=i, username=f'prof{i}', first_name='João', last_name=f'Silva {i}')
+        teacher = Teacher(id=i, user=user, employee_id=f'T{i:05d}')
+        subject = Subject(id=i, code=f'CS{i:04d}', name=f'Subject “{i}”', credits=4)
+        c = Class(id=i, subject=subject, teacher=teacher, schedule='MON 14:00-16:00',
+                  room=f'Lab {i % 50}', semester='2025.1', max_students=40, is_active=True)
+        c.student_count = i % 41
+        objects.append(c)
+        rows.append((i, subject.code, subject.name, user.first_name, user.last_name,
+                     user.username, c.schedule, c.room, c.semester, c.max_students,
+                     c.student_count, c.is_active))
+    assert CLASS_LIST_ENCODER.columns_for() == (
+        'id', 'subject__code', 'subject__name', 'teacher__user__first_name',
+        'teacher__user__last_name', 'teacher__user__username', 'schedule', 'room',
+        'semester', 'max_students', 'student_count', 'is_active')
+    return objects, rows
+
+
+def make_students(n):
+    objects, rows = [], []
+    for i in range(n):
+        user = User(id=i, username=f'student{i}', first_name='Ana' if i % 3 else '',
+                    last_name='Costa' if i % 3 else '', email=f's{i}@student.edu')
+        objects.append(Student(id=i, user=user, enrollment_number=f'S{i:05d}'))
+        rows.append((i, f'S{i:05d}', user.first_name, user.last_name, user.username, user.email))
+    return objects, rows
+
+
+def make_teachers(n):
+    objects, rows = [], []
+    for i in range(n):
+        user = User(id=i, username=f'prof{i}', first_name='Maria', last_name=f'Santos {i}',
+                    email=f'prof{i}@university.edu')
+        objects.append(Teacher(id=i, user=user, employee_id=f'T{i:05d}', specialization='Math'))
+        rows.append((i, f'T{i:05d}', user.first_name, user.last_name, user.username,
+                     'Math', user.email))
+    return objects, rows
+
+
+def best_of(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench(label, serializer_class, encoder, objects, rows):
+    page = lambda data: {'count': len(data), 'next': None, 'previous': None, 'results': data}
+    baseline_renderer = JSONRenderer()
+    fast_renderer = renderers.FastJSONRenderer()
+
+    t_ser, data = best_of(lambda: serializer_class(objects, many=True).data)
+    t_enc, encoded = best_of(lambda: encoder.encode(rows))
+    t_json, expected = best_of(lambda: baseline_renderer.render(page(data)))
+    t_fast, actual = best_of(lambda: fast_renderer.render(page(encoded)))
+
+    assert actual == expected, f'{label}: rendered bytes differ'
+    total_old, total_new = t_ser + t_json, t_enc + t_fast
+    print(f'{label:<22} serialize {t_ser * 1000:8.2f} ms -> {t_enc * 1000:7.2f} ms   '
+          f'render {t_json * 1000:7.2f} ms -> {t_fast * 1000:6.2f} ms   '
+          f'total x{total_old / total_new:5.1f}')
+
+
+def main():
+    if '--stdlib' in sys.argv:
+        renderers.orjson = None
+    backend = 'orjson' if renderers.orjson is not None else 'stdlib'
+    print(f'FastJSONRenderer backend: {backend}\n')
+    for n in (1_000, 10_000):
+        bench(f'classes ({n} rows)', ClassListSerializer, CLASS_LIST_ENCODER, *make_classes(n))
+        bench(f'students ({n} rows)', StudentSerializer, STUDENT_ENCODER, *make_students(n))
+        bench(f'teachers ({n} rows)', TeacherSerializer, TEACHER_ENCODER, *make_teachers(n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: memory-mapped catalog file vs a per-process ORM cache.
+
+Starts several worker processes (standing in for web and gRPC workers)
+for each way of holding the active catalog in memory:
+
+- orm:   every worker loads the active classes, with subject, teacher
+         and seat count, into a dict of model instances
+- mmap:  every worker maps one file from core.shared_catalog and decodes
+         rows on lookup
+
+Once all workers hold the catalog, each reports what loading it added to
+its memory (RSS, PSS, which splits shared pages between the processes
+mapping them, and USS, the pages only it uses) and the latency of random
+lookups of a class with its subject, teacher and free seats. PSS can go
+slightly negative: the pages the workers already shared (the interpreter,
+Django) are split more ways once they all run. Uses the configured
+database, so populate it first (create_sample_data).
+
+    python benchmarks/bench_shared_catalog.py
+    python benchmarks/bench_shared_catalog.py --workers 8 --lookups 500000
+"""
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Django setup (workers inherit the settings module through the environment)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+
+from django.db import connection
+
+from core.models import Class
+from core.shared_catalog import CatalogFile, write_catalog_file
+
+
+def memory():
+    """(rss, pss, uss) of this process in bytes"""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if line[0].isupper())
+    except OSError:
+        # Not Linux: peak RSS only
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return rss, rss, rss
+    kib = lambda name: int(fields[name].split()[0]) * 1024
+    return kib('Rss'), kib('Pss'), kib('Private_Clean') + kib('Private_Dirty')
+
+
+def load_orm():
+    classes = {
+        c.pk: c for c in Class.objects.filter(is_active=True).with_stats().select_related(
+            'subject', 'teacher__user'
+        )
+    }
+
+    def lookup(class_id):
+        c = classes[class_id]
+        return c.subject.code, c.teacher.full_name, c.max_students - c.student_count
+
+    return lookup, classes
+
+
+def load_mmap(path):
+    catalog = CatalogFile(path)
+    # Fault every page in, as a long-running worker eventually does
+    for entry in catalog.classes():
+        pass
+
+    def lookup(class_id):
+        c = catalog.get_class(class_id)
+        return c.subject_code, c.teacher_name, c.max_students - c.enrolled_count
+
+    return lookup, catalog
+
+
+def worker(kind, path, class_ids, lookups, seed, barrier, results):
+    before = memory()
+    lookup, keep = load_orm() if kind == 'orm' else load_mmap(path)
+    connection.close()
+    barrier.wait()  # everyone holds the catalog
+    after = memory()
+
+    rng = random.Random(seed)
+    sample = [rng.choice(class_ids) for _ in range(lookups)]
+    start = time.perf_counter()
+    for class_id in sample:
+        lookup(class_id)
+    elapsed = time.perf_counter() - start
+    results.put((*(a - b for a, b in zip(after, before)), elapsed / lookups))
+    barrier.wait()  # nobody unmaps before the others measured
+    del keep
+
+
+def run(kind, path, class_ids, workers, lookups):
+    context = multiprocessing.get_context('spawn')
+    barrier, results = context.Barrier(workers), context.Queue()
+    processes = [
+        context.Process(target=worker,
+                        args=(kind, path, class_ids, lookups, seed, barrier, results))
+        for seed in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    mib = lambda column: sum(m[column] for m in measured) / 2**20
+    per_lookup_us = sum(m[3] for m in measured) / workers * 1e6
+    print(f'{kind:<5} RSS {mib(0):8.1f} MiB   PSS {mib(1):8.1f} MiB   USS {mib(2):8.1f} MiB'
+          f'   lookup {per_lookup_us:6.2f} us')
+
+
+def main():
+    workers, lookups = 4, 200000
+    if '--workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('--workers') + 1])
+    if '--lookups' in sys.argv:
+        lookups = int(sys.argv[sys.argv.index('--lookups') + 1])
+
+    class_ids = list(Class.objects.filter(is_active=True).values_list('pk', flat=True))
+    if not class_ids:
+        sys.exit('No active classes in the database; run manage.py create_sample_data first')
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'catalog.bin')
+    size = write_catalog_file(path)
+    connection.close()
+
+    print(f'{len(class_ids)} active classes, catalog file {size / 2**20:.1f} MiB; '
+          f'{workers} worker processes, memory added summed over all of them\n')
+    try:
+        for kind in ('orm', 'mmap'):
+            run(kind, path, class_ids, workers, lookups)
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark: concurrent enrollments on SQLite, default vs production profile.
+
+Several worker processes (standing in for web and gRPC workers) share
+a copy of the configured database. For a fixed time they mix catalog
+reads with enroll/unenroll calls through EnrollmentService. Each
+profile gets its own fresh copy:
+
+- default:     config.settings (rollback journal, DEFERRED transactions,
+               a new connection per request)
+- wal:         config.settings_production without BEGIN IMMEDIATE
+- production:  config.settings_production
+
+Reports throughput and how many operations failed with "database is
+locked". Populate the database first (create_sample_data).
+
+    python benchmarks/bench_sqlite_concurrency.py
+    python benchmarks/bench_sqlite_concurrency.py --workers 16 --seconds 10
+"""
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Django setup (workers inherit the profile through the environment)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+
+from django.db import close_old_connections, connection
+
+from accounts.models import Student
+from backend_service.services import EnrollmentService
+from core.models import Class
+
+PROFILES = [
+    # (label, settings module, keep BEGIN IMMEDIATE)
+    ('default', 'config.settings', True),
+    ('wal', 'config.settings_production', False),
+    ('production', 'config.settings_production', True),
+]
+WRITE_RATIO = 0.3
+
+
+def locked(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+def worker(args):
+    path, keep_immediate, seconds, seed = args
+    # Locked enrollments are counted below rather than logged
+    logging.getLogger('backend_service').setLevel(logging.CRITICAL)
+    connection.settings_dict['NAME'] = path
+    connection.ensure_connection()
+    if not keep_immediate:
+        connection.transaction_mode = None
+    if connection.settings_dict['CONN_MAX_AGE'] == 0:
+        # What the request cycle does with the default profile
+        connection.close()
+
+    rng = random.Random(seed)
+    class_ids = list(Class.objects.values_list('pk', flat=True))
+    student_ids = list(Student.objects.values_list('pk', flat=True))
+    reads = writes = failed = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if rng.random() < WRITE_RATIO:
+                class_id, student_id = rng.choice(class_ids), rng.choice(student_ids)
+                if Class.objects.filter(pk=class_id, students=student_id).exists():
+                    result = EnrollmentService.unenroll_student(class_id, student_id)
+                else:
+                    result = EnrollmentService.enroll_student(class_id, student_id)
+                if locked(result['message']):
+                    failed += 1
+                    continue
+                writes += 1
+            else:
+                list(Class.objects.filter(is_active=True).with_stats().select_related(
+                    'subject', 'teacher__user'
+                )[:20])
+                reads += 1
+        except Exception as e:
+            if not locked(e):
+                raise
+            failed += 1
+            continue
+        finally:
+            close_old_connections()
+        latencies.append(time.perf_counter() - start)
+    return reads, writes, failed, latencies
+
+
+def copy_database(source, journal_mode):
+    fd, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    src, dst = sqlite3.connect(source), sqlite3.connect(path)
+    src.backup(dst)
+    dst.execute(f'PRAGMA journal_mode={journal_mode}')
+    src.close()
+    dst.close()
+    return path
+
+
+def run(label, module, keep_immediate, workers, seconds, source):
+    path = copy_database(source, 'WAL' if module.endswith('production') else 'DELETE')
+    os.environ['DJANGO_SETTINGS_MODULE'] = module
+    context = multiprocessing.get_context('spawn')
+    try:
+        with context.Pool(workers) as pool:
+            results = pool.map(worker, [
+                (path, keep_immediate, seconds, seed) for seed in range(workers)
+            ])
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    reads = sum(r[0] for r in results)
+    writes = sum(r[1] for r in results)
+    failed = sum(r[2] for r in results)
+    latencies = sorted(t for r in results for t in r[3])
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+    print(f'{label:<12} {writes / seconds:8.1f} writes/s {reads / seconds:9.1f} reads/s   '
+          f'locked {failed:5d} ({failed / max(reads + writes + failed, 1):6.1%})   '
+          f'p99 {p99 * 1000:7.1f} ms')
+
+
+def main():
+    workers, seconds = 8, 5
+    if '--workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('--workers') + 1])
+    if '--seconds' in sys.argv:
+        seconds = float(sys.argv[sys.argv.index('--seconds') + 1])
+
+    source = str(connection.settings_dict['NAME'])
+    if not Class.objects.exists():
+        sys.exit('No classes in the database; run manage.py create_sample_data first')
+    connection.close()
+
+    print(f'{workers} worker processes, {seconds:g} s each, '
+          f'{WRITE_RATIO:.0%} enroll/unenroll calls\n')
+    for label, module, keep_immediate in PROFILES:
+        run(label, module, keep_immediate, workers, seconds, source)
+
+
+if __name__ == '__main__':
+    main()
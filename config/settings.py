@@ -29,12 +29,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,6 +69,23 @@ DATABASES = {
     }
 }
 
+# Read replicas (core.routers): aliases in DATABASES holding a copy of
+# 'default', e.g. a Postgres standby, or for local testing a SQLite copy
+# refreshed with `manage.py sync_sqlite_replica`:
+#
+#   DATABASES['replica'] = {
+#       'ENGINE': 'django.db.backends.sqlite3',
+#       'NAME': BASE_DIR / 'db.replica.sqlite3',
+#       'TEST': {'MIRROR': 'default'},
+#   }
+#   DATABASE_REPLICAS = ['replica']
+#
+# Empty keeps every query on 'default'.
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+# Seconds a client keeps reading from the primary after a request that wrote
+REPLICA_PIN_SECONDS = 5
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -88,16 +108,73 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework
 REST_FRAMEWORK = {
+    # Bearer first: DRF answers 401 with the first class's WWW-Authenticate
+    # challenge, where SessionAuthentication gives none and a 403
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api_gateway.authentication.BearerTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # Same bytes as JSONRenderer; uses orjson when installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'api_gateway.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
 
+# Caches. 'default' holds the catalog pages and fragments (core.caching)
+# and is per process; core.bus keeps the processes' versions in step
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    },
+}
+# Reference data (core.refdata): seconds records stay in each process's
+# own tier, and the cache alias of a tier the processes share (None: no
+# shared tier) with the seconds they stay there. For example, on disk:
+#   CACHES['shared'] = {
+#       'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#       'LOCATION': BASE_DIR / 'cache',
+#   }
+# or on Redis, or a Redis-compatible local server (Valkey, KeyDB):
+#   CACHES['shared'] = {
+#       'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#       'LOCATION': 'redis://127.0.0.1:6379/1',
+#   }
+#   REFDATA_SHARED_CACHE = 'shared'
+REFDATA_LOCAL_TTL = 60
+REFDATA_SHARED_CACHE = None
+REFDATA_SHARED_TTL = 10 * 60
+
+# Bearer tokens for machine clients (api_gateway.authentication)
+API_TOKEN_MAX_AGE = 24 * 60 * 60
+# Seconds a resolved user + profile stays in the per-process cache
+PRINCIPAL_CACHE_TTL = 30
+# Seconds cached catalog pages and fragments live (core.caching); writes
+# invalidate them sooner through versioned keys
+CATALOG_CACHE_TIMEOUT = 300
+# Memory-mapped catalog file shared by the worker processes
+# (core.shared_catalog); None disables it. Catalog writes rewrite it
+# CATALOG_FILE_DEBOUNCE seconds later, and readers look for a new file at
+# most every CATALOG_FILE_CHECK_INTERVAL seconds
+CATALOG_FILE = None
+CATALOG_FILE_DEBOUNCE = 1.0
+CATALOG_FILE_CHECK_INTERVAL = 1.0
+# Invalidation bus between the web and gRPC processes (core.bus); None
+# leaves each process to its own writes. TRANSPORT is 'unix' (PATH is a
+# directory for the sockets) or 'sqlite' (PATH is the outbox file), e.g.
+# {'TRANSPORT': 'sqlite', 'PATH': BASE_DIR / 'bus.sqlite3'}
+INVALIDATION_BUS = None
+# Seconds between outbox polls (the socket wait, for 'unix')
+INVALIDATION_BUS_POLL_INTERVAL = 0.1
+# Outbox rows older than this many seconds are pruned
+INVALIDATION_BUS_RETENTION = 60 * 60
+
 # CORS
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -111,4 +188,103 @@ LOGOUT_REDIRECT_URL = 'classes:list'
 
 # gRPC
 GRPC_SERVER_HOST = 'localhost'
-GRPC_SERVER_PORT = 50051
\ No newline at end of file
+GRPC_SERVER_PORT = 50051
+# In-memory read model of the gRPC server (backend_service.read_model).
+# Seconds between polls of the change feed; reads go to the database
+# whenever the last poll is older than CATALOG_READ_MODEL_MAX_STALENESS
+CATALOG_FEED_POLL_INTERVAL = 0.5
+CATALOG_READ_MODEL_MAX_STALENESS = 5
+# Seconds between full reloads that repair drift from writes outside the feed
+CATALOG_READ_MODEL_CHECK_INTERVAL = 300
+# Feed entries older than this many seconds are pruned by the writers
+CATALOG_FEED_RETENTION = 24 * 60 * 60
+
+# Query budgets (core.query_budget)
+# Max queries per view, pinned against the fixture in core/tests.py;
+# api_gateway/tests.py and core/tests.py fail when a view goes over.
+# A signed-in request reads its session and user (2 queries) before the
+# view runs, and the first one after PRINCIPAL_CACHE_TTL its profiles (1).
+# Writes count the two ends of their transaction (SAVEPOINT and RELEASE
+# under the tests), the search index row and the change feed entry; what
+# core.signals does once they commit (the statistics deltas, the cache
+# versions) is not counted, since the tests never commit.
+QUERY_BUDGETS = {
+    # The statistics row, whose updated_at keys the cached fragments
+    'classes:dashboard': 6,
+    # A search in a semester: session, user, whether the semester is
+    # archived, the ranked search matches and the page of classes; for a
+    # student without INVALIDATION_BUS, also their classes (core.matrix
+    # would not see the other processes' enrollments)
+    'classes:list': 6,
+    # An archived class: the live table first, then the archive and roster
+    'classes:detail': 7,
+    # The open-semester and duplicate checks, the subject and teacher
+    'classes:create': 12,
+    # The class before the edit, for the statistics and for the semester
+    # whose cached pages are invalidated too
+    'classes:edit': 10,
+    # The class and its student count before the cascade, for the statistics
+    'classes:delete': 11,
+    # The class (locked), student, roster and schedule checks, the add()
+    'classes:enroll': 12,
+    'classes:unenroll': 11,
+    'classes:my_classes': 5,
+    'classes:my_teaching': 4,
+    'classes:roster_export': 4,
+    'classes:my_rosters_export': 3,
+    'classes:semester_enrollments_export': 3,
+    'classes:subject_list': 1,
+    'classes:subject_create': 4,
+    
+    # Admin pages that list classes or students
+    'admin:core_class_changelist': 5,
+    # Admin actions, by '<changelist>:<action>' (QueryBudgetMiddleware):
+    # session, user, the changelist's count, then core.bulk's statements
+    'admin:core_class_changelist:activate_classes': 7,
+    'admin:core_class_changelist:deactivate_classes': 7,
+    'admin:core_class_changelist:add_seats': 7,
+    # The two classes, then locking them, the seat and schedule checks,
+    # the insert and the delete
+    'admin:core_class_changelist:move_students': 13,
+    'admin:core_class_change': 25,
+    'admin:accounts_student_changelist': 4,
+    'admin:accounts_student_change': 7,
+    'admin:autocomplete': 4,
+    
+    'api:api-root': 0,
+    # POST: classes:create's queries, then the class, its roster and its
+    # subject's class count for the response
+    'api:class-list': 14,
+    'api:class-detail': 3,
+    'api:class-enroll': 12,
+    'api:class-unenroll': 11,
+    'api:subject-list': 3,
+    'api:subject-detail': 1,
+    # ?expand=classes, by '<view>:expand' (QueryBudgetMiddleware): the
+    # prefetch of the classes, with their subjects and teachers joined
+    'api:subject-detail:expand': 2,
+    'api:student-list': 4,
+    'api:student-detail': 3,
+    'api:teacher-list': 3,
+    'api:teacher-detail': 1,
+    'api:teacher-detail:expand': 2,
+    'api:my_classes': 4,
+    'api:token': 1,
+    'api:autocomplete': 2,
+    
+    # As the views, without the session, user and profiles
+    'grpc:EnrollStudent': 9,
+    'grpc:UnenrollStudent': 8,
+    # The first call in a process also detects the search backend (2)
+    'grpc:CreateClass': 11,
+    'grpc:GetClass': 3,
+    # From the database when the read model is stale: whether the semester
+    # is archived, then the classes
+    'grpc:ListClasses': 2,
+    'grpc:GetTeacherClasses': 2,
+    'grpc:GetStudentClasses': 2,
+}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_NPLUSONE_THRESHOLD = 5
+# Log in production; the test modules override this to raise
+QUERY_BUDGET_STRICT = False
@@ -0,0 +1,39 @@
+"""
+Production database profile for SQLite, shared by the web and gRPC
+processes:
+
+    DJANGO_SETTINGS_MODULE=config.settings_production
+
+Everything else comes from config.settings. benchmarks/bench_sqlite_concurrency.py
+compares this profile with the default one.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES['default'] = {
+    # Django 5.0's sqlite3 backend plus init_command/transaction_mode
+    'ENGINE': 'core.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.sqlite3',
+    # Keep connections across requests instead of reopening (and re-running
+    # the PRAGMAs) every time; health checks drop ones that went bad
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        # Seconds sqlite3 waits for a lock before "database is locked"
+        'timeout': 20,
+        'init_command': ';'.join([
+            # Readers no longer block the writer, nor the writer readers
+            'PRAGMA journal_mode=WAL',
+            # Safe with WAL: a power loss may drop the last commits, never
+            # corrupt the file; saves an fsync per commit
+            'PRAGMA synchronous=NORMAL',
+            'PRAGMA busy_timeout=20000',
+            'PRAGMA mmap_size=134217728',  # 128 MiB
+            'PRAGMA cache_size=-20000',  # 20 MiB (negative: KiB)
+            'PRAGMA temp_store=MEMORY',
+        ]),
+        # Take the write lock at BEGIN: the enrollment transactions read,
+        # then write, and a deferred upgrade fails instead of waiting
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
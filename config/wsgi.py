@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Subscribe to the other processes' catalog writes (INVALIDATION_BUS)
+from core.bus import bus  # noqa: E402
+
+bus.start()
+
+# Load the enrollment matrix before the first request needs it
+from core.matrix import enrollment_matrix  # noqa: E402
+
+enrollment_matrix.warm()
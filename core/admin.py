@@ -1,5 +1,20 @@
-from django.contrib import admin
-from .models import Subject, Class
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+
+from accounts.models import Teacher
+from . import bulk
+from .models import Semester, Subject, Class
+
+
+@admin.register(Semester)
+class SemesterAdmin(admin.ModelAdmin):
+    list_display = ['code', 'status', 'updated_at']
+    list_filter = ['status']
+    search_fields = ['code']
+    readonly_fields = ['created_at', 'updated_at']
 
 
 @admin.register(Subject)
@@ -20,21 +35,101 @@ class SubjectAdmin(admin.ModelAdmin):
     )
 
 
-class ClassStudentInline(admin.TabularInline):
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Shows one page of the related rows, chosen by the `page_param` query
+    argument; the change form posts back to the same URL, so a save
+    applies to the page it showed
+    """
+    per_page = 50
+    page_param = 'page'
+    request = None  # set by the inline's get_formset()
+    
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            paginator = Paginator(super().get_queryset(), self.per_page)
+            number = self.request.GET.get(self.page_param) if self.request else None
+            self.page = paginator.get_page(number)
+            self._queryset = self.page.object_list
+        return self._queryset
+    
+    def _page_url(self, number):
+        query = self.request.GET.copy()
+        query[self.page_param] = number
+        return f'?{query.urlencode()}'
+    
+    @property
+    def previous_page_url(self):
+        self.get_queryset()
+        return self._page_url(self.page.previous_page_number()) if self.page.has_previous() else None
+    
+    @property
+    def next_page_url(self):
+        self.get_queryset()
+        return self._page_url(self.page.next_page_number()) if self.page.has_next() else None
+
+
+class EnrolledStudentInline(admin.TabularInline):
+    """The roster, a page at a time; students leave by ticking Delete"""
     model = Class.students.through
-    extra = 1
+    formset = PaginatedInlineFormSet
+    template = 'admin/core/class/enrolled_students_inline.html'
+    fields = ['student']
+    readonly_fields = ['student']
+    extra = 0
+    max_num = 0
     verbose_name = 'Enrolled Student'
     verbose_name_plural = 'Enrolled Students'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('student__user').order_by(
+            'student__enrollment_number'
+        )
+    
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.request = request
+        formset.page_param = 'roster_page'
+        return formset
+
+
+class EnrollStudentInline(admin.TabularInline):
+    """Empty rows with a search-as-you-type student picker"""
+    model = Class.students.through
+    fields = ['student']
+    autocomplete_fields = ['student']
+    extra = 3
+    can_delete = False
+    verbose_name = 'Student to enroll'
+    verbose_name_plural = 'Enroll Students'
+    
+    def get_queryset(self, request):
+        # Existing enrollments are listed by EnrolledStudentInline
+        return super().get_queryset(request).none()
+
+
+class ClassActionForm(ActionForm):
+    """The action bar, with the inputs the bulk actions take"""
+    seats = forms.IntegerField(required=False, help_text='Seats to add (negative removes)')
+    target = forms.IntegerField(required=False, label='Target class id',
+                                help_text='Class to move the students to')
 
 
 @admin.register(Class)
 class ClassAdmin(admin.ModelAdmin):
+    action_form = ClassActionForm
+    actions = ['activate_classes', 'deactivate_classes', 'add_seats', 'move_students']
     list_display = ['get_class_name', 'teacher', 'semester', 'schedule', 'room', 
                     'enrolled_count', 'max_students', 'is_active']
-    list_filter = ['semester', 'is_active', 'subject', 'created_at']
+    # No subject filter: it would list every subject on each page; search by code
+    list_filter = ['semester', 'is_active', 'created_at']
+    list_select_related = ['subject', 'teacher__user']
+    # The filtered count is enough to paginate; skip a second COUNT(*)
+    show_full_result_count = False
     search_fields = ['subject__code', 'subject__name', 'teacher__user__last_name', 'room']
     readonly_fields = ['created_at', 'updated_at', 'enrolled_count', 'available_seats']
-    filter_horizontal = ['students']
+    autocomplete_fields = ['subject', 'teacher']
+    inlines = [EnrolledStudentInline, EnrollStudentInline]
     
     fieldsets = (
         ('Class Information', {
@@ -44,7 +139,7 @@ class ClassAdmin(admin.ModelAdmin):
             'fields': ('schedule', 'room')
         }),
         ('Enrollment', {
-            'fields': ('max_students', 'students')
+            'fields': ('max_students',)
         }),
         ('Status', {
             'fields': ('is_active',)
@@ -59,10 +154,85 @@ class ClassAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # The change form's title is str(obj) too
+        return super().get_queryset(request).with_stats().select_related('subject', 'teacher__user')
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'teacher':
+            # The picker labels its current choice with str(teacher)
+            kwargs['queryset'] = Teacher.objects.select_related('user')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not Class.students.through:
+            return super().save_formset(request, form, formset, change)
+        # Through the m2m manager rather than saving the through rows, so
+        # roster_changed queues the statistics deltas and cache version
+        # bumps for when the change commits
+        formset.save(commit=False)
+        class_obj = form.instance
+        removed = [row.student_id for row in formset.deleted_objects]
+        added = [row.student_id for row in formset.new_objects]
+        if removed:
+            class_obj.students.remove(*removed)
+        if added:
+            class_obj.students.add(*added)
+    
+    # Bulk actions (core.bulk): one statement each, not one save per class
+    
+    def _action_value(self, request, name):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        return form.cleaned_data.get(name) if form.is_valid() else None
+    
+    @admin.action(description='Activate selected classes', permissions=['change'])
+    def activate_classes(self, request, queryset):
+        updated = bulk.set_active(queryset, True)
+        self.message_user(request, f'{updated} classes activated.', messages.SUCCESS)
+    
+    @admin.action(description='Deactivate selected classes', permissions=['change'])
+    def deactivate_classes(self, request, queryset):
+        updated = bulk.set_active(queryset, False)
+        self.message_user(request, f'{updated} classes deactivated.', messages.SUCCESS)
+    
+    @admin.action(description='Add seats to selected classes', permissions=['change'])
+    def add_seats(self, request, queryset):
+        seats = self._action_value(request, 'seats')
+        if not seats:
+            self.message_user(request, 'Enter the number of seats to add.', messages.ERROR)
+            return
+        updated = bulk.add_seats(queryset, seats)
+        self.message_user(request, f'{seats:+d} seats on {updated} classes.', messages.SUCCESS)
+    
+    @admin.action(description='Move students of the selected class to the target class',
+                  permissions=['change'])
+    def move_students(self, request, queryset):
+        # With what str() shows, for the message
+        related = ('subject', 'teacher__user')
+        target_id = self._action_value(request, 'target')
+        target = None
+        if target_id:
+            target = Class.objects.select_related(*related).filter(pk=target_id).first()
+        sources = list(queryset.select_related(*related)[:2])
+        if target is None or len(sources) != 1:
+            self.message_user(request, 'Select one class and enter an existing target class id.',
+                              messages.ERROR)
+            return
+        source = sources[0]
+        try:
+            moved = bulk.move_students(source, target)
+        except ValueError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, f'{moved} students moved from {source} to {target}.',
+                          messages.SUCCESS)
+    
     def get_class_name(self, obj):
         return str(obj)
     get_class_name.short_description = 'Class'
     
     def enrolled_count(self, obj):
         return obj.enrolled_count
-    enrolled_count.short_description = 'Enrolled'
\ No newline at end of file
+    enrolled_count.short_description = 'Enrolled'
+    enrolled_count.admin_order_field = 'student_count'
@@ -0,0 +1,108 @@
+"""
+Archival of closed semesters.
+
+archive_semester() moves the classes of a closed semester out of Class and
+Class.students into ArchivedClass and its roster table, BATCH_SIZE
+classes per transaction, then marks the semester archived. The hot tables
+(and every list, count and index over them) then only hold the terms in
+use. Reads of an archived term go through Class.objects.for_semester(),
+or ArchivedClass directly.
+
+The hot rows are deleted and recreated through the ORM, so core.signals
+updates the search index within each batch's transaction, and applies the
+statistics deltas and bumps the cache versions once the batch commits.
+Both directions can be interrupted and run again: a batch moves
+completely or not at all, and the semester's status only changes once
+every batch is through.
+"""
+from django.db import transaction
+
+from .models import ArchivedClass, Class, Semester
+
+BATCH_SIZE = 200
+
+
+def _copy(model, class_obj):
+    """An unsaved `model` instance with class_obj's columns, pk included"""
+    return model(**{
+        field.attname: getattr(class_obj, field.attname)
+        for field in Class._meta.concrete_fields
+    })
+
+
+def _roster(through, column, class_ids, using):
+    rows = {}
+    for class_id, student_id in through.objects.using(using).filter(
+        **{f'{column}__in': class_ids}
+    ).values_list(column, 'student_id'):
+        rows.setdefault(class_id, []).append(student_id)
+    return rows
+
+
+def archive_semester(semester, batch_size=BATCH_SIZE, using='default'):
+    """
+    Move the classes of the closed `semester` (a Semester) to the archive
+    tables. Returns how many classes were moved.
+    """
+    if semester.status == Semester.OPEN:
+        raise ValueError(f'Semester {semester.code} is still open')
+    through = ArchivedClass.students.through
+    moved = 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(
+                Class.objects.using(using).filter(semester=semester.code).order_by('pk')[:batch_size]
+            )
+            if not batch:
+                break
+            class_ids = [c.pk for c in batch]
+            roster = _roster(Class.students.through, 'class_id', class_ids, using)
+
+            ArchivedClass.objects.using(using).bulk_create([_copy(ArchivedClass, c) for c in batch])
+            through.objects.using(using).bulk_create([
+                through(archivedclass_id=class_id, student_id=student_id)
+                for class_id, student_ids in roster.items() for student_id in student_ids
+            ])
+            # Signals drop the classes from the search index, and from the
+            # statistics once the batch commits
+            Class.objects.using(using).filter(pk__in=class_ids).delete()
+        moved += len(batch)
+
+    semester.status = Semester.ARCHIVED
+    semester.save(using=using, update_fields=['status', 'updated_at'])
+    return moved
+
+
+def restore_semester(semester, batch_size=BATCH_SIZE, using='default'):
+    """
+    Move an archived `semester` back into Class and mark it closed.
+    Returns how many classes were moved.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(
+                ArchivedClass.objects.using(using).filter(semester=semester.code).order_by('pk')[:batch_size]
+            )
+            if not batch:
+                break
+            class_ids = [c.pk for c in batch]
+            roster = _roster(ArchivedClass.students.through, 'archivedclass_id', class_ids, using)
+
+            restored = []
+            for archived in batch:
+                # save() and add() rather than bulk_create(): the signals
+                # index the class, and count it and its students in the
+                # statistics once the batch commits
+                class_obj = _copy(Class, archived)
+                class_obj.save(using=using, force_insert=True)
+                class_obj.students.add(*roster.get(archived.pk, []))
+                restored.append(_copy(Class, archived))
+            # auto_now_add/auto_now stamped the inserts with the current time
+            Class.objects.using(using).bulk_update(restored, ['created_at', 'updated_at'])
+            ArchivedClass.objects.using(using).filter(pk__in=class_ids).delete()
+        moved += len(batch)
+
+    semester.status = Semester.CLOSED
+    semester.save(using=using, update_fields=['status', 'updated_at'])
+    return moved
@@ -0,0 +1,279 @@
+"""
+Prefix autocomplete for the class search box.
+
+Subject codes, subject names and teacher names live in a per-process
+radix trie (RadixTrie) held by `autocomplete_index`. The index is built
+from the database on the first lookup. After that it is updated in place
+from Subject/Teacher/User save and delete signals (connected in
+core.signals), so lookups never touch the database.
+
+Every word-suffix of a name is a key, so "struct" finds "Data Structures"
+and "silva" finds "João Silva". Keys are case- and accent-insensitive.
+"""
+import sys
+import threading
+import unicodedata
+
+from accounts.models import Teacher
+from .models import Subject
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def normalize(text):
+    """Casefolded, accent-free, single-spaced"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+def _common_prefix_length(a, b):
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+class _Node:
+    __slots__ = ('label', 'children', 'values')
+
+    def __init__(self, label=''):
+        self.label = label
+        self.children = {}  # first character of the child's label -> child
+        self.values = None  # set of values stored under the key ending here
+
+
+class RadixTrie:
+    """
+    Compressed trie mapping string keys to sets of hashable values.
+
+    Chains of single-child nodes are merged into one edge label, and
+    removal merges them back, so the node count tracks the number of
+    distinct branch points rather than characters.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.key_count = 0
+
+    def insert(self, key, value):
+        node, rest = self.root, key
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                child = node.children[rest[0]] = _Node(rest)
+                node, rest = child, ''
+                break
+            common = _common_prefix_length(child.label, rest)
+            if common < len(child.label):
+                # Split the edge at the point the keys diverge
+                middle = _Node(child.label[:common])
+                child.label = child.label[common:]
+                middle.children[child.label[0]] = child
+                node.children[rest[0]] = middle
+                child = middle
+            node, rest = child, rest[common:]
+        if node.values is None:
+            node.values = set()
+            self.key_count += 1
+        node.values.add(value)
+
+    def remove(self, key, value):
+        path = []  # (parent, child) edges walked
+        node, rest = self.root, key
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None or not rest.startswith(child.label):
+                return
+            path.append((node, child))
+            node, rest = child, rest[len(child.label):]
+        if not node.values or value not in node.values:
+            return
+        node.values.discard(value)
+        if node.values:
+            return
+        node.values = None
+        self.key_count -= 1
+
+        # Drop emptied leaves, then fold a pass-through node into its child
+        while path:
+            parent, node = path.pop()
+            if node.values is not None:
+                break
+            if not node.children:
+                del parent.children[node.label[0]]
+                continue
+            if len(node.children) == 1:
+                (child,) = node.children.values()
+                child.label = node.label + child.label
+                parent.children[child.label[0]] = child
+            break
+
+    def _find(self, prefix):
+        node, rest = self.root, prefix
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                return None
+            if rest.startswith(child.label):
+                rest = rest[len(child.label):]
+            elif child.label.startswith(rest):
+                rest = ''
+            else:
+                return None
+            node = child
+        return node
+
+    def complete(self, prefix, limit):
+        """Up to `limit` distinct values whose keys start with `prefix`"""
+        node = self._find(prefix)
+        if node is None:
+            return []
+        found = {}  # ordered set
+        # Pre-order walk: a key before its extensions, siblings alphabetically
+        stack = [node]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            if node.values:
+                for value in sorted(node.values):
+                    found.setdefault(value)
+                    if len(found) >= limit:
+                        break
+            stack.extend(sorted(node.children.values(), key=lambda n: n.label, reverse=True))
+        return list(found)
+
+    def node_count(self):
+        count, stack = 0, [self.root]
+        while stack:
+            node = stack.pop()
+            count += 1
+            stack.extend(node.children.values())
+        return count
+
+    def memory_size(self):
+        """Approximate bytes held by nodes, labels, child maps and value sets"""
+        size, stack = sys.getsizeof(self), [self.root]
+        while stack:
+            node = stack.pop()
+            size += sys.getsizeof(node) + sys.getsizeof(node.label) + sys.getsizeof(node.children)
+            if node.values is not None:
+                size += sys.getsizeof(node.values)
+            stack.extend(node.children.values())
+        return size
+
+
+def _keys(text):
+    """Every word-suffix of `text`: 'data structures' and 'structures'"""
+    words = normalize(text).split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+def subject_entries(subject_id, code, name):
+    value = ('subject', subject_id, f'{code} - {name}')
+    return value, _keys(code) | _keys(name)
+
+
+def teacher_entries(teacher_id, full_name):
+    value = ('teacher', teacher_id, full_name)
+    return value, _keys(full_name)
+
+
+class AutocompleteIndex:
+    """
+    Thread-safe RadixTrie of subjects and teachers.
+
+    Values are (type, id, label) tuples, e.g. ('subject', 3, 'CS201 - Data
+    Structures') or ('teacher', 1, 'João Silva'). `_entries` remembers the
+    keys each record was stored under, so an update can remove exactly
+    what was inserted before.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.trie = None
+            self._entries = {}
+
+    @property
+    def is_built(self):
+        return self.trie is not None
+
+    def build(self):
+        trie, entries = RadixTrie(), {}
+        for subject_id, code, name in Subject.objects.values_list('id', 'code', 'name'):
+            entries[('subject', subject_id)] = subject_entries(subject_id, code, name)
+        teachers = Teacher.objects.values_list(
+            'id', 'user__first_name', 'user__last_name', 'user__username'
+        )
+        for teacher_id, first_name, last_name, username in teachers:
+            full_name = f'{first_name} {last_name}'.strip() or username
+            entries[('teacher', teacher_id)] = teacher_entries(teacher_id, full_name)
+        for value, keys in entries.values():
+            for key in keys:
+                trie.insert(key, value)
+        with self._lock:
+            self.trie, self._entries = trie, entries
+
+    def ensure_built(self):
+        if self.trie is None:
+            with self._lock:
+                if self.trie is None:
+                    self.build()
+
+    def _replace(self, record, entry):
+        with self._lock:
+            if self.trie is None:
+                # Not built yet: the first lookup loads the current rows
+                return
+            old = self._entries.pop(record, None)
+            if old is not None:
+                value, keys = old
+                for key in keys:
+                    self.trie.remove(key, value)
+            if entry is not None:
+                value, keys = entry
+                for key in keys:
+                    self.trie.insert(key, value)
+                self._entries[record] = entry
+
+    def update_subject(self, subject):
+        self._replace(
+            ('subject', subject.pk), subject_entries(subject.pk, subject.code, subject.name)
+        )
+
+    def update_teacher(self, teacher):
+        self._replace(('teacher', teacher.pk), teacher_entries(teacher.pk, teacher.full_name))
+
+    def remove_subject(self, subject_id):
+        self._replace(('subject', subject_id), None)
+
+    def remove_teacher(self, teacher_id):
+        self._replace(('teacher', teacher_id), None)
+
+    def complete(self, query, limit=DEFAULT_LIMIT):
+        """Suggestions for `query` as dicts ready for the API"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self.ensure_built()
+        with self._lock:
+            values = self.trie.complete(prefix, limit)
+        return [{'type': kind, 'id': pk, 'label': label} for kind, pk, label in values]
+
+    def stats(self):
+        self.ensure_built()
+        with self._lock:
+            return {
+                'records': len(self._entries),
+                'keys': self.trie.key_count,
+                'nodes': self.trie.node_count(),
+                'bytes': self.trie.memory_size(),
+            }
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,51 @@
+"""
+The stock SQLite backend plus the two OPTIONS Django 5.1 adds to it, so
+config.settings_production can use them on Django 5.0:
+
+- init_command: ";"-separated statements run on every new connection,
+  e.g. the PRAGMAs that are not stored in the database file
+- transaction_mode: "DEFERRED" (SQLite's default), "IMMEDIATE" or
+  "EXCLUSIVE", the BEGIN that atomic() issues. IMMEDIATE takes the write
+  lock up front, so a transaction that reads before writing (enrollment
+  checks, then the insert) waits on busy_timeout instead of failing with
+  "database is locked" when it tries to upgrade its read lock.
+
+Once on Django 5.1+, switch ENGINE back to django.db.backends.sqlite3;
+the OPTIONS stay the same.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # sqlite3.connect() does not accept these
+        self.init_commands = [
+            command.strip() for command in kwargs.pop('init_command', '').split(';')
+            if command.strip()
+        ]
+        mode = kwargs.pop('transaction_mode', None)
+        mode = mode.upper() if mode else None
+        if mode is not None and mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES['{self.alias}']['OPTIONS']['transaction_mode'] "
+                f"must be one of {', '.join(TRANSACTION_MODES)}, not {mode!r}"
+            )
+        self.transaction_mode = mode
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for command in self.init_commands:
+            conn.execute(command)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,126 @@
+"""
+Set-based term-end operations on classes and rosters.
+
+Each function is one transaction of a few statements, whatever the
+number of classes or students: QuerySet.update() for class columns, and
+INSERT ... SELECT / DELETE on the roster table to move students. Neither
+sends model signals, so what core.signals keeps per row is refreshed once
+per call instead: on commit the statistics are rebuilt, and the cache
+versions of the classes and semesters touched are bumped and published
+on the invalidation bus (core.bus). Changes to rosters or is_active reset
+the enrollment matrix (core.matrix), which reloads on its next lookup.
+None of these columns are in the search index.
+
+ClassAdmin exposes them as actions, and `manage.py bulk_classes` and
+`manage.py move_students` as commands.
+"""
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from . import stats
+from .bus import bus
+from .caching import bump_versions
+from .matrix import enrollment_matrix
+from .models import Class, schedule_day
+
+
+def _refresh(using, class_ids, semesters, enrollments=False):
+    class_ids, semesters = set(class_ids), set(semesters)
+    transaction.on_commit(lambda: stats.rebuild(using), using=using)
+    transaction.on_commit(lambda: bump_versions(class_ids, semesters), using=using)
+    if enrollments:
+        transaction.on_commit(enrollment_matrix.reset, using=using)
+    transaction.on_commit(
+        lambda: bus.publish('class', 'bulk', class_ids, class_ids, semesters,
+                            reset_matrix=enrollments),
+        using=using,
+    )
+
+
+def _update(queryset, using, **values):
+    """queryset.update(**values); returns the number of classes updated"""
+    with transaction.atomic(using=using):
+        rows = list(queryset.using(using).order_by().values_list('pk', 'semester'))
+        if not rows:
+            return 0
+        class_ids = [pk for pk, _ in rows]
+        Class.objects.using(using).filter(pk__in=class_ids).update(**values)
+        _refresh(using, class_ids, {semester for _, semester in rows},
+                 enrollments='is_active' in values)
+    return len(rows)
+
+
+def set_active(queryset, is_active, using='default'):
+    """Activate or deactivate every class in `queryset`"""
+    return _update(queryset.exclude(is_active=is_active), using, is_active=is_active)
+
+
+def add_seats(queryset, seats, using='default'):
+    """Add `seats` to max_students (negative removes them, down to 1)"""
+    return _update(queryset, using, max_students=Greatest(F('max_students') + seats, 1))
+
+
+def _same_day(schedule):
+    day = schedule_day(schedule)
+    return Q(schedule=day) | Q(schedule__startswith=f'{day} ')
+
+
+def move_students(source, target, using='default'):
+    """
+    Move every student of class `source` into class `target` under the
+    rules EnrollmentService applies one student at a time: `target` must
+    be active, have the seats, and not clash with another class the
+    students take that day. Students already in `target` just leave
+    `source`. Returns how many students joined `target`.
+    """
+    if source.pk == target.pk:
+        raise ValueError('Pick two different classes')
+
+    through = Class.students.through
+    quote = connections[using].ops.quote_name
+    table = quote(through._meta.db_table)
+    class_column = quote(through._meta.get_field('class').column)
+    student_column = quote(through._meta.get_field('student').column)
+    roster = through.objects.using(using)
+
+    with transaction.atomic(using=using):
+        # Locks both classes against concurrent enrollments (on backends
+        # with row locks) until the move commits
+        locked = Class.objects.using(using).select_for_update().select_related(
+            'subject', 'teacher__user'
+        ).in_bulk([source.pk, target.pk])
+        source, target = locked[source.pk], locked[target.pk]
+        if not target.is_active:
+            raise ValueError(f'{target} is not active')
+        moving = roster.filter(class_id=source.pk).exclude(
+            student_id__in=roster.filter(class_id=target.pk).values('student_id')
+        )
+        joining = moving.count()
+        enrolled = roster.filter(class_id=target.pk).count()
+        if enrolled + joining > target.max_students:
+            raise ValueError(
+                f'{target} has {target.max_students - enrolled} free seats '
+                f'for {joining} students'
+            )
+        clashes = roster.filter(
+            student_id__in=moving.values('student_id'),
+            class_id__in=Class.objects.using(using).filter(
+                _same_day(target.schedule), semester=target.semester, is_active=True,
+            ).exclude(pk__in=[source.pk, target.pk]).values('pk'),
+        ).values('student_id').distinct().count()
+        if clashes:
+            raise ValueError(f'{clashes} students have another class at the time of {target}')
+
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({class_column}, {student_column}) '
+                f'SELECT %s, {student_column} FROM {table} WHERE {class_column} = %s '
+                f'AND {student_column} NOT IN '
+                f'(SELECT {student_column} FROM {table} WHERE {class_column} = %s)',
+                [target.pk, source.pk, target.pk],
+            )
+        roster.filter(class_id=source.pk).delete()
+        _refresh(using, [source.pk, target.pk], [source.semester, target.semester],
+                 enrollments=True)
+    return joining
@@ -0,0 +1,366 @@
+"""
+Cross-process invalidation bus.
+
+The web and gRPC services are separate processes, and each keeps its own
+copy of catalog data: the cache versions of core.caching (in the
+process-local cache), the autocomplete trie, the enrollment matrix, the
+principal cache, the local tier of core.refdata and, in the gRPC server,
+the read model. core.signals
+keeps them current for the writes a process makes itself; the bus tells
+the other processes.
+
+Once a write to a Class (or a roster), Subject, Student or Teacher
+commits, core.signals publish()es an event: a dict naming the model, the
+action and the ids, the class ids and semesters whose cache versions
+were bumped, plus what the enrollment matrix needs (enrolled pairs, a
+saved class's schedule). Each event is versioned by the publishing
+process's origin and a sequence number that grows by one per event.
+
+Every process runs a subscriber thread (bus.start(), from config.wsgi and
+the gRPC server) that receives the other processes' events and passes
+them to the handlers: evict() below for the core caches, plus those
+registered with subscribe(). A gap in an origin's sequence means events
+were lost; the event is then marked `reset` and the handlers evict
+everything.
+
+Transports, chosen by settings.INVALIDATION_BUS['TRANSPORT']:
+
+- 'unix': a datagram socket per process in the directory PATH; an event
+  is sent to every other socket there. Nothing is stored, so a process
+  only hears what is published while it runs, and a full queue drops
+  the event (which the next one reveals as a gap)
+- 'sqlite': an outbox table in the SQLite file PATH, separate from the
+  main database, polled every INVALIDATION_BUS_POLL_INTERVAL seconds;
+  rows older than INVALIDATION_BUS_RETENTION seconds are pruned
+
+stats() counts the events and reports the propagation lag: the time from
+publish() to the handlers having applied the event, by the wall clock of
+the host the processes share.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from accounts.principals import principal_cache
+from .autocomplete import autocomplete_index
+from .caching import bump_versions
+from .matrix import enrollment_matrix
+from .refdata import reference_data
+
+logger = logging.getLogger('core.bus')
+
+# Process ids repeat across containers, hence a random origin
+ORIGIN = uuid.uuid4().hex[:12]
+LAG_SAMPLES = 1000
+PRUNE_INTERVAL = 60
+
+
+class UnixSocketTransport:
+    """One datagram socket per process in a shared directory"""
+    # Larger events are replaced by a reset
+    max_size = 60000
+
+    def __init__(self, path, origin=ORIGIN):
+        self.directory = os.fspath(path)
+        os.makedirs(self.directory, exist_ok=True)
+        self.address = os.path.join(self.directory, f'{origin}.sock')
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # A subscriber that does not keep up loses events rather than
+        # blocking the writer
+        self._sender.setblocking(False)
+        self._receiver = None
+
+    def send(self, data):
+        for name in os.listdir(self.directory):
+            address = os.path.join(self.directory, name)
+            if not name.endswith('.sock') or address == self.address:
+                continue
+            try:
+                self._sender.sendto(data, address)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a process that is gone
+                try:
+                    os.unlink(address)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                pass
+
+    def receive(self, timeout):
+        if self._receiver is None:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._receiver.bind(self.address)
+        self._receiver.settimeout(timeout)
+        try:
+            messages = [self._receiver.recv(self.max_size)]
+        except (socket.timeout, BlockingIOError):
+            # BlockingIOError for a timeout of 0
+            return []
+        self._receiver.setblocking(False)
+        while True:
+            try:
+                messages.append(self._receiver.recv(self.max_size))
+            except BlockingIOError:
+                return messages
+
+    def prune(self, before):
+        pass
+
+    def close(self):
+        self._sender.close()
+        if self._receiver is not None:
+            self._receiver.close()
+            self._receiver = None
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+
+
+class SQLiteOutboxTransport:
+    """An outbox table in its own SQLite file, polled by the subscribers"""
+    max_size = None
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self.cursor = None  # id of the last row received; None until the first poll
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS bus_event ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, published REAL NOT NULL, body BLOB NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def send(self, data):
+        self._connection().execute('INSERT INTO bus_event (published, body) VALUES (?, ?)',
+                                   (time.time(), data))
+
+    def receive(self, timeout):
+        connection = self._connection()
+        if self.cursor is None:
+            # Events from before this process started concern caches it never filled
+            self.cursor = connection.execute('SELECT COALESCE(MAX(id), 0) FROM bus_event').fetchone()[0]
+        rows = connection.execute('SELECT id, body FROM bus_event WHERE id > ? ORDER BY id',
+                                  (self.cursor,)).fetchall()
+        if not rows:
+            time.sleep(timeout)
+            return []
+        self.cursor = rows[-1][0]
+        return [body for _, body in rows]
+
+    def prune(self, before):
+        self._connection().execute('DELETE FROM bus_event WHERE published < ?', (before,))
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+TRANSPORTS = {
+    'unix': UnixSocketTransport,
+    'sqlite': SQLiteOutboxTransport,
+}
+
+
+def evict(event):
+    """Apply another process's event to the core caches of this one"""
+    if event.get('reset'):
+        # Every version at once: the cache is process-local
+        cache.clear()
+        autocomplete_index.reset()
+        enrollment_matrix.reset()
+        principal_cache.clear()
+        reference_data.clear()
+        return
+    if event.get('bump', True):
+        # The publisher rewrites the shared catalog file itself
+        bump_versions(event['class_ids'], event['semesters'], rewrite_catalog_file=False)
+    for user_id in event.get('user_ids', ()):
+        principal_cache.invalidate(user_id)
+    if event['model'] in ('subject', 'teacher'):
+        autocomplete_index.reset()
+    # The publisher bumped the shared tier's version
+    reference_data.changed(event['model'], shared=False)
+
+    action = event['action']
+    if event.get('reset_matrix'):
+        enrollment_matrix.reset()
+    elif action in ('enroll', 'unenroll'):
+        pairs = [tuple(pair) for pair in event['pairs']]
+        if action == 'enroll':
+            enrollment_matrix.add(pairs)
+        else:
+            enrollment_matrix.remove(pairs)
+    elif event['model'] == 'class' and action == 'save':
+        for pk, semester, schedule, is_active in event['classes']:
+            enrollment_matrix.update_class(SimpleNamespace(
+                pk=pk, semester=semester, schedule=schedule, is_active=is_active
+            ))
+    elif event['model'] == 'class' and action == 'delete':
+        for class_id in event['pks']:
+            enrollment_matrix.remove_class(class_id)
+    elif event['model'] == 'student' and action == 'delete':
+        for student_id in event['pks']:
+            enrollment_matrix.remove_student(student_id)
+
+
+class InvalidationBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.transport = None
+        self.handlers = [evict]
+        self.reset()
+
+    def reset(self):
+        """Forget the transport, the sequence numbers and the metrics"""
+        with self._lock:
+            if self.transport is not None:
+                self.transport.close()
+            self.transport = None
+            self.sequence = 0
+            self.seen = {}  # origin -> highest sequence received
+            self.published = 0
+            self.received = 0
+            self.gaps = 0
+            self.failed = 0
+            self.lags = deque(maxlen=LAG_SAMPLES)
+            self.max_lag = 0.0
+
+    @property
+    def enabled(self):
+        return bool(settings.INVALIDATION_BUS)
+
+    def _transport(self):
+        if self.transport is None:
+            config = settings.INVALIDATION_BUS
+            self.transport = TRANSPORTS[config['TRANSPORT']](config['PATH'])
+        return self.transport
+
+    def subscribe(self, handler):
+        """Also call handler(event) for every event from another process"""
+        if handler not in self.handlers:
+            self.handlers.append(handler)
+
+    # Publishing
+
+    def publish(self, model, action, pks=(), class_ids=(), semesters=(), **details):
+        """Tell the other processes; never raises, a lost event shows up as a gap"""
+        if not self.enabled:
+            return
+        with self._lock:
+            transport = self._transport()
+            self.sequence += 1
+            event = {
+                'origin': ORIGIN, 'seq': self.sequence, 'at': time.time(),
+                'model': model, 'action': action, 'pks': list(pks),
+                'class_ids': sorted(class_ids), 'semesters': sorted(semesters), **details,
+            }
+            data = json.dumps(event, separators=(',', ':')).encode()
+            if transport.max_size is not None and len(data) > transport.max_size:
+                event = {key: event[key] for key in ('origin', 'seq', 'at', 'model', 'action')}
+                data = json.dumps(dict(event, reset=True)).encode()
+            try:
+                # Under the lock, so each origin's events go out in sequence
+                transport.send(data)
+                self.published += 1
+            except Exception:
+                self.failed += 1
+                logger.exception('Invalidation bus: publishing %s %s failed', model, action)
+
+    # Subscribing
+
+    def receive(self, event):
+        """Hand an event to the handlers, unless this process published it"""
+        origin, sequence = event['origin'], event['seq']
+        if origin == ORIGIN:
+            return False
+        with self._lock:
+            last = self.seen.get(origin)
+            self.seen[origin] = max(sequence, last or 0)
+            missed = last is not None and sequence > last + 1
+            if missed:
+                self.gaps += 1
+        if missed:
+            logger.warning('Invalidation bus: missed %d events from %s; evicting everything',
+                           sequence - last - 1, origin)
+            event = dict(event, reset=True)
+        for handler in self.handlers:
+            try:
+                handler(event)
+            except Exception:
+                logger.exception('Invalidation bus: %s failed on %s %s',
+                                 getattr(handler, '__qualname__', handler),
+                                 event['model'], event['action'])
+        lag = max(time.time() - event['at'], 0.0)
+        with self._lock:
+            self.received += 1
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+        return True
+
+    def poll(self, timeout=0):
+        """Receive and apply whatever the transport has; returns how many events were applied"""
+        transport = self._transport()
+        return sum(self.receive(json.loads(data)) for data in transport.receive(timeout))
+
+    def start(self):
+        """Run the subscriber on a daemon thread; does nothing without INVALIDATION_BUS"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='invalidation-bus', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        pruned = time.monotonic()
+        while True:
+            try:
+                self.poll(settings.INVALIDATION_BUS_POLL_INTERVAL)
+                if time.monotonic() - pruned >= PRUNE_INTERVAL:
+                    self._transport().prune(time.time() - settings.INVALIDATION_BUS_RETENTION)
+                    pruned = time.monotonic()
+            except Exception:
+                logger.exception('Invalidation bus: receiving failed')
+                time.sleep(settings.INVALIDATION_BUS_POLL_INTERVAL)
+            finally:
+                # Handlers may have queried (the read model refreshes rows)
+                close_old_connections()
+
+    def stats(self):
+        with self._lock:
+            lags = sorted(self.lags)
+            percentile = lambda p: lags[min(int(len(lags) * p), len(lags) - 1)] * 1000 if lags else None
+            return {
+                'origin': ORIGIN,
+                'transport': settings.INVALIDATION_BUS['TRANSPORT'] if self.enabled else None,
+                'published': self.published,
+                'received': self.received,
+                'gaps': self.gaps,
+                'failed': self.failed,
+                'lag_p50_ms': percentile(0.5),
+                'lag_p99_ms': percentile(0.99),
+                'lag_max_ms': self.max_lag * 1000,
+            }
+
+
+bus = InvalidationBus()
@@ -0,0 +1,134 @@
+"""
+Versioned caching for the catalog pages.
+
+Cache keys embed change versions instead of being deleted on writes:
+
+- ('class', pk): a class, its subject/teacher labels and its roster
+- ('semester', code): anything counted per semester
+- ('catalog', ''): any of the above, plus subjects, teachers and students
+
+core.signals bumps the versions once a write commits, so keys built
+from the new versions miss and the old entries simply age out. A version
+is a random token rather than a counter, so a version evicted from the
+cache can never come back as an old value. The cache is per process, so
+core.bus repeats the bumps in the other processes.
+
+Two layers use them:
+
+- fragment caching in the templates ({% cache %} keyed on versions the
+  views pass in), for the per-class cards and the dashboard stat blocks
+- cache_anonymous_page(), a full-page cache for anonymous GETs that
+  varies on the query string and the catalog version
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+VERSION_PREFIX = 'catalog:v'
+PAGE_PREFIX = 'catalog:page'
+
+
+def cache_timeout():
+    """Upper bound for cached fragments/pages, for writes no signal sees"""
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def _version_key(scope, ident):
+    return f'{VERSION_PREFIX}:{scope}:{ident}'
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(scope, idents):
+    """{ident: version} for every ident, creating versions that are missing"""
+    keys = {_version_key(scope, ident): ident for ident in idents}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        # add() keeps a version another process created in the meantime
+        cache.add(key, _new_version(), timeout=None)
+        found[key] = cache.get(key)
+    return {ident: found[key] for key, ident in keys.items()}
+
+
+def get_version(scope, ident=''):
+    return get_versions(scope, [ident])[ident]
+
+
+def catalog_version():
+    return get_version('catalog')
+
+
+def bump_versions(class_ids=(), semesters=(), rewrite_catalog_file=True):
+    """Invalidate the given classes and semesters, and the catalog as a whole"""
+    keys = [_version_key('catalog', '')]
+    keys += [_version_key('class', pk) for pk in class_ids]
+    keys += [_version_key('semester', semester) for semester in semesters]
+    cache.set_many({key: _new_version() for key in keys}, timeout=None)
+    if rewrite_catalog_file:
+        # Local import: shared_catalog imports the models
+        from .shared_catalog import shared_catalog
+        shared_catalog.changed()
+
+
+def attach_class_versions(classes):
+    """Evaluate `classes` and set .cache_version on each, for {% cache %} keys"""
+    classes = list(classes)
+    versions = get_versions('class', [c.pk for c in classes])
+    for class_obj in classes:
+        class_obj.cache_version = versions[class_obj.pk]
+    return classes
+
+
+def page_cache_key(request):
+    # Sorted so ?a=1&b=2 and ?b=2&a=1 share an entry
+    query = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    digest = hashlib.md5(repr(query).encode(), usedforsecurity=False).hexdigest()
+    return f'{PAGE_PREFIX}:{request.path}:{digest}:{catalog_version()}'
+
+
+def _cacheable_request(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # Pending flash messages are rendered into the page for this visitor only
+    storage = getattr(request, '_messages', None)
+    return storage is None or len(storage) == 0
+
+
+def _cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def cache_anonymous_page(view):
+    """
+    Serve anonymous GETs of `view` from the cache. Authenticated users,
+    requests with pending messages and responses that set cookies or a
+    CSRF token always go through the view.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not _cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if _cacheable_response(request, response):
+            cache.set(key, (response.content, response['Content-Type']), cache_timeout())
+        return response
+
+    return wrapped
@@ -0,0 +1,112 @@
+"""
+Roster and enrollment exports as CSV or JSONL, streamed.
+
+Each export is one query over the roster table, joined to the class,
+subject and student columns it needs, read with values_list() and
+iterator(chunk_size=CHUNK_SIZE): rows arrive as plain tuples, CHUNK_SIZE
+at a time, and are encoded and handed on in blocks of about BLOCK_SIZE
+bytes. Nothing keeps the rows already sent, so memory stays flat however
+large the export is. The views wrap the blocks in a StreamingHttpResponse
+(gzip-compressed on the fly when the client accepts it) and
+`manage.py export_enrollments` writes them to a file.
+
+Rosters of archived semesters are read from the archive tables.
+"""
+import csv
+import io
+import json
+
+from .models import ArchivedClass, Class, Semester
+
+CHUNK_SIZE = 2000
+BLOCK_SIZE = 64 * 1024
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+COLUMNS = (
+    'class_id', 'subject_code', 'semester', 'schedule', 'room', 'teacher_employee_id',
+    'enrollment_number', 'username', 'first_name', 'last_name', 'email',
+)
+
+
+def _roster(model, using='default', **filters):
+    """`model`'s roster rows matching `filters` (on the class), as COLUMNS tuples"""
+    students = model._meta.get_field('students')
+    through = students.remote_field.through
+    column = students.m2m_field_name()
+    # Ordered like the (class, student) unique index, so there's no sort step
+    return through.objects.using(using).filter(
+        **{f'{column}__{name}': value for name, value in filters.items()}
+    ).order_by(column, 'student').values_list(
+        column, f'{column}__subject__code', f'{column}__semester', f'{column}__schedule',
+        f'{column}__room', f'{column}__teacher__employee_id',
+        'student__enrollment_number', 'student__user__username', 'student__user__first_name',
+        'student__user__last_name', 'student__user__email',
+    )
+
+
+def class_roster(class_id, using='default', archived=None):
+    """The students of one class; `archived` is looked up unless given"""
+    if archived is None:
+        archived = not Class.objects.using(using).filter(pk=class_id).exists()
+    return _roster(ArchivedClass if archived else Class, using, pk=class_id)
+
+
+def teacher_rosters(teacher_id, semester=None, using='default'):
+    """The students of every class a teacher has in the live tables"""
+    filters = {'teacher': teacher_id}
+    if semester:
+        filters['semester'] = semester
+    return _roster(Class, using, **filters)
+
+
+def semester_enrollments(semester, using='default', archived=None):
+    """Every enrollment of a semester; `archived` is looked up unless given"""
+    if archived is None:
+        archived = Semester.objects.using(using).archived().filter(code=semester).exists()
+    return _roster(ArchivedClass if archived else Class, using, semester=semester)
+
+
+def _blocks(lines):
+    """Join encoded lines into blocks of about BLOCK_SIZE bytes"""
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield b''.join(block)
+            block, size = [], 0
+    if block:
+        yield b''.join(block)
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _jsonl_lines(rows):
+    for row in rows:
+        yield (json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n').encode()
+
+
+def stream(queryset, format='csv'):
+    """
+    Bytes blocks of `queryset` (one of the roster querysets above) in
+    `format`; CSV gets a header row
+    """
+    rows = queryset.iterator(chunk_size=CHUNK_SIZE)
+    if format == 'csv':
+        return _blocks(_csv_lines(_with_header(rows)))
+    if format == 'jsonl':
+        return _blocks(_jsonl_lines(rows))
+    raise ValueError(f'Unknown format "{format}"; use csv or jsonl')
+
+
+def _with_header(rows):
+    yield COLUMNS
+    yield from rows
@@ -0,0 +1,288 @@
+"""
+Bulk import of a term's timetable and enrollment list.
+
+ClassService.create_class and EnrollmentService.enroll_student cost a
+transaction and several lookups per row. TimetableImporter applies the
+same rules to a stream of records instead:
+
+- subject codes, employee ids and enrollment numbers are resolved
+  through dictionaries loaded once
+- the classes of the open semesters, with their seat counts, are loaded
+  once; a student's classes are loaded the first time a chunk mentions
+  them, so memory follows the catalog and the students in the file, not
+  the number of rows
+- capacity, duplicate and schedule-conflict checks run against that
+  state, which is updated as rows are accepted
+- each chunk is written with bulk_create() in one transaction
+
+A record with an enrollment_number is an enrollment. It names its class
+by class_id, or by subject_code, employee_id, schedule and semester.
+Any other record is a class. Within a chunk classes are written first;
+an enrollment for a class defined in a later chunk is rejected, so
+timetable rows go before the enrollments.
+
+Classes and enrollments that already exist are counted and skipped, so
+an interrupted import can be run again. bulk_create() sends no signals:
+new classes are indexed for search per chunk, the cache versions are
+bumped and the chunk published on the invalidation bus (core.bus) per
+chunk, and the statistics are rebuilt and the enrollment matrix reset
+once at the end.
+"""
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from accounts.models import Student, Teacher
+from . import stats
+from .caching import bump_versions
+from .models import Class, Semester, Subject, schedule_day
+from .search import get_backend
+
+CHUNK_SIZE = 5000
+CLASS_FIELDS = ('room', 'max_students', 'is_active')
+CLASS_KEY = ('subject_code', 'employee_id', 'schedule', 'semester')
+
+
+class ClassState:
+    """What the checks need to know about a class"""
+    __slots__ = ('pk', 'subject_code', 'semester', 'day', 'max_students', 'student_count',
+                 'is_active')
+
+    def __init__(self, pk, subject_code, semester, schedule, max_students, student_count,
+                 is_active):
+        self.pk = pk
+        self.subject_code = subject_code
+        self.semester = semester
+        self.day = schedule_day(schedule)
+        self.max_students = max_students
+        self.student_count = student_count
+        self.is_active = is_active
+
+
+class TimetableReport:
+    def __init__(self):
+        self.records = 0
+        self.classes = 0
+        self.enrollments = 0
+        self.existing = 0
+        self.rejected = []  # (record number, message)
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        """Records per second"""
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+
+class TimetableImporter:
+
+    def __init__(self, chunk_size=CHUNK_SIZE, using='default', log=None):
+        self.chunk_size = chunk_size
+        self.using = using
+        self.log = log or (lambda message: None)
+        self._load()
+
+    def _load(self):
+        using = self.using
+        self.semesters = set(Semester.objects.using(using).open().values_list('code', flat=True))
+        self.subjects = dict(Subject.objects.using(using).values_list('code', 'pk'))
+        self.subject_codes = {pk: code for code, pk in self.subjects.items()}
+        self.teachers = dict(Teacher.objects.using(using).values_list('employee_id', 'pk'))
+        self.students = dict(Student.objects.using(using).values_list('enrollment_number', 'pk'))
+
+        self.classes = {}  # pk -> ClassState
+        self.class_keys = {}  # (subject_id, teacher_id, schedule, semester) -> pk
+        rows = Class.objects.using(using).filter(semester__in=self.semesters).with_stats().order_by()
+        for pk, subject_id, teacher_id, schedule, semester, max_students, count, is_active in (
+            rows.values_list('pk', 'subject_id', 'teacher_id', 'schedule', 'semester',
+                             'max_students', 'student_count', 'is_active').iterator()
+        ):
+            self._add_class(pk, subject_id, teacher_id, schedule, semester, max_students,
+                            count, is_active)
+        # student pk -> {(semester, day): class pk} for its active classes,
+        # filled in as students turn up
+        self.busy = {}
+
+    def _add_class(self, pk, subject_id, teacher_id, schedule, semester, max_students,
+                   student_count, is_active):
+        self.classes[pk] = ClassState(pk, self.subject_codes[subject_id], semester, schedule,
+                                      max_students, student_count, is_active)
+        self.class_keys[subject_id, teacher_id, schedule, semester] = pk
+
+    def run(self, records):
+        """Import the (number, dict) `records`; returns a TimetableReport"""
+        from .matrix import enrollment_matrix
+
+        report = TimetableReport()
+        records = iter(records)
+        try:
+            while chunk := list(islice(records, self.chunk_size)):
+                self._import_chunk(chunk, report)
+                self.log(
+                    f'{report.records} records: {report.classes} classes, '
+                    f'{report.enrollments} enrollments, {report.existing} existing, '
+                    f'{len(report.rejected)} rejected ({report.rate:.0f} records/s)'
+                )
+        finally:
+            # Also after a failed chunk: the earlier ones are committed
+            if report.classes or report.enrollments:
+                stats.rebuild(self.using)
+                enrollment_matrix.reset()
+        # Checked in two passes per chunk; listed in file order
+        report.rejected.sort()
+        return report
+
+    def _import_chunk(self, chunk, report):
+        report.records += len(chunk)
+        class_records = [(n, r) for n, r in chunk if not r.get('enrollment_number')]
+        enrollment_records = [(n, r) for n, r in chunk if r.get('enrollment_number')]
+        with transaction.atomic(using=self.using):
+            class_ids, semesters = self._import_classes(class_records, report)
+            enrolled_ids, enrolled_semesters = self._import_enrollments(enrollment_records, report)
+        class_ids += enrolled_ids
+        semesters |= enrolled_semesters
+        if class_ids:
+            transaction.on_commit(lambda: self._changed(class_ids, semesters), using=self.using)
+
+    @staticmethod
+    def _changed(class_ids, semesters):
+        # Local import: core.bus imports the matrix, which imports this module
+        from .bus import bus
+
+        bump_versions(class_ids, semesters)
+        # The enrolled pairs are not collected; the other processes reload
+        bus.publish('class', 'import', class_ids, class_ids, semesters, reset_matrix=True)
+
+    # Classes
+
+    def _clean_class(self, record):
+        """Keyword arguments for a new Class, or a ValidationError"""
+        for field in CLASS_KEY:
+            if not record.get(field):
+                raise ValidationError(f'Missing required field: {field}')
+        subject_id = self.subjects.get(str(record['subject_code']))
+        if subject_id is None:
+            raise ValidationError('Subject not found')
+        teacher_id = self.teachers.get(str(record['employee_id']))
+        if teacher_id is None:
+            raise ValidationError('Teacher not found')
+        schedule = Class._meta.get_field('schedule').clean(str(record['schedule']), None)
+        semester = str(record['semester'])
+        if semester not in self.semesters:
+            raise ValidationError(f'Semester {semester} is not open')
+        values = {'subject_id': subject_id, 'teacher_id': teacher_id,
+                  'schedule': schedule, 'semester': semester}
+        for field in CLASS_FIELDS:
+            if record.get(field) not in (None, ''):
+                values[field] = Class._meta.get_field(field).clean(record[field], None)
+        return values
+
+    def _import_classes(self, records, report):
+        new = []
+        for number, record in records:
+            try:
+                values = self._clean_class(record)
+            except ValidationError as e:
+                report.rejected.append((number, '; '.join(e.messages)))
+                continue
+            key = (values['subject_id'], values['teacher_id'], values['schedule'], values['semester'])
+            if key in self.class_keys:
+                report.existing += 1
+                continue
+            # Reserved now so a repeat later in the chunk counts as existing
+            self.class_keys[key] = None
+            new.append(Class(**values))
+        if not new:
+            return [], set()
+
+        created = Class.objects.using(self.using).bulk_create(new)
+        for c in created:
+            self._add_class(c.pk, c.subject_id, c.teacher_id, c.schedule, c.semester,
+                            c.max_students, 0, c.is_active)
+        class_ids = [c.pk for c in created]
+        get_backend(self.using).index_classes(class_ids)
+        report.classes += len(created)
+        return class_ids, {c.semester for c in created}
+
+    # Enrollments
+
+    def _load_busy(self, student_ids):
+        """Fill self.busy for the students not seen yet"""
+        missing = [pk for pk in student_ids if pk not in self.busy]
+        for pk in missing:
+            self.busy[pk] = {}
+        through = Class.students.through
+        for class_id, student_id in through.objects.using(self.using).filter(
+            student_id__in=missing, class__semester__in=self.semesters, class__is_active=True,
+        ).values_list('class_id', 'student_id').iterator():
+            state = self.classes[class_id]
+            self.busy[student_id][state.semester, state.day] = class_id
+
+    def _find_class(self, record):
+        if record.get('class_id'):
+            try:
+                state = self.classes.get(int(record['class_id']))
+            except (TypeError, ValueError):
+                raise ValidationError(f'Invalid class_id "{record["class_id"]}"')
+        else:
+            for field in CLASS_KEY:
+                if not record.get(field):
+                    raise ValidationError(f'Missing class_id or {field}')
+            pk = self.class_keys.get((
+                self.subjects.get(str(record['subject_code'])),
+                self.teachers.get(str(record['employee_id'])),
+                str(record['schedule']), str(record['semester']),
+            ))
+            state = self.classes.get(pk)
+        if state is None:
+            # Unknown, or in a semester that is not open
+            raise ValidationError('Class not found')
+        return state
+
+    def _import_enrollments(self, records, report):
+        resolved = []
+        for number, record in records:
+            student_id = self.students.get(str(record['enrollment_number']))
+            if student_id is None:
+                report.rejected.append((number, 'Student not found'))
+                continue
+            try:
+                state = self._find_class(record)
+            except ValidationError as e:
+                report.rejected.append((number, '; '.join(e.messages)))
+                continue
+            resolved.append((number, student_id, state))
+        self._load_busy({student_id for _, student_id, _ in resolved})
+
+        through = Class.students.through
+        new = []
+        for number, student_id, state in resolved:
+            # The checks and messages of EnrollmentService.enroll_student
+            busy = self.busy[student_id]
+            taken = busy.get((state.semester, state.day))
+            if taken == state.pk:
+                report.existing += 1
+            elif not state.is_active:
+                report.rejected.append((number, 'Class is not active'))
+            elif state.student_count >= state.max_students:
+                report.rejected.append((number, 'Class is full'))
+            elif taken is not None:
+                report.rejected.append(
+                    (number, f'Schedule conflict with {self.classes[taken].subject_code}')
+                )
+            else:
+                busy[state.semester, state.day] = state.pk
+                state.student_count += 1
+                new.append((state, through(class_id=state.pk, student_id=student_id)))
+        if not new:
+            return [], set()
+
+        through.objects.using(self.using).bulk_create([row for _, row in new])
+        report.enrollments += len(new)
+        return list({state.pk for state, _ in new}), {state.semester for state, _ in new}
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.archive import BATCH_SIZE, archive_semester, restore_semester
+from core.models import Semester
+
+
+class Command(BaseCommand):
+    help = 'Moves the classes of closed semesters to the archive tables (or back with --restore)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('semesters', nargs='*',
+                            help='Semester codes (default: every closed semester)')
+        parser.add_argument('--close', action='store_true',
+                            help='Close the named semesters first if they are open')
+        parser.add_argument('--restore', action='store_true',
+                            help='Move the named archived semesters back into the live tables')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f'Classes moved per transaction (default: {BATCH_SIZE})')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to archive (default: "default")')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        codes = options['semesters']
+        
+        if options['restore']:
+            if not codes:
+                raise CommandError('Name the semesters to restore')
+            for semester in self._semesters(codes, using):
+                if not semester.is_archived:
+                    raise CommandError(f'Semester {semester} is not archived')
+            for semester in self._semesters(codes, using):
+                moved = restore_semester(semester, options['batch_size'], using)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Restored {semester}: {moved} classes back in the live tables'
+                ))
+            return
+        
+        if codes:
+            semesters = self._semesters(codes, using)
+        else:
+            semesters = list(Semester.objects.using(using).filter(status=Semester.CLOSED))
+            if not semesters:
+                self.stdout.write('No closed semesters to archive')
+                return
+        
+        for semester in semesters:
+            if semester.is_open and not options['close']:
+                raise CommandError(f'Semester {semester} is open; close it first or pass --close')
+        
+        for semester in semesters:
+            if semester.is_archived:
+                self.stdout.write(f'{semester} is already archived')
+                continue
+            if semester.is_open:
+                semester.status = Semester.CLOSED
+                semester.save(using=using, update_fields=['status', 'updated_at'])
+            moved = archive_semester(semester, options['batch_size'], using)
+            self.stdout.write(self.style.SUCCESS(f'Archived {semester}: {moved} classes moved'))
+
+    def _semesters(self, codes, using):
+        semesters = {s.code: s for s in Semester.objects.using(using).filter(code__in=codes)}
+        missing = [code for code in codes if code not in semesters]
+        if missing:
+            raise CommandError(f'Unknown semesters: {", ".join(missing)}')
+        return [semesters[code] for code in codes]
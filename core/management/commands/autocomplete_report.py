@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.autocomplete import autocomplete_index
+
+
+class Command(BaseCommand):
+    help = 'Builds the autocomplete trie and reports its size and lookup latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=['c', 'cs', 'cs2', 'da', 'jo', 'silva'],
+                            help='Prefixes to time (default: a few short ones)')
+        parser.add_argument('--repeat', type=int, default=1000,
+                            help='Lookups per prefix (default: 1000)')
+
+    def handle(self, *args, **options):
+        autocomplete_index.reset()
+        started = time.perf_counter()
+        autocomplete_index.build()
+        build_ms = (time.perf_counter() - started) * 1000
+        
+        stats = autocomplete_index.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Built in {build_ms:.1f} ms: {stats['records']} records, {stats['keys']} keys, "
+            f"{stats['nodes']} nodes, {stats['bytes'] / 1024:.1f} KiB"
+        ))
+        
+        repeat = options['repeat']
+        for query in options['queries']:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                results = autocomplete_index.complete(query)
+            per_lookup_us = (time.perf_counter() - started) / repeat * 1e6
+            self.stdout.write(f'  {query!r:12} {len(results):3} results  {per_lookup_us:8.1f} us/lookup')
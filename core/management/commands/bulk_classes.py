@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core import bulk
+from core.models import Class
+
+
+class Command(BaseCommand):
+    help = 'Activates, deactivates or resizes many classes in one statement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', help='Classes of this semester')
+        parser.add_argument('--subject', help='Classes of the subject with this code')
+        parser.add_argument('--ids', type=int, nargs='+', help='Classes with these ids')
+        operation = parser.add_mutually_exclusive_group(required=True)
+        operation.add_argument('--activate', action='store_true', help='Activate the classes')
+        operation.add_argument('--deactivate', action='store_true', help='Deactivate the classes')
+        operation.add_argument('--add-seats', type=int, metavar='N',
+                               help='Add N to max_students (negative removes, down to 1)')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to update (default: "default")')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        queryset = Class.objects.using(using).all()
+        if options['semester']:
+            queryset = queryset.filter(semester=options['semester'])
+        if options['subject']:
+            queryset = queryset.filter(subject__code=options['subject'])
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+        if not (options['semester'] or options['subject'] or options['ids']):
+            raise CommandError('Select classes with --semester, --subject or --ids')
+        
+        if options['add_seats'] is not None:
+            updated = bulk.add_seats(queryset, options['add_seats'], using)
+            done = f'{options["add_seats"]:+d} seats on'
+        else:
+            updated = bulk.set_active(queryset, options['activate'], using)
+            done = 'Activated' if options['activate'] else 'Deactivated'
+        self.stdout.write(self.style.SUCCESS(f'{done} {updated} classes'))
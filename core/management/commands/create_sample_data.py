@@ -1,14 +1,85 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from accounts.models import Student, Teacher
 from core.models import Subject, Class
+from core.synthetic import CHUNK_SIZE, Generator, clear, dump_snapshot, load_snapshot
 from django.db import transaction
 
+# Sizes for the options left out when generating a synthetic catalog
+SCALE_DEFAULTS = {'students': 1000, 'teachers': 50, 'classes': 120}
+
 
 class Command(BaseCommand):
     help = 'Creates sample data for testing the application'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        scale = parser.add_argument_group(
+            'synthetic catalog', 'Any of these replaces the fixed sample with generated data'
+        )
+        scale.add_argument('--students', type=int,
+                           help=f'Students to generate (default: {SCALE_DEFAULTS["students"]})')
+        scale.add_argument('--teachers', type=int,
+                           help=f'Teachers to generate (default: {SCALE_DEFAULTS["teachers"]})')
+        scale.add_argument('--classes', type=int,
+                           help=f'Classes to generate (default: {SCALE_DEFAULTS["classes"]})')
+        scale.add_argument('--enrollment-density', type=float, default=0.75,
+                           help='Share of each class\'s seats to fill (default: 0.75)')
+        scale.add_argument('--seed', type=int,
+                           help='Random seed, for a reproducible catalog')
+        scale.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                           help=f'Rows per bulk insert batch (default: {CHUNK_SIZE})')
+        
+        snapshot = parser.add_argument_group('snapshots (SQLite only)')
+        snapshot.add_argument('--dump-snapshot', metavar='PATH',
+                              help='Copy the database to PATH once the data is created')
+        snapshot.add_argument('--load-snapshot', metavar='PATH',
+                              help='Replace the database with the snapshot at PATH and exit')
+
+    def handle(self, *args, **options):
+        try:
+            if options['load_snapshot']:
+                started = time.perf_counter()
+                load_snapshot(options['load_snapshot'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'Loaded {options["load_snapshot"]} in {time.perf_counter() - started:.2f}s'
+                ))
+                return
+            
+            if any(options[size] is not None for size in SCALE_DEFAULTS):
+                self.create_synthetic(options)
+            else:
+                self.create_sample()
+            
+            if options['dump_snapshot']:
+                dump_snapshot(options['dump_snapshot'])
+                self.stdout.write(self.style.SUCCESS(f'Snapshot written to {options["dump_snapshot"]}'))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def create_synthetic(self, options):
+        sizes = {size: options[size] if options[size] is not None else default
+                 for size, default in SCALE_DEFAULTS.items()}
+        generator = Generator(
+            density=options['enrollment_density'], seed=options['seed'],
+            chunk_size=options['chunk_size'], log=self.stdout.write, **sizes
+        )
+        generator.check()
+        
+        started = time.perf_counter()
+        with transaction.atomic():
+            self.stdout.write('Clearing existing data...')
+            clear()
+            self.stdout.write('Generating catalog...')
+            counts = generator.run()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated in {time.perf_counter() - started:.1f}s: '
+            + ', '.join(f'{count} {name}' for name, count in counts.items())
+        ))
+
+    def create_sample(self):
         self.stdout.write(self.style.SUCCESS('Creating sample data...'))
         
         with transaction.atomic():
@@ -0,0 +1,53 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Student
+from core.matrix import enrollment_matrix
+from core.models import Class
+
+
+class Command(BaseCommand):
+    help = 'Builds the enrollment matrix and reports its size and lookup latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100000,
+                            help='Lookups of each kind (default: 100000)')
+        parser.add_argument('--semester', help='Semester for the student_classes lookups')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        enrollment_matrix.reset()
+        started = time.perf_counter()
+        enrollment_matrix.build()
+        build_ms = (time.perf_counter() - started) * 1000
+        
+        stats = enrollment_matrix.stats()
+        per_million = stats['bytes'] / max(stats['enrollments'], 1) * 1e6
+        self.stdout.write(self.style.SUCCESS(
+            f"Built in {build_ms:.0f} ms: {stats['enrollments']} enrollments, "
+            f"{stats['classes']} classes, {stats['students']} students, "
+            f"{stats['bytes'] / 2**20:.1f} MiB ({per_million / 2**20:.1f} MiB per million enrollments)"
+        ))
+        if not stats['enrollments']:
+            return
+        
+        # Random students against random classes: mostly misses, like real checks
+        rng = random.Random(options['seed'])
+        students = list(Student.objects.values_list('pk', flat=True))
+        classes = list(Class.objects.values_list('pk', flat=True))
+        pairs = [(rng.choice(students), rng.choice(classes)) for _ in range(options['repeat'])]
+        semester = options['semester']
+        lookups = [
+            ('is_enrolled', lambda student, class_id: enrollment_matrix.is_enrolled(student, class_id)),
+            ('roster_size', lambda student, class_id: enrollment_matrix.roster_size(class_id)),
+            ('student_classes', lambda student, class_id: enrollment_matrix.student_classes(student, semester)),
+            ('conflict', lambda student, class_id: enrollment_matrix.conflict(student, class_id)),
+        ]
+        for name, lookup in lookups:
+            started = time.perf_counter()
+            for student, class_id in pairs:
+                lookup(student, class_id)
+            per_lookup_us = (time.perf_counter() - started) / len(pairs) * 1e6
+            self.stdout.write(f'  {name:16} {per_lookup_us:8.2f} us/lookup')
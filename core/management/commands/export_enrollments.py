@@ -0,0 +1,64 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from accounts.models import Teacher
+from core import exports
+
+
+class Command(BaseCommand):
+    help = 'Exports a class roster, a teacher\'s rosters or a semester\'s enrollments as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument('--class', dest='class_id', type=int,
+                           help='Roster of the class with this id')
+        scope.add_argument('--teacher',
+                           help='Rosters of the classes of the teacher with this employee id')
+        scope.add_argument('--semester',
+                           help='Every enrollment of this semester')
+        parser.add_argument('--teacher-semester',
+                            help='With --teacher, only the classes of this semester')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv',
+                            help='Output format (default: csv)')
+        parser.add_argument('--output', '-o',
+                            help='File to write, gzip-compressed if it ends in .gz (default: stdout)')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to export from (default: "default")')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['class_id'] is not None:
+            queryset = exports.class_roster(options['class_id'], using)
+        elif options['teacher']:
+            teacher = Teacher.objects.using(using).filter(employee_id=options['teacher']).first()
+            if teacher is None:
+                raise CommandError(f'Teacher {options["teacher"]} not found')
+            queryset = exports.teacher_rosters(teacher.pk, options['teacher_semester'], using)
+        else:
+            queryset = exports.semester_enrollments(options['semester'], using)
+        
+        path = options['output']
+        if not path:
+            for block in exports.stream(queryset, options['format']):
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
+            return
+        
+        started = time.perf_counter()
+        size = 0
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            with opener(path, 'wb') as f:
+                for block in exports.stream(queryset, options['format']):
+                    f.write(block)
+                    size += len(block)
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {size / 2**20:.1f} MB of {options["format"]} to {path} in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from accounts.importing import read_records
+from core.importing import CHUNK_SIZE, TimetableImporter
+
+# Rejected records listed in the report; the rest are only counted
+SHOWN_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = 'Imports classes and enrollments in bulk from CSV or JSONL files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+',
+                            help='CSV files with a header row, or JSONL files with one object '
+                                 'per line; imported in the order given')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from each file extension)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Records per transaction (default: {CHUNK_SIZE})')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to import into (default: "default")')
+
+    def handle(self, *args, **options):
+        try:
+            importer = TimetableImporter(
+                chunk_size=options['chunk_size'], using=options['database'], log=self.stdout.write,
+            )
+            for path in options['paths']:
+                self.stdout.write(f'Importing {path}')
+                report = importer.run(read_records(path, options['format']))
+                self._report(report)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+    
+    def _report(self, report):
+        for number, message in report.rejected[:SHOWN_ERRORS]:
+            self.stderr.write(f'  record {number}: {message}')
+        if len(report.rejected) > SHOWN_ERRORS:
+            self.stderr.write(f'  ... and {len(report.rejected) - SHOWN_ERRORS} more')
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.records} records in {report.elapsed:.1f}s '
+            f'({report.rate:.0f} records/s): {report.classes} classes and '
+            f'{report.enrollments} enrollments created, {report.existing} already existed, '
+            f'{len(report.rejected)} rejected'
+        ))
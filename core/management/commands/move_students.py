@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core import bulk
+from core.models import Class
+
+
+class Command(BaseCommand):
+    help = 'Moves every student of one class to another in one statement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', type=int, help='Id of the class the students leave')
+        parser.add_argument('target', type=int, help='Id of the class they join')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to update (default: "default")')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        classes = Class.objects.using(using).select_related('subject', 'teacher__user').in_bulk(
+            [options['source'], options['target']]
+        )
+        for pk in (options['source'], options['target']):
+            if pk not in classes:
+                raise CommandError(f'Class {pk} not found')
+        source, target = classes[options['source']], classes[options['target']]
+        try:
+            moved = bulk.move_students(source, target, using)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} students from {source} to {target}'))
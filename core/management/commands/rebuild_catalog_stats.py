@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from core.stats import enrollments_by_semester, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the materialized dashboard statistics from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to rebuild (default: "default")')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        
+        with transaction.atomic(using=using):
+            stats = rebuild(using)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt catalog statistics: {stats.total_classes} active classes, '
+            f'{sum(enrollments_by_semester(using).values())} enrollments'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from core.models import Class
+from core.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the class full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to rebuild (default: "default")')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = get_backend(using)
+        
+        with transaction.atomic(using=using):
+            backend.rebuild()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Class.objects.using(using).count()} classes '
+            f'with {type(backend).__name__}'
+        ))
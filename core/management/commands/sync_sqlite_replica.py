@@ -0,0 +1,39 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import replicas
+
+
+class Command(BaseCommand):
+    help = 'Copies the SQLite primary into the SQLite read replicas (for local testing)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*',
+                            help='Replica aliases to refresh (default: DATABASE_REPLICAS)')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replicas()
+        if not aliases:
+            raise CommandError('No replicas: set DATABASE_REPLICAS or name an alias')
+        
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('The primary is not SQLite; use the database\'s own replication')
+        primary.ensure_connection()
+        
+        for alias in aliases:
+            settings_dict = connections[alias].settings_dict
+            if settings_dict['ENGINE'] != primary.settings_dict['ENGINE']:
+                raise CommandError(f'Replica "{alias}" is not SQLite')
+            connections[alias].close()
+            # Online backup: a consistent snapshot even while the primary is written
+            target = sqlite3.connect(settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(
+                f'Copied {primary.settings_dict["NAME"]} to {alias} ({settings_dict["NAME"]})'
+            ))
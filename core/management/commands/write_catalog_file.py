@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.shared_catalog import CatalogFile, write_catalog_file
+
+
+class Command(BaseCommand):
+    help = 'Writes the memory-mapped catalog file the worker processes share (CATALOG_FILE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            help='File to write (default: settings.CATALOG_FILE)')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.CATALOG_FILE
+        if not path:
+            raise CommandError('Give a path or set CATALOG_FILE')
+        
+        started = time.perf_counter()
+        size = write_catalog_file(path)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with CatalogFile(path) as catalog:
+            self.stdout.write(self.style.SUCCESS(
+                f'Wrote {path} in {elapsed_ms:.0f} ms: {catalog.class_count} active classes, '
+                f'{catalog.subject_count} subjects, {catalog.teacher_count} teachers, '
+                f'{size / 2**20:.1f} MiB'
+            ))
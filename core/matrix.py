@@ -0,0 +1,270 @@
+"""
+Per-process enrollment matrix: who takes which class, in memory.
+
+`enrollment_matrix` holds the roster table twice, as compact arrays
+indexed by primary key:
+
+- per class, an array('i') of its students' ids
+- per student, an array('i') of their classes' ids
+- per class, its semester and schedule day (as small codes into the
+  interned `_semesters` and `_days` lists) and its is_active flag
+
+That is 4 bytes per id in each direction plus one array header per class
+and per student, where a set of Python ints costs over 50 bytes per id.
+A student takes at most one class per day of a semester, so their array
+stays a few ids long and "is enrolled", "roster size", "the student's
+classes this semester" and "the class clashing with this one" are
+answered in constant time, without the database.
+
+The matrix is loaded in bulk from the roster table when a worker starts:
+warm() from config.wsgi and config.asgi, and the read model's load() in
+the gRPC server. After that core.signals applies roster changes
+(m2m_changed), class edits and deletions, and student deletions once
+they commit. The set-based writers that send no signals (core.bulk,
+core.importing, core.synthetic) reset it, and the next lookup reloads
+it, as does the first lookup of a process that did not warm it.
+
+Each process keeps its own copy, current with the writes made in that
+process and, with INVALIDATION_BUS set, in the others (core.bus); without
+the bus the class list reads a student's classes from the database.
+EnrollmentService still checks the rules against the locked rows in the
+database before it writes.
+"""
+import logging
+import sys
+import threading
+from array import array
+
+from django.db import DatabaseError
+
+from .models import Class, schedule_day
+
+logger = logging.getLogger('core.matrix')
+
+NO_CODE = -1
+
+
+def _grow(values, size, fill):
+    """Extend the list or array `values` with `fill` up to `size` items"""
+    missing = size - len(values)
+    if missing > 0:
+        values.extend([fill] * missing)
+
+
+class EnrollmentMatrix:
+    """
+    Thread-safe enrollment matrix. Lookups of classes or students it does
+    not know answer as if they had no enrollments.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._rosters = None  # class pk -> array('i') of student pks, or None
+            self._schedules = []  # student pk -> array('i') of class pks, or None
+            self._semester = array('h')  # class pk -> code in _semesters
+            self._day = array('h')  # class pk -> code in _days
+            self._active = bytearray()  # class pk -> is_active
+            self._semesters, self._days = [], []
+            self._semester_codes, self._day_codes = {}, {}
+            self.enrollments = 0
+
+    @property
+    def is_built(self):
+        return self._rosters is not None
+
+    def build(self):
+        """Load the matrix from the database, replacing what it held"""
+        # Loaded aside and swapped in, so lookups go on meanwhile
+        fresh = EnrollmentMatrix()
+        fresh._rosters = []
+        for pk, semester, schedule, is_active in Class.objects.order_by().values_list(
+            'pk', 'semester', 'schedule', 'is_active'
+        ).iterator():
+            fresh._set_class(pk, semester, schedule, is_active)
+        roster = Class.students.through.objects.order_by('class_id').values_list(
+            'class_id', 'student_id'
+        )
+        fresh._add_pairs(roster.iterator(chunk_size=10000))
+        state = {name: value for name, value in vars(fresh).items() if name != '_lock'}
+        with self._lock:
+            vars(self).update(state)
+
+    def warm(self):
+        """Build now, at worker start, so no request pays for it; never raises"""
+        try:
+            self.build()
+        except DatabaseError:
+            # Not migrated yet, say; the first lookup tries again
+            logger.exception('Enrollment matrix: loading at startup failed')
+
+    def ensure_built(self):
+        if self._rosters is None:
+            with self._lock:
+                if self._rosters is None:
+                    self.build()
+
+    # Storage
+
+    @staticmethod
+    def _code(values, codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def _known(self, class_id):
+        return class_id < len(self._semester) and self._semester[class_id] != NO_CODE
+
+    def _set_class(self, pk, semester, schedule, is_active):
+        size = pk + 1
+        _grow(self._rosters, size, None)
+        _grow(self._semester, size, NO_CODE)
+        _grow(self._day, size, NO_CODE)
+        _grow(self._active, size, 0)
+        if self._rosters[pk] is None:
+            self._rosters[pk] = array('i')
+        self._semester[pk] = self._code(self._semesters, self._semester_codes, semester)
+        self._day[pk] = self._code(self._days, self._day_codes, schedule_day(schedule))
+        self._active[pk] = bool(is_active)
+
+    def _add_pairs(self, pairs):
+        rosters, schedules = self._rosters, self._schedules
+        for class_id, student_id in pairs:
+            roster = rosters[class_id] if class_id < len(rosters) else None
+            if roster is None:
+                # Deleted since, or never seen: nothing to file it under
+                continue
+            if student_id >= len(schedules):
+                _grow(schedules, student_id + 1, None)
+            classes = schedules[student_id]
+            if classes is None:
+                classes = schedules[student_id] = array('i')
+            elif class_id in classes:
+                continue
+            classes.append(class_id)
+            roster.append(student_id)
+            self.enrollments += 1
+
+    def _remove_pairs(self, pairs):
+        rosters, schedules = self._rosters, self._schedules
+        for class_id, student_id in pairs:
+            classes = schedules[student_id] if student_id < len(schedules) else None
+            if classes is None or class_id not in classes:
+                continue
+            classes.remove(class_id)
+            rosters[class_id].remove(student_id)
+            self.enrollments -= 1
+
+    def _classes_of(self, student_id):
+        schedules = self._schedules
+        classes = schedules[student_id] if student_id < len(schedules) else None
+        return classes or ()
+
+    def _roster_of(self, class_id):
+        rosters = self._rosters
+        roster = rosters[class_id] if class_id < len(rosters) else None
+        return roster or ()
+
+    # Updates, from core.signals; ignored until the matrix is built
+
+    def add(self, pairs):
+        """Record the (class pk, student pk) enrollments in `pairs`"""
+        with self._lock:
+            if self.is_built:
+                self._add_pairs(pairs)
+
+    def remove(self, pairs):
+        """Forget the (class pk, student pk) enrollments in `pairs`"""
+        with self._lock:
+            if self.is_built:
+                self._remove_pairs(pairs)
+
+    def update_class(self, class_obj):
+        with self._lock:
+            if self.is_built:
+                self._set_class(class_obj.pk, class_obj.semester, class_obj.schedule,
+                                class_obj.is_active)
+
+    def remove_class(self, class_id):
+        with self._lock:
+            if not self.is_built or not self._known(class_id):
+                return
+            self._remove_pairs([(class_id, student_id) for student_id in self._roster_of(class_id)])
+            self._rosters[class_id] = None
+            self._semester[class_id] = self._day[class_id] = NO_CODE
+            self._active[class_id] = 0
+
+    def remove_student(self, student_id):
+        with self._lock:
+            if self.is_built:
+                self._remove_pairs([(class_id, student_id)
+                                    for class_id in self._classes_of(student_id)])
+
+    # Lookups
+
+    def is_enrolled(self, student_id, class_id):
+        self.ensure_built()
+        with self._lock:
+            return class_id in self._classes_of(student_id)
+
+    def roster_size(self, class_id):
+        self.ensure_built()
+        with self._lock:
+            return len(self._roster_of(class_id))
+
+    def roster(self, class_id):
+        """The pks of the class's students"""
+        self.ensure_built()
+        with self._lock:
+            return list(self._roster_of(class_id))
+
+    def student_classes(self, student_id, semester=None):
+        """The pks of the student's classes, of `semester` if given"""
+        self.ensure_built()
+        with self._lock:
+            classes = self._classes_of(student_id)
+            if semester is None:
+                return list(classes)
+            code = self._semester_codes.get(semester)
+            return [pk for pk in classes if self._semester[pk] == code]
+
+    def conflict(self, student_id, class_id):
+        """
+        The pk of the student's active class on the same day of the same
+        semester as class `class_id` (EnrollmentService's schedule
+        conflict), or None
+        """
+        self.ensure_built()
+        with self._lock:
+            if not self._known(class_id):
+                return None
+            semester, day = self._semester[class_id], self._day[class_id]
+            for pk in self._classes_of(student_id):
+                if (pk != class_id and self._active[pk] and self._semester[pk] == semester
+                        and self._day[pk] == day):
+                    return pk
+            return None
+
+    def stats(self):
+        self.ensure_built()
+        with self._lock:
+            rosters = [roster for roster in self._rosters if roster is not None]
+            schedules = [classes for classes in self._schedules if classes is not None]
+            size = sum(map(sys.getsizeof, (
+                self._rosters, self._schedules, self._semester, self._day, self._active,
+            )))
+            size += sum(map(sys.getsizeof, rosters)) + sum(map(sys.getsizeof, schedules))
+            return {
+                'enrollments': self.enrollments,
+                'classes': len(rosters),
+                'students': len(schedules),
+                'bytes': size,
+            }
+
+
+enrollment_matrix = EnrollmentMatrix()
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.template import TemplateDoesNotExist
 from django.shortcuts import render
 from django.utils.deprecation import MiddlewareMixin
+from .query_budget import check_budget, ignore_frames_from, record_queries
+from .routers import routing_scope
 import os
 
 
@@ -22,4 +25,68 @@ class TemplateAutoCreateMiddleware(MiddlewareMixin):
                     'message': f'Template "{template_name}" not found. Using fallback.'
                 }, status=200)
         
-        return None
\ No newline at end of file
+        return None
+
+ignore_frames_from(__file__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries each request runs and checks them against the
+    per-view budget in settings.QUERY_BUDGETS (see core.query_budget)
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        
+        match = request.resolver_match
+        if match is not None:
+            check_budget(self.budget_name(request, match), recorder)
+        return response
+    
+    @staticmethod
+    def budget_name(request, match):
+        """
+        The view name; for an admin action, which POSTs to the changelist,
+        the action as well, e.g. 'admin:core_class_changelist:move_students';
+        for an API GET with ?expand=, '<view>:expand' if that has a budget
+        of its own, e.g. 'api:teacher-detail:expand'
+        """
+        if (request.method == 'POST' and match.namespace == 'admin'
+                and match.url_name.endswith('_changelist') and request.POST.get('action')):
+            return f"{match.view_name}:{request.POST['action']}"
+        if request.method == 'GET' and request.GET.get('expand'):
+            expanded = f'{match.view_name}:expand'
+            if expanded in getattr(settings, 'QUERY_BUDGETS', {}):
+                return expanded
+        return match.view_name
+
+
+class PrimaryPinMiddleware:
+    """
+    Runs each request in its own core.routers.routing_scope(). When a
+    request writes, a short-lived cookie pins the client's next requests
+    to the primary as well, so the redirect after enrolling shows the
+    enrollment even if the replicas lag behind.
+    """
+    
+    cookie_name = 'db_primary'
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        pinned = self.cookie_name in request.COOKIES
+        with routing_scope(pinned) as state:
+            response = self.get_response(request)
+        
+        if state.wrote:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,77 @@
+from django.db import migrations
+
+# The search table as this migration creates it; core.search maintains it
+# afterwards. Kept here rather than imported, so later changes to that
+# module leave the migration history alone.
+DOCUMENT_FROM = """
+    FROM core_class c
+    JOIN core_subject s ON s.id = c.subject_id
+    JOIN accounts_teacher t ON t.id = c.teacher_id
+    JOIN auth_user u ON u.id = t.user_id
+"""
+
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_class_search USING fts5("
+    "subject_code, subject_name, teacher_name, room, subject_description, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+SQLITE_FILL = (
+    "INSERT OR REPLACE INTO core_class_search "
+    "(rowid, subject_code, subject_name, teacher_name, room, subject_description) "
+    "SELECT c.id, s.code, s.name, u.first_name || ' ' || u.last_name, c.room, s.description"
+    + DOCUMENT_FROM
+)
+
+POSTGRES_CREATE = [
+    "CREATE TABLE IF NOT EXISTS core_class_search ("
+    "class_id bigint PRIMARY KEY REFERENCES core_class (id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS core_class_search_document "
+    "ON core_class_search USING GIN (document)",
+]
+POSTGRES_FILL = (
+    "INSERT INTO core_class_search (class_id, document) SELECT c.id, "
+    "setweight(to_tsvector('simple', coalesce(s.code, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(s.name, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(u.first_name || ' ' || u.last_name, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(c.room, '')), 'D') || "
+    "setweight(to_tsvector('simple', coalesce(s.description, '')), 'D')"
+    + DOCUMENT_FROM
+)
+
+
+def _vendor(connection):
+    """'sqlite' or 'postgresql' when the database can hold the index, else None"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return 'sqlite' if cursor.fetchone()[0] else None
+    return connection.vendor if connection.vendor == 'postgresql' else None
+
+
+def create_search_index(apps, schema_editor):
+    vendor = _vendor(schema_editor.connection)
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_FILL)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement)
+        schema_editor.execute(POSTGRES_FILL)
+
+
+def drop_search_index(apps, schema_editor):
+    if _vendor(schema_editor.connection):
+        schema_editor.execute('DROP TABLE IF EXISTS core_class_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0 on 2026-10-19 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_class_search_index'),
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_classes', models.IntegerField(default=0)),
+                ('total_students', models.IntegerField(default=0)),
+                ('total_teachers', models.IntegerField(default=0)),
+                ('total_subjects', models.IntegerField(default=0)),
+                ('semesters', models.JSONField(default=dict)),
+                ('popular_classes', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Catalog statistics',
+            },
+        ),
+    ]
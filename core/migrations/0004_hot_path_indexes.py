@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-19 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_name_index'),
+        ('core', '0003_catalog_statistics'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='class',
+            options={'ordering': ['-semester', 'subject__code', 'pk'], 'verbose_name_plural': 'Classes'},
+        ),
+        migrations.AddIndex(
+            model_name='class',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['semester'], name='core_class_active_semester'),
+        ),
+        # The auto-created roster table only indexes each column on its own;
+        # (student_id, class_id) answers "a student's classes" from the index
+        migrations.RunSQL(
+            'CREATE INDEX core_class_students_student_class '
+            'ON core_class_students (student_id, class_id)',
+            'DROP INDEX core_class_students_student_class',
+        ),
+    ]
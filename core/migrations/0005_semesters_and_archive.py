@@ -0,0 +1,70 @@
+# Generated by Django 5.0 on 2026-10-19 13:30
+
+import core.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The codes Class.semester used to offer as choices
+INITIAL_SEMESTERS = ['2024.1', '2024.2', '2025.1', '2025.2']
+
+
+def create_semesters(apps, schema_editor):
+    Class = apps.get_model('core', 'Class')
+    Semester = apps.get_model('core', 'Semester')
+    db = schema_editor.connection.alias
+    used = Class.objects.using(db).order_by().values_list('semester', flat=True).distinct()
+    Semester.objects.using(db).bulk_create(
+        [Semester(code=code) for code in sorted(set(INITIAL_SEMESTERS) | set(used))]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_name_index'),
+        ('core', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Semester',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(help_text='e.g., 2025.1', max_length=10, unique=True)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('closed', 'Closed'), ('archived', 'Archived')], default='open', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-code'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='class',
+            name='semester',
+            field=models.CharField(default='2025.1', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='ArchivedClass',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('schedule', models.CharField(max_length=100)),
+                ('room', models.CharField(blank=True, max_length=50)),
+                ('semester', models.CharField(db_index=True, max_length=10)),
+                ('max_students', models.IntegerField()),
+                ('is_active', models.BooleanField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('students', models.ManyToManyField(blank=True, related_name='archived_classes', to='accounts.student')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_classes', to='core.subject')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_classes', to='accounts.teacher')),
+            ],
+            options={
+                'verbose_name_plural': 'Archived classes',
+                'ordering': ['-semester', 'subject__code', 'pk'],
+            },
+            bases=(core.models.ClassInfoMixin, models.Model),
+        ),
+        migrations.RunPython(create_semesters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0 on 2026-10-19 15:00
+
+from django.db import migrations, models
+
+
+def copy_semesters(apps, schema_editor):
+    CatalogStatistics = apps.get_model('core', 'CatalogStatistics')
+    SemesterStatistics = apps.get_model('core', 'SemesterStatistics')
+    db = schema_editor.connection.alias
+    row = CatalogStatistics.objects.using(db).filter(pk=1).first()
+    if row is not None:
+        SemesterStatistics.objects.using(db).bulk_create([
+            SemesterStatistics(semester=semester, classes=counts['classes'],
+                               enrollments=counts['enrollments'])
+            for semester, counts in row.semesters.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_semesters_and_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SemesterStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.CharField(max_length=10, unique=True)),
+                ('classes', models.IntegerField(default=0)),
+                ('enrollments', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Semester statistics',
+            },
+        ),
+        migrations.RunPython(copy_semesters, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='catalogstatistics',
+            name='semesters',
+        ),
+    ]
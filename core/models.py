@@ -1,8 +1,124 @@
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, MaxValueValidator
 from accounts.models import Teacher, Student
 
 
+def count_subquery(queryset, column):
+    """
+    Correlated `SELECT COUNT(*) ... WHERE column = outer.pk`, 0 when empty.
+
+    Unlike Count() over a join this adds no GROUP BY, so it keeps
+    Meta.ordering, composes with filters across the same relation and
+    works under select_for_update().
+    """
+    counted = queryset.filter(**{column: OuterRef('pk')}).order_by().values(column)
+    return Coalesce(Subquery(counted.annotate(n=Count('*')).values('n')), 0)
+
+
+def schedule_day(schedule):
+    """The day EnrollmentService compares for conflicts ("MON 14:00-16:00" -> "MON")"""
+    return schedule.split()[0] if schedule else ''
+
+
+class SubjectQuerySet(models.QuerySet):
+
+    def with_stats(self):
+        """Annotate class_count"""
+        return self.annotate(class_count=count_subquery(Class.objects.all(), 'subject'))
+
+
+class ClassQuerySet(models.QuerySet):
+    """Shared by Class and ArchivedClass"""
+
+    def with_stats(self):
+        """
+        Annotate student_count, which enrolled_count, available_seats and
+        is_full read instead of counting per row
+        """
+        if 'student_count' in self.query.annotations:
+            return self
+        students = self.model._meta.get_field('students')
+        return self.annotate(
+            student_count=count_subquery(
+                students.remote_field.through.objects.all(), students.m2m_column_name()
+            )
+        )
+
+    def open_seats_only(self):
+        return self.with_stats().filter(student_count__lt=F('max_students'))
+
+    def for_student(self, student):
+        """Classes `student` (a Student or its id) is enrolled in"""
+        return self.filter(students=student)
+
+    def for_teacher(self, teacher):
+        """Classes taught by `teacher` (a Teacher or its id)"""
+        return self.filter(teacher=teacher)
+
+
+class ClassManager(models.Manager.from_queryset(ClassQuerySet)):
+    """
+    Class.objects only holds the classes of semesters that are not archived;
+    for_semester() also reaches the archive tables.
+    """
+
+    def for_semester(self, semester):
+        """Classes of `semester`, from ArchivedClass once it is archived"""
+        archived = Semester.objects.using(self.db).filter(
+            code=semester, status=Semester.ARCHIVED
+        ).exists()
+        manager = ArchivedClass.objects.db_manager(self.db) if archived else self
+        return manager.filter(semester=semester)
+
+
+class SemesterQuerySet(models.QuerySet):
+
+    def open(self):
+        return self.filter(status=Semester.OPEN)
+
+    def archived(self):
+        return self.filter(status=Semester.ARCHIVED)
+
+
+class Semester(models.Model):
+    """
+    An academic term. New classes go into open semesters; a closed one is
+    over and waits for `manage.py archive_semesters` to move its classes to
+    the archive tables.
+    """
+    OPEN = 'open'
+    CLOSED = 'closed'
+    ARCHIVED = 'archived'
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (CLOSED, 'Closed'),
+        (ARCHIVED, 'Archived'),
+    ]
+    
+    code = models.CharField(max_length=10, unique=True, help_text="e.g., 2025.1")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = SemesterQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['-code']
+    
+    def __str__(self):
+        return self.code
+    
+    @property
+    def is_open(self):
+        return self.status == self.OPEN
+    
+    @property
+    def is_archived(self):
+        return self.status == self.ARCHIVED
+
+
 class Subject(models.Model):
     code = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=200)
@@ -11,6 +127,8 @@ class Subject(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = SubjectQuerySet.as_manager()
+    
     class Meta:
         ordering = ['code']
     
@@ -18,50 +136,120 @@ class Subject(models.Model):
         return f"{self.code} - {self.name}"
 
 
-class Class(models.Model):
-    SEMESTER_CHOICES = [
-        ('2024.1', '2024.1'),
-        ('2024.2', '2024.2'),
-        ('2025.1', '2025.1'),
-        ('2025.2', '2025.2'),
-    ]
+class ClassInfoMixin:
+    """What the templates read from a class, live or archived"""
+    is_archived = False
+    
+    def __str__(self):
+        return f"{self.subject.code} - {self.teacher.user.last_name} ({self.semester})"
+    
+    @property
+    def enrolled_count(self):
+        # Querysets from with_stats() skip the per-row COUNT
+        if hasattr(self, 'student_count'):
+            return self.student_count
+        return self.students.count()
     
+    @property
+    def available_seats(self):
+        return self.max_students - self.enrolled_count
+    
+    @property
+    def is_full(self):
+        return self.enrolled_count >= self.max_students
+
+
+class Class(ClassInfoMixin, models.Model):
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='classes')
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='classes')
     students = models.ManyToManyField(Student, related_name='enrolled_classes', blank=True)
     
     schedule = models.CharField(max_length=100, help_text="e.g., MON 14:00-16:00")
     room = models.CharField(max_length=50, blank=True)
-    semester = models.CharField(max_length=10, choices=SEMESTER_CHOICES, default='2025.1')
+    # A Semester code; kept as text so archiving never rewrites class rows
+    semester = models.CharField(max_length=10, default='2025.1')
     max_students = models.IntegerField(default=40, validators=[MinValueValidator(1)])
     
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ClassManager()
+    
     class Meta:
-        ordering = ['-semester', 'subject__code']
+        ordering = ['-semester', 'subject__code', 'pk']
         verbose_name_plural = 'Classes'
         unique_together = ['subject', 'teacher', 'schedule', 'semester']
+        indexes = [
+            # Every list path filters on active classes, most by semester too.
+            # Partial rather than (semester, is_active): SQLite renders
+            # is_active=True as a bare column, which only a partial index matches.
+            models.Index(fields=['semester'], condition=models.Q(is_active=True),
+                         name='core_class_active_semester'),
+        ]
+
+
+class ArchivedClass(ClassInfoMixin, models.Model):
+    """
+    A class of an archived semester, moved out of Class (and its roster
+    out of Class.students) by core.archive. It keeps the pk it had as a
+    Class, so links to it keep working.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='archived_classes')
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='archived_classes')
+    students = models.ManyToManyField(Student, related_name='archived_classes', blank=True)
     
-    def __str__(self):
-        return f"{self.subject.code} - {self.teacher.user.last_name} ({self.semester})"
+    schedule = models.CharField(max_length=100)
+    room = models.CharField(max_length=50, blank=True)
+    semester = models.CharField(max_length=10, db_index=True)
+    max_students = models.IntegerField()
     
-    @property
-    def enrolled_count(self):
-        return self.students.count()
+    is_active = models.BooleanField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
     
-    @property
-    def available_seats(self):
-        return self.max_students - self.enrolled_count
+    objects = ClassQuerySet.as_manager()
     
-    @property
-    def is_full(self):
-        return self.enrolled_count >= self.max_students
+    is_archived = True
     
-    def can_enroll(self, student):
-        if self.is_full:
-            return False, "Class is full"
-        if student in self.students.all():
-            return False, "Already enrolled"
-        return True, "Can enroll"
\ No newline at end of file
+    class Meta:
+        ordering = ['-semester', 'subject__code', 'pk']
+        verbose_name_plural = 'Archived classes'
+
+
+class CatalogStatistics(models.Model):
+    """
+    Materialized dashboard figures, kept in a single row (pk=1).
+
+    core.signals applies each committed change to the row and to
+    SemesterStatistics through core.stats; `manage.py rebuild_catalog_stats`
+    recomputes both from the tables.
+    """
+    total_classes = models.IntegerField(default=0)  # active classes only
+    total_students = models.IntegerField(default=0)
+    total_teachers = models.IntegerField(default=0)
+    total_subjects = models.IntegerField(default=0)
+    # Top active classes by enrollment, best first (see core.stats.POPULAR_CLASSES)
+    popular_classes = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Catalog statistics'
+    
+    def __str__(self):
+        return f"Catalog statistics ({self.updated_at:%Y-%m-%d %H:%M})"
+
+
+class SemesterStatistics(models.Model):
+    """Per-semester dashboard figures, one row per semester (see CatalogStatistics)"""
+    semester = models.CharField(max_length=10, unique=True)
+    classes = models.IntegerField(default=0)  # active classes only
+    enrollments = models.IntegerField(default=0)  # students of those classes
+    
+    class Meta:
+        verbose_name_plural = 'Semester statistics'
+    
+    def __str__(self):
+        return f"{self.semester}: {self.classes} classes, {self.enrollments} enrollments"
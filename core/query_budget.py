@@ -0,0 +1,126 @@
+"""
+Per-request query counting, N+1 detection and query budgets.
+
+QueryRecorder is installed with connection.execute_wrapper() around a
+request (QueryBudgetMiddleware) or an RPC (QueryBudgetInterceptor). It
+counts queries, groups them by SQL shape and remembers the project frame
+that issued each shape, so repeated shapes can be reported as N+1.
+
+Settings:
+    QUERY_BUDGETS                   {view name: max queries}, e.g. 'classes:list',
+                                    'grpc:ListClasses' or, for an admin action,
+                                    'admin:core_class_changelist:move_students'
+    QUERY_BUDGET_DEFAULT            budget for views not listed (None = unlimited)
+    QUERY_BUDGET_NPLUSONE_THRESHOLD repeats of one shape reported as N+1
+    QUERY_BUDGET_STRICT             raise QueryBudgetExceeded instead of logging
+"""
+import logging
+import os
+import re
+import sys
+import sysconfig
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.query_budget')
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_SKIP_PATHS = {
+    sysconfig.get_paths()['stdlib'],
+    sysconfig.get_paths()['purelib'],
+    sysconfig.get_paths()['platlib'],
+    os.path.abspath(__file__),
+}
+
+
+def ignore_frames_from(path):
+    """Exclude a module (e.g. a middleware wrapping the request) from origins"""
+    _SKIP_PATHS.add(os.path.abspath(path))
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    """execute_wrapper that counts queries and groups them by SQL shape"""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        shape = _IN_LIST.sub('IN (...)', sql)
+        origins = self.shapes.get(shape)
+        if origins is None:
+            origins = self.shapes[shape] = Counter()
+        origins[_origin_frame()] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """
+        [(count, origin, sql)] for shapes issued at least `threshold` times,
+        with the frame that issued most of them
+        """
+        result = []
+        for shape, origins in self.shapes.items():
+            count = sum(origins.values())
+            if count >= threshold:
+                result.append((count, origins.most_common(1)[0][0], shape))
+        return sorted(result, reverse=True)
+
+
+def _origin_frame():
+    """First stack frame outside Django, third-party packages and this module"""
+    skip = tuple(_SKIP_PATHS)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(skip) and not filename.startswith('<'):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+@contextmanager
+def record_queries():
+    """Record queries on every configured database for the enclosed block"""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def get_budget(view_name):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+
+
+def check_budget(view_name, recorder):
+    """
+    Log (or raise, when QUERY_BUDGET_STRICT is set) if the view went over
+    its budget, and log repeated query shapes as likely N+1 patterns
+    """
+    threshold = getattr(settings, 'QUERY_BUDGET_NPLUSONE_THRESHOLD', 5)
+    repeated = recorder.repeated(threshold)
+    for count, origin, sql in repeated:
+        logger.warning('Possible N+1 in %s: %d x %s (from %s)', view_name, count, sql[:200], origin)
+
+    budget = get_budget(view_name)
+    if budget is None or recorder.count <= budget:
+        return
+
+    message = f'{view_name} ran {recorder.count} queries (budget {budget})'
+    if repeated:
+        message += '; repeated: ' + '; '.join(
+            f'{count} x {sql[:120]} (from {origin})' for count, origin, sql in repeated
+        )
+    if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -0,0 +1,229 @@
+"""
+Cached reference data: subjects, teachers' display info and semesters.
+
+The class forms and the class list show the same few thousand rows,
+which rarely change. reference_data serves them from two tiers:
+
+- local: a dict in each process, holding the ready-built records of a
+  dataset for REFDATA_LOCAL_TTL seconds; a hit is a dict lookup
+- shared, optional: the cache alias REFDATA_SHARED_CACHE (a
+  FileBasedCache, or RedisCache on Redis or a compatible local server),
+  so a process whose local entry expired reloads it from there instead
+  of the database. Entries are keyed by a version kept in that cache, as
+  in core.caching, and live REFDATA_SHARED_TTL seconds
+
+A miss in both reads the whole table in one query. Once a write to a
+subject, teacher (or a teacher's user) or semester commits, core.signals
+calls changed(), which drops the local entry and bumps the shared
+version, and core.bus drops the local entries of the other processes.
+Writes no signal sees, such as QuerySet.update() or a teacher's e-mail
+address, age out with the TTLs. The records may therefore be stale: they
+are for choices and display, and business rules (ClassService) check the
+database.
+
+SubjectInfo and TeacherInfo have the fields of the change feed payloads
+(backend_service.feed). stats() counts the hits of each tier and the
+misses per dataset.
+"""
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from accounts.models import Teacher
+from .models import Semester, Subject
+
+PREFIX = 'refdata'
+
+SubjectInfo = namedtuple('SubjectInfo', ['id', 'code', 'name', 'description', 'credits'])
+TeacherInfo = namedtuple('TeacherInfo', ['id', 'employee_id', 'full_name', 'specialization',
+                                         'email'])
+
+
+class SemesterInfo(namedtuple('SemesterInfo', ['code', 'status'])):
+    __slots__ = ()
+
+    @property
+    def is_open(self):
+        return self.status == Semester.OPEN
+
+    @property
+    def is_archived(self):
+        return self.status == Semester.ARCHIVED
+
+
+def load_subjects():
+    return [SubjectInfo(*row) for row in Subject.objects.order_by('code').values_list(
+        'id', 'code', 'name', 'description', 'credits'
+    )]
+
+
+def load_teachers():
+    # Teacher's Meta.ordering; the name as Teacher.full_name builds it
+    return [
+        TeacherInfo(pk, employee_id, f'{first} {last}'.strip() or username, specialization, email)
+        for pk, employee_id, first, last, username, specialization, email in (
+            Teacher.objects.values_list(
+                'id', 'employee_id', 'user__first_name', 'user__last_name', 'user__username',
+                'specialization', 'user__email'
+            )
+        )
+    ]
+
+
+def load_semesters():
+    return [SemesterInfo(*row) for row in Semester.objects.order_by('code').values_list(
+        'code', 'status'
+    )]
+
+
+# name -> (loader, field the records are looked up by)
+DATASETS = {
+    'subjects': (load_subjects, 'id'),
+    'teachers': (load_teachers, 'id'),
+    'semesters': (load_semesters, 'code'),
+}
+# core.bus model -> the datasets its changes affect
+MODEL_DATASETS = {
+    'subject': ['subjects'],
+    'teacher': ['teachers'],
+    'semester': ['semesters'],
+}
+
+
+class ReferenceData:
+    """Thread-safe; the records are namedtuples, shared by every caller"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop the local tier and the counts"""
+        with self._lock:
+            self._local = {}  # name -> (expires_at, records, {key: record})
+            # Bumped on each invalidation, so a load that raced one is not kept
+            self._generations = dict.fromkeys(DATASETS, 0)
+            self.counts = {name: {'local': 0, 'shared': 0, 'miss': 0, 'invalidated': 0}
+                           for name in DATASETS}
+
+    @staticmethod
+    def _shared():
+        alias = settings.REFDATA_SHARED_CACHE
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def _version_key(name):
+        return f'{PREFIX}:v:{name}'
+
+    def _count(self, name, tier):
+        with self._lock:
+            self.counts[name][tier] += 1
+
+    def _dataset(self, name):
+        """(records, index) of dataset `name`, from the first tier holding it"""
+        entry = self._local.get(name)
+        if entry is not None and entry[0] > time.monotonic():
+            self._count(name, 'local')
+            return entry[1], entry[2]
+
+        generation = self._generations[name]
+        shared, records = self._shared(), None
+        if shared is not None:
+            version_key = self._version_key(name)
+            version = shared.get(version_key)
+            if version is None:
+                # add() keeps a version another process created in the meantime
+                shared.add(version_key, uuid.uuid4().hex[:12], timeout=None)
+                version = shared.get(version_key)
+            key = f'{PREFIX}:{name}:{version}'
+            records = shared.get(key)
+        if records is not None:
+            self._count(name, 'shared')
+        else:
+            self._count(name, 'miss')
+            loader, _ = DATASETS[name]
+            records = loader()
+            if shared is not None:
+                shared.set(key, records, settings.REFDATA_SHARED_TTL)
+
+        field = DATASETS[name][1]
+        index = {getattr(record, field): record for record in records}
+        with self._lock:
+            if self._generations[name] == generation:
+                self._local[name] = (time.monotonic() + settings.REFDATA_LOCAL_TTL, records, index)
+        return records, index
+
+    def _get(self, name, key):
+        return self._dataset(name)[1].get(key)
+
+    @staticmethod
+    def _pk(value):
+        # Form and gRPC input: '3', 3 or garbage
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    # Lookups
+
+    def subjects(self):
+        """Every SubjectInfo, by code"""
+        return self._dataset('subjects')[0]
+
+    def subject(self, pk):
+        return self._get('subjects', self._pk(pk))
+
+    def teachers(self):
+        """Every TeacherInfo, by name"""
+        return self._dataset('teachers')[0]
+
+    def teacher(self, pk):
+        return self._get('teachers', self._pk(pk))
+
+    def semesters(self, status=None):
+        """Every SemesterInfo (with `status`), by code"""
+        records = self._dataset('semesters')[0]
+        if status is None:
+            return records
+        return [semester for semester in records if semester.status == status]
+
+    def semester(self, code):
+        return self._get('semesters', code)
+
+    # Invalidation
+
+    def invalidate(self, name, shared=True):
+        """Drop dataset `name` locally and, with `shared`, from the shared tier"""
+        with self._lock:
+            self._local.pop(name, None)
+            self._generations[name] += 1
+            self.counts[name]['invalidated'] += 1
+        cache = self._shared() if shared else None
+        if cache is not None:
+            cache.set(self._version_key(name), uuid.uuid4().hex[:12], timeout=None)
+
+    def changed(self, model, shared=True):
+        """Invalidate what a committed change to a `model` (a core.bus model name) affects"""
+        for name in MODEL_DATASETS.get(model, ()):
+            self.invalidate(name, shared)
+
+    def clear(self, shared=False):
+        """Drop every dataset locally and, with `shared`, from the shared tier"""
+        for name in DATASETS:
+            self.invalidate(name, shared)
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for name, counts in self.counts.items():
+                lookups = counts['local'] + counts['shared'] + counts['miss']
+                stats[name] = dict(counts, hit_ratio=(lookups - counts['miss']) / lookups
+                                   if lookups else None)
+            return stats
+
+
+reference_data = ReferenceData()
@@ -0,0 +1,90 @@
+"""
+Primary/replica database routing.
+
+Writes go to the primary ('default'). Reads go to one of the aliases in
+settings.DATABASE_REPLICAS, except:
+
+- inside a transaction on the primary, so locked rows and the checks
+  made before writing them are consistent
+- once the current request or gRPC call has written, so it reads its own
+  writes (see routing_scope())
+- for REPLICA_PIN_SECONDS after a client's request wrote, so the page
+  that follows a POST does not race replication (PrimaryPinMiddleware)
+
+With DATABASE_REPLICAS empty every query uses 'default', as before.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RoutingState:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def current_state():
+    state = _state.get()
+    if state is None:
+        # Outside routing_scope() (shell, management commands): the pin
+        # lasts for the rest of the thread
+        state = RoutingState()
+        _state.set(state)
+    return state
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """
+    Route one request or RPC. Pool threads serve many of them, so what a
+    scope pins must not leak into the next one.
+    """
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        state = current_state()
+        if state.pinned or state.wrote:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        if replicas():
+            current_state().wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the primary's schema through replication
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,342 @@
+"""
+Full-text search over classes.
+
+Each class gets one document built from its subject code, name and
+description, its teacher's name and its room. Backends keep those
+documents in a side table and answer queries with class ids, best match
+first:
+
+- SQLiteFTSBackend: an FTS5 virtual table ranked with bm25()
+- PostgresSearchBackend: a weighted tsvector column with a GIN index,
+  ranked with ts_rank()
+- FallbackBackend: the old icontains scan, for databases without either
+
+Words in a query are ANDed and each one matches as a prefix, so "cs2"
+finds CS201 and "data str" finds Data Structures.
+
+The table is created by migration core.0002 and kept in sync by
+core.signals; `manage.py rebuild_search_index` repopulates it.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'core_class_search'
+# Matches ordered by rank in filter(); the others follow by id
+RANKED_MATCHES = 100
+
+# (column, document expression, weight): the SQL joins core_class c,
+# core_subject s and auth_user u (the teacher's user)
+DOCUMENT_COLUMNS = [
+    ('subject_code', 's.code', 10.0),
+    ('subject_name', 's.name', 5.0),
+    ('teacher_name', "u.first_name || ' ' || u.last_name", 3.0),
+    ('room', 'c.room', 2.0),
+    ('subject_description', 's.description', 1.0),
+]
+
+DOCUMENT_FROM = """
+    FROM core_class c
+    JOIN core_subject s ON s.id = c.subject_id
+    JOIN accounts_teacher t ON t.id = c.teacher_id
+    JOIN auth_user u ON u.id = t.user_id
+"""
+
+_backends = {}
+
+
+def search_terms(query):
+    """The words of `query`, lowercased; punctuation never reaches the SQL"""
+    return re.findall(r'\w+', query.lower())
+
+
+class SearchBackend:
+    vendor = None
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def install(self, schema_editor):
+        """Create the search table (called from the migration)"""
+
+    def uninstall(self, schema_editor):
+        """Drop the search table"""
+
+    def rebuild(self):
+        """Reindex every class"""
+
+    def index_classes(self, class_ids):
+        """(Re)index the given classes"""
+
+    def remove_classes(self, class_ids):
+        """Drop the given classes from the index"""
+
+    def search(self, query, limit=None):
+        """Matching class ids, best first"""
+        raise NotImplementedError
+
+    def matches(self, terms):
+        """(SQL selecting the ids of the classes matching every term, params)"""
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """
+        `queryset` narrowed to classes matching `query`: the best
+        RANKED_MATCHES first, then the others by id
+        """
+        terms = search_terms(query)
+        if not terms:
+            return queryset
+        best = self.search(query, limit=RANKED_MATCHES)
+        if not best:
+            return queryset.none()
+        # The matches stay a subquery, so a common word binds no more
+        # parameters than a rare one
+        rank = Case(
+            *(When(pk=pk, then=Value(position)) for position, pk in enumerate(best)),
+            default=Value(len(best)), output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=RawSQL(*self.matches(terms))).order_by(rank, 'pk')
+
+    def _in_clause(self, class_ids):
+        return ', '.join(['%s'] * len(class_ids))
+
+
+class SQLiteFTSBackend(SearchBackend):
+    vendor = 'sqlite'
+
+    def install(self, schema_editor):
+        columns = ', '.join(name for name, _, _ in DOCUMENT_COLUMNS)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"{columns}, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def _insert(self, cursor, where='', params=()):
+        # The rowid is the class id, so OR REPLACE reindexes in one statement
+        columns = ', '.join(name for name, _, _ in DOCUMENT_COLUMNS)
+        expressions = ', '.join(expression for _, expression, _ in DOCUMENT_COLUMNS)
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, {columns}) '
+            f'SELECT c.id, {expressions} {DOCUMENT_FROM} {where}',
+            params
+        )
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            self._insert(cursor)
+
+    def index_classes(self, class_ids):
+        class_ids = list(class_ids)
+        if not class_ids:
+            return
+        with self.connection.cursor() as cursor:
+            self._insert(cursor, f'WHERE c.id IN ({self._in_clause(class_ids)})', class_ids)
+
+    def remove_classes(self, class_ids):
+        class_ids = list(class_ids)
+        if not class_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({self._in_clause(class_ids)})',
+                class_ids
+            )
+
+    @staticmethod
+    def _match(terms):
+        # Quoted so FTS5 operators in user input stay literal; * makes a prefix
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    @staticmethod
+    def _bm25():
+        weights = ', '.join(str(weight) for _, _, weight in DOCUMENT_COLUMNS)
+        return f'bm25({SEARCH_TABLE}, {weights})'
+
+    def matches(self, terms):
+        return (f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+                [self._match(terms)])
+
+    def search(self, query, limit=None):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        sql = (
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY {self._bm25()}, rowid'
+        )
+        params = [self._match(terms)]
+        if limit is not None:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    vendor = 'postgresql'
+
+    # tsvector weights are labels A-D rather than numbers
+    LABELS = {
+        'subject_code': 'A',
+        'subject_name': 'B',
+        'teacher_name': 'C',
+        'room': 'D',
+        'subject_description': 'D',
+    }
+
+    def install(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            f'class_id bigint PRIMARY KEY REFERENCES core_class (id) ON DELETE CASCADE, '
+            f'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document '
+            f'ON {SEARCH_TABLE} USING GIN (document)'
+        )
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def _document(self):
+        return ' || '.join(
+            f"setweight(to_tsvector('simple', coalesce({expression}, '')), '{self.LABELS[name]}')"
+            for name, expression, _ in DOCUMENT_COLUMNS
+        )
+
+    def _upsert(self, cursor, where='', params=()):
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (class_id, document) '
+            f'SELECT c.id, {self._document()} {DOCUMENT_FROM} {where} '
+            f'ON CONFLICT (class_id) DO UPDATE SET document = EXCLUDED.document',
+            params
+        )
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+            self._upsert(cursor)
+
+    def index_classes(self, class_ids):
+        class_ids = list(class_ids)
+        if not class_ids:
+            return
+        with self.connection.cursor() as cursor:
+            self._upsert(cursor, f'WHERE c.id IN ({self._in_clause(class_ids)})', class_ids)
+
+    def remove_classes(self, class_ids):
+        # Deleting the class cascades to its row
+        pass
+
+    @staticmethod
+    def _tsquery(terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def matches(self, terms):
+        return (f"SELECT class_id FROM {SEARCH_TABLE} "
+                f"WHERE document @@ to_tsquery('simple', %s)", [self._tsquery(terms)])
+
+    def search(self, query, limit=None):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        sql = (
+            f"SELECT class_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+            f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, class_id'
+        )
+        params = [self._tsquery(terms)]
+        if limit is not None:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+def match_words(queryset, query):
+    """`queryset` narrowed to classes with every word of `query` in some field"""
+    for term in search_terms(query):
+        queryset = queryset.filter(
+            Q(subject__code__icontains=term) |
+            Q(subject__name__icontains=term) |
+            Q(subject__description__icontains=term) |
+            Q(teacher__user__first_name__icontains=term) |
+            Q(teacher__user__last_name__icontains=term) |
+            Q(room__icontains=term)
+        )
+    return queryset
+
+
+class FallbackBackend(SearchBackend):
+    """No index: every word must appear somewhere in the class's fields"""
+
+    def search(self, query, limit=None):
+        from .models import Class
+
+        ids = match_words(Class.objects.all(), query).values_list('pk', flat=True)
+        return list(ids[:limit] if limit is not None else ids)
+
+    def filter(self, queryset, query):
+        # No rank: the queryset keeps its ordering
+        return match_words(queryset, query)
+
+
+BACKENDS = [SQLiteFTSBackend, PostgresSearchBackend]
+
+
+def _has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def backend_class_for(connection):
+    """The indexed backend for `connection`'s vendor, or FallbackBackend"""
+    if connection.vendor == 'sqlite' and not _has_fts5(connection):
+        return FallbackBackend
+    for backend_class in BACKENDS:
+        if backend_class.vendor == connection.vendor:
+            return backend_class
+    return FallbackBackend
+
+
+def get_backend(using='default'):
+    """
+    The backend for database `using`, falling back to FallbackBackend while
+    the search table is missing (e.g. before migrating)
+    """
+    backend = _backends.get(using)
+    if backend is None:
+        connection = connections[using]
+        backend_class = backend_class_for(connection)
+        if backend_class is not FallbackBackend:
+            with connection.cursor() as cursor:
+                tables = connection.introspection.table_names(cursor)
+            if SEARCH_TABLE not in tables:
+                backend_class = FallbackBackend
+        backend = _backends[using] = backend_class(using)
+    return backend
+
+
+def reset_backends():
+    _backends.clear()
+
+
+def search_classes(queryset, query):
+    """`queryset` filtered by the free-text `query`, best match first"""
+    if queryset.model._meta.label != 'core.Class':
+        # Archived classes are not in the index
+        return match_words(queryset, query)
+    return get_backend(queryset.db).filter(queryset, query)
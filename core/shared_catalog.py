@@ -0,0 +1,339 @@
+"""
+The active catalog as one memory-mapped file shared by worker processes.
+
+Each web and gRPC worker that caches catalog rows keeps its own copy of
+the same data. write_catalog_file() serializes the active classes, with
+their seat counts, subjects and teachers, into a compact fixed-layout
+binary file instead. CatalogFile maps it read-only with mmap and answers
+lookups with struct.unpack_from straight from the mapping. The kernel
+keeps one copy of the file's pages in its page cache, and every process
+that maps the file shares that copy.
+
+Layout (little-endian, every section 4-byte aligned):
+
+    header    HEADER: magic, version, generation (ns), row counts,
+              largest class id, section offsets
+    index     one int32 per class id up to the largest: its row in
+              classes, or -1
+    classes   CLASS rows ordered by id: id, subject row, teacher row,
+              max_students, enrolled count, string refs of semester,
+              schedule and room
+    subjects  SUBJECT rows ordered by id: id, string refs of code and
+              name, credits
+    teachers  TEACHER rows ordered by id: id, string refs of employee_id
+              and full name
+    strings   uint16 length + UTF-8 bytes, each distinct string once;
+              a string ref is its offset in this section
+
+The file is always replaced whole. The writer takes an exclusive lock,
+writes a temporary file next to it, fsyncs it and os.replace()s it over
+the old one. A reader never sees half a file: it keeps the old mapping
+until SharedCatalog.get(), at most every CATALOG_FILE_CHECK_INTERVAL
+seconds, notices the new inode and maps the new file.
+
+With settings.CATALOG_FILE set, core.caching.bump_versions(), which every
+catalog write ends in, schedules a rewrite CATALOG_FILE_DEBOUNCE seconds
+later, so a burst of writes costs one rewrite. The gRPC server writes the
+file at startup if it is missing, serves its active class listings from
+it (backend_service.grpc_server), and rewrites it after each periodic
+read model check, which repairs writes no signal sees.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections
+
+try:
+    import fcntl
+except ImportError:  # Windows: rewrites are not serialized across processes
+    fcntl = None
+
+MAGIC = b'CCAT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHqiiiiiiiiii')
+INDEX = struct.Struct('<i')
+CLASS = struct.Struct('<iiiiiIII')
+SUBJECT = struct.Struct('<iIIi')
+TEACHER = struct.Struct('<iII')
+LENGTH = struct.Struct('<H')
+NO_ROW = -1
+
+ClassEntry = namedtuple('ClassEntry', [
+    'id', 'subject_id', 'subject_code', 'subject_name', 'teacher_id', 'teacher_name',
+    'schedule', 'room', 'semester', 'max_students', 'enrolled_count',
+])
+
+
+class CatalogFileError(Exception):
+    """The file is not a catalog file this code can read"""
+
+
+def _align(size):
+    return (size + 3) & ~3
+
+
+class _Strings:
+    """The strings section under construction"""
+
+    def __init__(self):
+        self.refs = {}
+        self.data = bytearray()
+
+    def ref(self, text):
+        ref = self.refs.get(text)
+        if ref is None:
+            encoded = (text or '').encode()[:0xFFFF]
+            ref = self.refs[text] = len(self.data)
+            self.data += LENGTH.pack(len(encoded)) + encoded
+        return ref
+
+
+def build_catalog(using='default'):
+    """The file's bytes for the active classes of database `using`"""
+    from accounts.models import Teacher
+    from .models import Class, Subject
+
+    strings = _Strings()
+    subjects = list(Subject.objects.using(using).order_by('pk').values_list(
+        'pk', 'code', 'name', 'credits'
+    ))
+    subject_rows = {pk: row for row, (pk, *_) in enumerate(subjects)}
+    teachers = list(Teacher.objects.using(using).order_by('pk').values_list(
+        'pk', 'employee_id', 'user__first_name', 'user__last_name', 'user__username'
+    ))
+    teacher_rows = {pk: row for row, (pk, *_) in enumerate(teachers)}
+    classes = list(
+        Class.objects.using(using).filter(is_active=True).with_stats().order_by('pk').values_list(
+            'pk', 'subject_id', 'teacher_id', 'max_students', 'student_count', 'semester',
+            'schedule', 'room'
+        )
+    )
+    max_id = classes[-1][0] if classes else -1
+
+    index = bytearray(INDEX.pack(NO_ROW) * (max_id + 1))
+    class_data = bytearray()
+    for row, (pk, subject_id, teacher_id, max_students, enrolled, semester, schedule, room) in (
+        enumerate(classes)
+    ):
+        INDEX.pack_into(index, pk * INDEX.size, row)
+        class_data += CLASS.pack(
+            pk, subject_rows[subject_id], teacher_rows[teacher_id], max_students, enrolled,
+            strings.ref(semester), strings.ref(schedule), strings.ref(room),
+        )
+    subject_data = b''.join(
+        SUBJECT.pack(pk, strings.ref(code), strings.ref(name), credits)
+        for pk, code, name, credits in subjects
+    )
+    teacher_data = b''.join(
+        # Teacher.full_name
+        TEACHER.pack(pk, strings.ref(employee_id),
+                     strings.ref(f'{first} {last}'.strip() or username))
+        for pk, employee_id, first, last, username in teachers
+    )
+
+    sections = [bytes(index), bytes(class_data), subject_data, teacher_data, bytes(strings.data)]
+    offsets, position = [], HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position = _align(position + len(section))
+    header = HEADER.pack(MAGIC, VERSION, 0, time.time_ns(), len(classes), len(subjects),
+                         len(teachers), max_id, *offsets, len(strings.data))
+    body = bytearray(header)
+    for offset, section in zip(offsets, sections):
+        body += b'\0' * (offset - len(body))
+        body += section
+    return bytes(body)
+
+
+def write_catalog_file(path, using='default'):
+    """Atomically replace the file at `path` with the current catalog; returns its size"""
+    path = os.fspath(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(f'{path}.lock', 'a') as lock:
+        if fcntl is not None:
+            # One rewrite at a time, each reading the database after the
+            # previous one finished, so the last file is never older
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        data = build_catalog(using)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.catalog-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return len(data)
+
+
+class CatalogFile:
+    """Read-only view of a catalog file; lookups decode only what they return"""
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        with open(self.path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map.size() < HEADER.size:
+            self.close()
+            raise CatalogFileError(f'{self.path} is too short')
+        (magic, version, _, self.generation, self.class_count, self.subject_count,
+         self.teacher_count, self.max_id, self._index, self._classes, self._subjects,
+         self._teachers, self._strings, _) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise CatalogFileError(f'{self.path} is not a version {VERSION} catalog file')
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.class_count
+
+    @property
+    def size(self):
+        return self._map.size()
+
+    def _string(self, ref):
+        start = self._strings + ref
+        (length,) = LENGTH.unpack_from(self._map, start)
+        return self._map[start + LENGTH.size:start + LENGTH.size + length].decode()
+
+    def _row(self, class_id):
+        if not 0 <= class_id <= self.max_id:
+            return NO_ROW
+        return INDEX.unpack_from(self._map, self._index + class_id * INDEX.size)[0]
+
+    def _entry(self, row):
+        (pk, subject_row, teacher_row, max_students, enrolled, semester, schedule,
+         room) = CLASS.unpack_from(self._map, self._classes + row * CLASS.size)
+        subject_id, code, name, _ = SUBJECT.unpack_from(
+            self._map, self._subjects + subject_row * SUBJECT.size
+        )
+        teacher_id, _, full_name = TEACHER.unpack_from(
+            self._map, self._teachers + teacher_row * TEACHER.size
+        )
+        return ClassEntry(pk, subject_id, self._string(code), self._string(name), teacher_id,
+                          self._string(full_name), self._string(schedule), self._string(room),
+                          self._string(semester), max_students, enrolled)
+
+    def __contains__(self, class_id):
+        return self._row(class_id) != NO_ROW
+
+    def seats(self, class_id):
+        """(enrolled, max_students) of an active class, or None; decodes no strings"""
+        row = self._row(class_id)
+        if row == NO_ROW:
+            return None
+        _, _, _, max_students, enrolled, *_ = CLASS.unpack_from(
+            self._map, self._classes + row * CLASS.size
+        )
+        return enrolled, max_students
+
+    def get_class(self, class_id):
+        """The ClassEntry of an active class, or None"""
+        row = self._row(class_id)
+        return None if row == NO_ROW else self._entry(row)
+
+    def classes(self, semester=None, teacher_id=None):
+        """ClassEntry of every active class (of `semester`, of `teacher_id`), ordered by id"""
+        # Strings are stored once, so each semester has a single ref
+        matches = {}
+        for row in range(self.class_count):
+            if semester is not None or teacher_id is not None:
+                _, _, teacher_row, _, _, semester_ref, *_ = CLASS.unpack_from(
+                    self._map, self._classes + row * CLASS.size
+                )
+                if semester is not None:
+                    if semester_ref not in matches:
+                        matches[semester_ref] = self._string(semester_ref) == semester
+                    if not matches[semester_ref]:
+                        continue
+                if teacher_id is not None and TEACHER.unpack_from(
+                    self._map, self._teachers + teacher_row * TEACHER.size
+                )[0] != teacher_id:
+                    continue
+            yield self._entry(row)
+
+
+class SharedCatalog:
+    """
+    The process's CatalogFile for settings.CATALOG_FILE, remapped when the
+    file is replaced, plus the debounced rewrite bump_versions() asks for
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._checked = 0.0
+        self._timer = None
+
+    def get(self):
+        """The current CatalogFile, or None without CATALOG_FILE or before the first write"""
+        path = settings.CATALOG_FILE
+        if not path:
+            return None
+        now = time.monotonic()
+        if self._file is not None and now - self._checked < settings.CATALOG_FILE_CHECK_INTERVAL:
+            return self._file
+        with self._lock:
+            self._checked = now
+            try:
+                inode = os.stat(path).st_ino
+            except FileNotFoundError:
+                return self._file
+            if self._file is None or self._file.inode != inode:
+                # The old mapping is left to the garbage collector: a
+                # request thread may still be reading from it
+                self._file = CatalogFile(path)
+        return self._file
+
+    def reset(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._file = self._timer = None
+            self._checked = 0.0
+
+    def ensure(self):
+        """Write the file now if CATALOG_FILE names one that does not exist yet"""
+        path = settings.CATALOG_FILE
+        if path and not os.path.exists(path):
+            write_catalog_file(path)
+
+    def changed(self):
+        """Rewrite the file soon; called on every catalog write"""
+        if not settings.CATALOG_FILE:
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(settings.CATALOG_FILE_DEBOUNCE, self._rewrite)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _rewrite(self):
+        with self._lock:
+            self._timer = None
+        try:
+            write_catalog_file(settings.CATALOG_FILE)
+        finally:
+            # The timer thread's own connection
+            connections.close_all()
+
+
+shared_catalog = SharedCatalog()
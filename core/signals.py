@@ -0,0 +1,328 @@
+"""
+Keeps the class search index (core.search), the autocomplete trie
+(core.autocomplete), the enrollment matrix (core.matrix), the dashboard
+statistics (core.stats), the page cache versions (core.caching) and the
+cached reference data (core.refdata) in sync with the rows they are
+built from. Saves that only touch other columns, such as the last_login
+update on every login, are skipped.
+
+The search index lives in the database and is written in the same
+transaction; the statistics, the in-memory trie and matrix and the cache
+versions are only updated once the change commits, the statistics before
+the versions are bumped. That is also when the change is published on
+the invalidation bus (core.bus), for the copies the other processes keep.
+"""
+from copy import copy
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from accounts.models import Student, Teacher
+from . import stats
+from .autocomplete import autocomplete_index
+from .bus import bus
+from .caching import bump_versions
+from .matrix import enrollment_matrix
+from .models import Class, Semester, Subject
+from .refdata import reference_data
+from .search import get_backend, reset_backends
+
+CLASS_SEARCH_FIELDS = {'subject', 'subject_id', 'teacher', 'teacher_id', 'room'}
+SUBJECT_SEARCH_FIELDS = {'code', 'name', 'description'}
+TEACHER_SEARCH_FIELDS = {'user', 'user_id'}
+USER_SEARCH_FIELDS = {'first_name', 'last_name'}
+USER_AUTOCOMPLETE_FIELDS = {'first_name', 'last_name', 'username'}
+CLASS_STATS_FIELDS = {'subject', 'subject_id', 'semester', 'max_students', 'is_active'}
+CLASS_MATRIX_FIELDS = {'semester', 'schedule', 'is_active'}
+
+
+def _touches(update_fields, search_fields):
+    return update_fields is None or bool(search_fields & set(update_fields))
+
+
+@receiver(post_migrate)
+def forget_search_backends(sender, **kwargs):
+    # Migration core.0002 creates (or drops) the search table
+    reset_backends()
+
+
+@receiver(post_save, sender=Class)
+def index_class(sender, instance, update_fields=None, using='default', **kwargs):
+    if _touches(update_fields, CLASS_SEARCH_FIELDS):
+        get_backend(using).index_classes([instance.pk])
+
+
+@receiver(post_delete, sender=Class)
+def unindex_class(sender, instance, using='default', **kwargs):
+    get_backend(using).remove_classes([instance.pk])
+
+
+@receiver(post_save, sender=Subject)
+def reindex_subject_classes(sender, instance, created, update_fields=None,
+                            using='default', **kwargs):
+    if not created and _touches(update_fields, SUBJECT_SEARCH_FIELDS):
+        get_backend(using).index_classes(
+            Class.objects.using(using).filter(subject=instance).values_list('pk', flat=True)
+        )
+
+
+@receiver(post_save, sender=Teacher)
+def reindex_teacher_classes(sender, instance, created, update_fields=None,
+                            using='default', **kwargs):
+    if not created and _touches(update_fields, TEACHER_SEARCH_FIELDS):
+        get_backend(using).index_classes(
+            Class.objects.using(using).for_teacher(instance).values_list('pk', flat=True)
+        )
+
+
+@receiver(post_save, sender=User)
+def reindex_user_classes(sender, instance, created, update_fields=None,
+                         using='default', **kwargs):
+    if not created and _touches(update_fields, USER_SEARCH_FIELDS):
+        get_backend(using).index_classes(
+            Class.objects.using(using).filter(teacher__user=instance).values_list('pk', flat=True)
+        )
+
+
+@receiver(post_save, sender=Subject)
+def autocomplete_subject(sender, instance, update_fields=None, using='default', **kwargs):
+    if autocomplete_index.is_built and _touches(update_fields, {'code', 'name'}):
+        transaction.on_commit(lambda: autocomplete_index.update_subject(instance), using=using)
+
+
+@receiver(post_delete, sender=Subject)
+def autocomplete_remove_subject(sender, instance, using='default', **kwargs):
+    subject_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_subject(subject_id), using=using)
+
+
+@receiver(post_save, sender=Teacher)
+def autocomplete_teacher(sender, instance, update_fields=None, using='default', **kwargs):
+    if autocomplete_index.is_built and _touches(update_fields, TEACHER_SEARCH_FIELDS):
+        transaction.on_commit(lambda: autocomplete_index.update_teacher(instance), using=using)
+
+
+@receiver(post_delete, sender=Teacher)
+def autocomplete_remove_teacher(sender, instance, using='default', **kwargs):
+    teacher_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_teacher(teacher_id), using=using)
+
+
+@receiver(post_save, sender=User)
+def autocomplete_user(sender, instance, created, update_fields=None,
+                      using='default', **kwargs):
+    # New users are picked up by the Teacher post_save above
+    if created or not autocomplete_index.is_built:
+        return
+    if not _touches(update_fields, USER_AUTOCOMPLETE_FIELDS):
+        return
+    teacher = Teacher.objects.using(using).filter(user=instance).first()
+    if teacher is not None:
+        teacher.user = instance
+        transaction.on_commit(lambda: autocomplete_index.update_teacher(teacher), using=using)
+
+
+def _changed_on_commit(using, model, action, pks=(), class_ids=(), semesters=(), bump=True,
+                       **details):
+    """
+    Once the transaction commits, bump the cache versions of `class_ids`
+    and `semesters` (and the catalog's) unless `bump` is false, drop the
+    reference data the change affects, and publish the change for the
+    other processes
+    """
+    class_ids, semesters = set(class_ids), set(semesters)
+
+    def changed():
+        if bump:
+            bump_versions(class_ids, semesters)
+        reference_data.changed(model)
+        bus.publish(model, action, pks, class_ids, semesters, bump=bump, **details)
+
+    transaction.on_commit(changed, using=using)
+
+
+def _stats_on_commit(using, func, *args, **kwargs):
+    # Registered ahead of _changed_on_commit, so the figures are current
+    # by the time the cache versions move
+    transaction.on_commit(lambda: func(*args, using=using, **kwargs), using=using)
+
+
+@receiver(pre_save, sender=Class)
+def capture_class_state(sender, instance, update_fields=None, using='default', **kwargs):
+    if not instance._state.adding and _touches(update_fields, CLASS_STATS_FIELDS):
+        instance._stats_before = stats.class_state(instance, using)
+
+
+@receiver(post_save, sender=Class)
+def class_saved(sender, instance, created, update_fields=None, using='default', **kwargs):
+    semesters = {instance.semester}
+    if created or _touches(update_fields, CLASS_STATS_FIELDS):
+        before = instance.__dict__.pop('_stats_before', None)
+        student_count = before.student_count if before is not None else 0
+        after = stats.ClassState(instance.is_active, instance.semester, student_count)
+        _stats_on_commit(using, stats.class_changed, instance, before, after)
+        # An edit may have moved the class out of another semester
+        if before is not None:
+            semesters.add(before.semester)
+    _changed_on_commit(using, 'class', 'save', [instance.pk], [instance.pk], semesters,
+                       classes=[[instance.pk, instance.semester, instance.schedule,
+                                 instance.is_active]])
+    if created or _touches(update_fields, CLASS_MATRIX_FIELDS):
+        transaction.on_commit(lambda: enrollment_matrix.update_class(instance), using=using)
+
+
+@receiver(pre_delete, sender=Class)
+def capture_deleted_class_state(sender, instance, using='default', **kwargs):
+    # Before the cascade takes the roster rows with it
+    instance._stats_before = stats.class_state(instance, using)
+
+
+@receiver(post_delete, sender=Class)
+def class_deleted(sender, instance, using='default', **kwargs):
+    before = instance.__dict__.pop('_stats_before', None)
+    # delete() clears the instance's pk once the signals are sent
+    _stats_on_commit(using, stats.class_changed, copy(instance), before, None)
+    _changed_on_commit(using, 'class', 'delete', [instance.pk], [instance.pk],
+                       [instance.semester])
+    class_id = instance.pk
+    transaction.on_commit(lambda: enrollment_matrix.remove_class(class_id), using=using)
+
+
+@receiver(m2m_changed, sender=Class.students.through)
+def roster_changed(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    # `instance` is the class, or the student when reverse. remove() reports
+    # every pk it was given and clear() none, so the rows that really go
+    # are captured first.
+    if action in ('pre_remove', 'pre_clear'):
+        if reverse:
+            leaving = instance.enrolled_classes.using(using).all()
+            if pk_set is not None:
+                leaving = leaving.filter(pk__in=pk_set)
+            instance._leaving = list(leaving)
+        else:
+            leaving = Class.students.through.objects.using(using).filter(class_id=instance.pk)
+            if pk_set is not None:
+                leaving = leaving.filter(student_id__in=pk_set)
+            instance._leaving = list(leaving.values_list('student_id', flat=True))
+        return
+
+    if action == 'post_add':
+        if reverse:
+            changes = [(c, 1) for c in Class.objects.using(using).filter(pk__in=pk_set)]
+            pairs = [(c.pk, instance.pk) for c, _ in changes]
+        else:
+            changes = [(instance, len(pk_set))]
+            pairs = [(instance.pk, student_id) for student_id in pk_set]
+        update, published = enrollment_matrix.add, 'enroll'
+    elif action in ('post_remove', 'post_clear'):
+        leaving = instance.__dict__.pop('_leaving')
+        if reverse:
+            changes = [(c, -1) for c in leaving]
+            pairs = [(c.pk, instance.pk) for c in leaving]
+        else:
+            changes = [(instance, -len(leaving))]
+            pairs = [(instance.pk, student_id) for student_id in leaving]
+        update, published = enrollment_matrix.remove, 'unenroll'
+    else:
+        return
+    if pairs:
+        transaction.on_commit(lambda: update(pairs), using=using)
+
+    changes = [(class_obj, delta) for class_obj, delta in changes if delta]
+    _roster_stats_on_commit(using, changes)
+    if changes:
+        class_ids = [c.pk for c, _ in changes]
+        _changed_on_commit(using, 'class', published, class_ids, class_ids,
+                           [c.semester for c, _ in changes], pairs=pairs)
+
+
+def _roster_stats_on_commit(using, changes):
+    # Whether the class counts is decided now: a later save in the same
+    # transaction is applied, from its state now, after this
+    changes = [(c, c.semester, delta) for c, delta in changes if c.is_active]
+    if changes:
+        transaction.on_commit(lambda: [
+            stats.roster_changed(class_obj, semester, delta, using)
+            for class_obj, semester, delta in changes
+        ], using=using)
+
+
+@receiver(pre_delete, sender=Student)
+def capture_student_classes(sender, instance, using='default', **kwargs):
+    # The roster rows are deleted by cascade, which sends no m2m_changed
+    instance._leaving = list(instance.enrolled_classes.using(using).all())
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, using='default', **kwargs):
+    leaving = instance.__dict__.pop('_leaving', [])
+    _roster_stats_on_commit(using, [(c, -1) for c in leaving])
+    _stats_on_commit(using, stats.adjust_totals, total_students=-1)
+    _changed_on_commit(using, 'student', 'delete', [instance.pk], [c.pk for c in leaving],
+                       [c.semester for c in leaving], user_ids=[instance.user_id])
+    student_id = instance.pk
+    transaction.on_commit(lambda: enrollment_matrix.remove_student(student_id), using=using)
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, created, using='default', **kwargs):
+    # Only a new student changes what the cached pages count; any save
+    # can change what other processes cached of it
+    if created:
+        _stats_on_commit(using, stats.adjust_totals, total_students=1)
+    _changed_on_commit(using, 'student', 'save', [instance.pk], bump=created,
+                       user_ids=[instance.user_id])
+
+
+@receiver(post_save, sender=Teacher)
+def teacher_saved(sender, instance, created, using='default', **kwargs):
+    if created:
+        _stats_on_commit(using, stats.adjust_totals, total_teachers=1)
+    _changed_on_commit(using, 'teacher', 'save', [instance.pk], bump=created,
+                       user_ids=[instance.user_id])
+
+
+@receiver(post_delete, sender=Teacher)
+def teacher_deleted(sender, instance, using='default', **kwargs):
+    # Its classes go through class_deleted on the way
+    _stats_on_commit(using, stats.adjust_totals, total_teachers=-1)
+    _changed_on_commit(using, 'teacher', 'delete', [instance.pk], user_ids=[instance.user_id])
+
+
+@receiver(post_save, sender=Subject)
+def subject_saved(sender, instance, created, update_fields=None, using='default', **kwargs):
+    if created:
+        _stats_on_commit(using, stats.adjust_totals, total_subjects=1)
+        _changed_on_commit(using, 'subject', 'save', [instance.pk])
+        return
+    class_ids = Class.objects.using(using).filter(subject=instance).values_list('pk', flat=True)
+    _changed_on_commit(using, 'subject', 'save', [instance.pk], class_ids)
+
+
+@receiver(post_delete, sender=Subject)
+def subject_deleted(sender, instance, using='default', **kwargs):
+    _stats_on_commit(using, stats.adjust_totals, total_subjects=-1)
+    _changed_on_commit(using, 'subject', 'delete', [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def bump_teacher_name(sender, instance, created, update_fields=None,
+                      using='default', **kwargs):
+    if not created and _touches(update_fields, USER_SEARCH_FIELDS):
+        class_ids = Class.objects.using(using).filter(
+            teacher__user=instance
+        ).values_list('pk', flat=True)
+        # A teacher's name lives on its user
+        _changed_on_commit(using, 'teacher', 'save', class_ids=class_ids,
+                           user_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Semester)
+@receiver(post_delete, sender=Semester)
+def semester_changed(sender, instance, using='default', **kwargs):
+    # Semester pickers and archived-term lists are on the cached pages
+    _changed_on_commit(using, 'semester', 'save', semesters=[instance.code])
@@ -0,0 +1,268 @@
+"""
+Catalog-wide dashboard statistics.
+
+The totals and the popular classes live in the single CatalogStatistics
+row and the per-semester counts in SemesterStatistics. core.signals keeps
+them current: once a class, roster, subject, teacher or student change
+commits, the functions below apply its delta with F() UPDATEs, so writers
+never lock or wait on the row, and a rolled back write never reaches it.
+They run before the change's cache versions are bumped, so a page
+rendered for the new version reads the new figures. Writes that skip
+model signals (bulk_create(), QuerySet.update(), raw SQL) call rebuild()
+or need `manage.py rebuild_catalog_stats`.
+
+popular_classes holds the top POPULAR_CLASSES active classes, under
+their subjects' codes and names when the row was written; CatalogStats
+shows the current ones (core.refdata). A change is first checked against
+an unlocked read of the row, and only one that moves a class into, out
+of or within the list rewrites it, under a row lock held for that read
+and write alone. Gains only ever compare a class against the last item;
+only when an item loses students or leaves while other classes are
+waiting outside the list is it refilled with the ranking query.
+"""
+from collections import namedtuple
+from functools import cached_property
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from accounts.models import Student, Teacher
+from .models import CatalogStatistics, Class, SemesterStatistics, Subject
+from .refdata import reference_data
+
+POPULAR_CLASSES = 5
+STATS_PK = 1
+
+# What a class contributes to the figures, before or after a change
+ClassState = namedtuple('ClassState', 'is_active semester student_count')
+
+
+def class_state(class_obj, using='default'):
+    """The stored ClassState of `class_obj`, or None if it is not saved yet"""
+    if class_obj.pk is None:
+        return None
+    row = Class.objects.using(using).with_stats().filter(pk=class_obj.pk).values_list(
+        'is_active', 'semester', 'student_count'
+    ).first()
+    return ClassState(*row) if row is not None else None
+
+
+def class_entry(class_obj, student_count):
+    """A popular_classes item, shaped like what the dashboard template reads"""
+    return {
+        'pk': class_obj.pk,
+        'subject_id': class_obj.subject_id,
+        'subject': {'code': class_obj.subject.code, 'name': class_obj.subject.name},
+        'max_students': class_obj.max_students,
+        'student_count': student_count,
+    }
+
+
+def _rank_key(entry):
+    return (-entry['student_count'], entry['pk'])
+
+
+def popular_queryset(using='default'):
+    return Class.objects.using(using).filter(is_active=True).with_stats().select_related(
+        'subject'
+    ).order_by('-student_count', 'pk')[:POPULAR_CLASSES]
+
+
+def compute(using='default'):
+    """A fresh, unsaved CatalogStatistics computed from the tables"""
+    active = Class.objects.using(using).filter(is_active=True)
+    return CatalogStatistics(
+        pk=STATS_PK,
+        total_classes=active.count(),
+        total_students=Student.objects.using(using).count(),
+        total_teachers=Teacher.objects.using(using).count(),
+        total_subjects=Subject.objects.using(using).count(),
+        popular_classes=[class_entry(c, c.student_count) for c in popular_queryset(using)],
+    )
+
+
+def compute_semesters(using='default'):
+    """Fresh, unsaved SemesterStatistics for the semesters with active classes"""
+    return [
+        SemesterStatistics(**row)
+        for row in Class.objects.using(using).filter(is_active=True).order_by().values(
+            'semester'
+        ).annotate(classes=Count('pk', distinct=True), enrollments=Count('students'))
+    ]
+
+
+def rebuild(using='default'):
+    stats = compute(using)
+    semesters = compute_semesters(using)
+    with transaction.atomic(using=using):
+        stats.save(using=using)
+        SemesterStatistics.objects.using(using).all().delete()
+        SemesterStatistics.objects.using(using).bulk_create(semesters)
+    return stats
+
+
+def enrollments_by_semester(using='default'):
+    """{semester: enrollments} for semesters with active classes, latest first"""
+    return dict(
+        SemesterStatistics.objects.using(using).filter(classes__gt=0).order_by(
+            '-semester'
+        ).values_list('semester', 'enrollments')
+    )
+
+
+# Deltas, applied once the change commits
+
+def adjust_totals(using='default', **deltas):
+    """
+    Add to total_* counters, e.g. adjust_totals(total_students=1). False
+    when there was no row yet: it is rebuilt, and already has the change.
+    """
+    updated = CatalogStatistics.objects.using(using).filter(pk=STATS_PK).update(
+        updated_at=timezone.now(),
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated:
+        # Never built, e.g. a flushed database
+        rebuild(using)
+    return bool(updated)
+
+
+def _adjust_semester(using, semester, classes=0, enrollments=0):
+    changes = {'classes': F('classes') + classes, 'enrollments': F('enrollments') + enrollments}
+    semesters = SemesterStatistics.objects.using(using)
+    if not semesters.filter(semester=semester).update(**changes):
+        semesters.get_or_create(semester=semester)
+        semesters.filter(semester=semester).update(**changes)
+
+
+def _reranked(popular, total_classes, using, class_obj, student_count, refresh):
+    """
+    popular_classes with `class_obj` moved to its place with `student_count`
+    students, or dropped when student_count is None; refresh rebuilds its
+    item from class_obj instead of only updating the count
+    """
+    old = next((e for e in popular if e['pk'] == class_obj.pk), None)
+    popular = [e for e in popular if e['pk'] != class_obj.pk]
+
+    if student_count is not None:
+        key = (-student_count, class_obj.pk)
+        if old is not None or len(popular) < POPULAR_CLASSES or key < _rank_key(popular[-1]):
+            if old is None or refresh:
+                entry = class_entry(class_obj, student_count)
+            else:
+                entry = dict(old, student_count=student_count)
+            popular.append(entry)
+            popular.sort(key=_rank_key)
+            del popular[POPULAR_CLASSES:]
+
+    shrunk = old is not None and (student_count is None or student_count < old['student_count'])
+    if shrunk and total_classes > len(popular):
+        # Some class outside the list may now outrank what is left on it
+        popular = [class_entry(c, c.student_count) for c in popular_queryset(using)]
+    return popular
+
+
+def _rank(using, class_obj, student_count=None, delta=None, refresh=False):
+    """
+    Update popular_classes for `class_obj`, now with `student_count`
+    students (None: not active or gone), or with `delta` more than the
+    list says; a delta for a class outside the list is counted only if it
+    may enter it
+    """
+    def ranked(row):
+        count = student_count
+        if delta is not None:
+            member = next((e for e in row.popular_classes if e['pk'] == class_obj.pk), None)
+            if member is not None:
+                count = member['student_count'] + delta
+            elif delta < 0:
+                # Outside the list: losing students can't bring it in
+                return row.popular_classes
+            else:
+                count = class_obj.students.using(using).count()
+        return _reranked(row.popular_classes, row.total_classes, using, class_obj, count,
+                         refresh)
+
+    rows = CatalogStatistics.objects.using(using).filter(pk=STATS_PK)
+    row = rows.only('popular_classes', 'total_classes').first()
+    if row is None:
+        rebuild(using)
+        return
+    if ranked(row) == row.popular_classes:
+        return
+    with transaction.atomic(using=using):
+        # Another writer may have moved the list since the read above
+        row = rows.select_for_update().only('popular_classes', 'total_classes').get()
+        rows.update(popular_classes=ranked(row), updated_at=timezone.now())
+
+
+def class_changed(class_obj, before, after, using='default'):
+    """A class was created, edited or deleted; before/after are ClassStates or None"""
+    was_active = before is not None and before.is_active
+    active = after is not None and after.is_active
+    if not was_active and not active:
+        return
+    if not adjust_totals(using, total_classes=active - was_active):
+        return
+    if was_active:
+        _adjust_semester(using, before.semester, classes=-1, enrollments=-before.student_count)
+    if active:
+        _adjust_semester(using, after.semester, classes=1, enrollments=after.student_count)
+    _rank(using, class_obj, after.student_count if active else None, refresh=True)
+
+
+def roster_changed(class_obj, semester, delta, using='default'):
+    """`delta` students joined active `class_obj` of `semester` (negative: left it)"""
+    if not delta:
+        return
+    _adjust_semester(using, semester, enrollments=delta)
+    _rank(using, class_obj, delta=delta)
+
+
+class CatalogStats:
+    """
+    The dashboard's view of the figures. The row is read on first access
+    (for updated_at, in the fragment cache keys); the semester counts
+    only when a template fragment needs them.
+    """
+
+    @cached_property
+    def _row(self):
+        return CatalogStatistics.objects.filter(pk=STATS_PK).first() or rebuild()
+
+    @property
+    def updated_at(self):
+        return self._row.updated_at
+
+    @property
+    def total_classes(self):
+        return self._row.total_classes
+
+    @property
+    def total_students(self):
+        return self._row.total_students
+
+    @property
+    def total_teachers(self):
+        return self._row.total_teachers
+
+    @property
+    def total_subjects(self):
+        return self._row.total_subjects
+
+    @cached_property
+    def enrollments_by_semester(self):
+        return enrollments_by_semester()
+
+    @property
+    def popular_classes(self):
+        # The row has the subjects' codes and names as they were when it
+        # was written; the reference data has the current ones
+        entries = []
+        for entry in self._row.popular_classes:
+            subject = reference_data.subject(entry['subject_id'])
+            if subject is not None:
+                entry = {**entry, 'subject': {'code': subject.code, 'name': subject.name}}
+            entries.append(entry)
+        return entries
@@ -0,0 +1,284 @@
+"""
+Synthetic catalogs for load testing, and database snapshots to restore
+them instantly.
+
+Generator writes teachers, students, subjects, classes and enrollments
+with bulk_create() in chunks. bulk_create() sends no model signals, so
+there are no per-row profile, statistics or search-index updates: the
+profiles are created directly, and the statistics and search index are
+rebuilt once at the end. Every user of a role shares one password hash,
+computed once, instead of running PBKDF2 per user.
+
+The catalog is valid under the business rules:
+
+- a teacher never teaches two classes in the same slot of a semester,
+  so (subject, teacher, schedule, semester) is unique too
+- a student takes at most one class per day of a semester, which is
+  what EnrollmentService treats as a schedule conflict
+- no class goes over max_students
+
+dump_snapshot() and load_snapshot() copy a whole SQLite database with
+the online backup API. That takes milliseconds where rebuilding the same
+data through the ORM takes minutes, so test fixtures and benchmarks can
+be restored between runs.
+"""
+import math
+import random
+import sqlite3
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+
+from accounts.models import Student, Teacher
+from accounts.principals import principal_cache
+from . import stats
+from .autocomplete import autocomplete_index
+from .matrix import enrollment_matrix
+from .models import ArchivedClass, Class, Semester, Subject
+from .refdata import reference_data
+from .search import get_backend, reset_backends
+
+CHUNK_SIZE = 5000
+DAYS = ['MON', 'TUE', 'WED', 'THU', 'FRI']
+TIMES = ['08:00-10:00', '10:00-12:00', '14:00-16:00', '16:00-18:00', '19:00-21:00']
+CAPACITIES = [20, 25, 30, 35, 40, 45]
+CLASSES_PER_SUBJECT = 10
+
+FIRST_NAMES = [
+    'Ana', 'Beatriz', 'Bruno', 'Camila', 'Carlos', 'Daniel', 'Fernanda', 'Gabriel',
+    'Guilherme', 'Isabela', 'João', 'Julia', 'Larissa', 'Lucas', 'Mariana', 'Mateus',
+    'Pedro', 'Rafael', 'Sofia', 'Thiago',
+]
+LAST_NAMES = [
+    'Almeida', 'Barbosa', 'Carvalho', 'Costa', 'Ferreira', 'Gomes', 'Lima', 'Martins',
+    'Oliveira', 'Pereira', 'Ribeiro', 'Rodrigues', 'Santos', 'Silva', 'Souza',
+]
+AREAS = [
+    ('CS', 'Computer Science'),
+    ('MATH', 'Mathematics'),
+    ('PHY', 'Physics'),
+    ('ENG', 'English Literature'),
+    ('CHEM', 'Chemistry'),
+    ('BIO', 'Biology'),
+]
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def clear(using='default'):
+    """
+    Delete every class, subject, profile and non-superuser account without
+    per-row signals, then rebuild what those signals maintain
+    """
+    for model in (Class.students.through, Class, ArchivedClass.students.through,
+                  ArchivedClass, Subject, Student, Teacher):
+        queryset = model.objects.using(using).all()
+        queryset._raw_delete(using)
+    # Through the ORM: groups, permissions, tokens and admin log entries
+    # reference users. With the profiles gone only cheap receivers are left.
+    User.objects.using(using).filter(is_superuser=False).delete()
+    refresh_derived(using)
+
+
+def refresh_derived(using='default'):
+    """Rebuild the search index and statistics, and drop cached copies"""
+    get_backend(using).rebuild()
+    stats.rebuild(using)
+    cache.clear()
+    autocomplete_index.reset()
+    enrollment_matrix.reset()
+    principal_cache.clear()
+    reference_data.clear(shared=True)
+
+
+class Generator:
+    """
+    A seeded synthetic catalog. Same seed and sizes, same catalog (up to
+    database ids).
+    """
+
+    def __init__(self, students, teachers, classes, density=0.75, seed=None,
+                 using='default', chunk_size=CHUNK_SIZE, log=None):
+        self.students = students
+        self.teachers = teachers
+        self.classes = classes
+        self.density = density
+        self.random = random.Random(seed)
+        self.using = using
+        self.chunk_size = chunk_size
+        self.log = log or (lambda message: None)
+        self.semesters = list(
+            Semester.objects.using(using).open().order_by('code').values_list('code', flat=True)
+        )
+
+    def check(self):
+        """A ValueError when the sizes can't give a conflict-free catalog"""
+        if not 0 < self.density <= 1:
+            raise ValueError('Enrollment density must be in (0, 1]')
+        if self.classes and not self.semesters:
+            raise ValueError('No open semesters to put classes in')
+        slots = len(self.semesters) * len(DAYS) * len(TIMES)
+        if self.classes > self.teachers * slots:
+            raise ValueError(
+                f'{self.teachers} teachers have {self.teachers * slots} free slots '
+                f'for {self.classes} classes; add teachers'
+            )
+
+    def run(self):
+        """Write the catalog; returns {table: rows written}"""
+        self.check()
+        counts = {}
+        teacher_ids = self._create_users(self.teachers, is_staff=True, counts=counts)
+        student_ids = self._create_users(self.students, is_staff=False, counts=counts)
+        subject_ids = self._create_subjects(counts)
+        classes = self._create_classes(teacher_ids, subject_ids, counts)
+        self._enroll(student_ids, classes, counts)
+        self.log('Rebuilding statistics and search index...')
+        refresh_derived(self.using)
+        return counts
+
+    def _name(self):
+        return self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+
+    def _create_users(self, total, is_staff, counts):
+        """Users and their profiles; returns the profile ids"""
+        role = 'teacher' if is_staff else 'student'
+        password = make_password(f'{role}123')
+        profile_ids = []
+        for chunk in chunked(range(1, total + 1), self.chunk_size):
+            users = []
+            for n in chunk:
+                first_name, last_name = self._name()
+                username = f'{role}{n:06d}'
+                users.append(User(
+                    username=username, password=password, is_staff=is_staff,
+                    first_name=first_name, last_name=last_name,
+                    email=f'{username}@example.edu',
+                ))
+            users = User.objects.using(self.using).bulk_create(users)
+            # Numbered from the user id, as create_user_profile does
+            if is_staff:
+                profiles = Teacher.objects.using(self.using).bulk_create([
+                    Teacher(user_id=u.pk, employee_id=f'T{u.pk:05d}',
+                            specialization=self.random.choice(AREAS)[1])
+                    for u in users
+                ])
+            else:
+                profiles = Student.objects.using(self.using).bulk_create([
+                    Student(user_id=u.pk, enrollment_number=f'S{u.pk:05d}') for u in users
+                ])
+            profile_ids += [p.pk for p in profiles]
+            self.log(f'  {len(profile_ids)}/{total} {role}s')
+        counts[f'{role}s'] = len(profile_ids)
+        return profile_ids
+
+    def _create_subjects(self, counts):
+        total = max(len(AREAS), math.ceil(self.classes / CLASSES_PER_SUBJECT))
+        subjects = []
+        for i in range(total):
+            prefix, area = AREAS[i % len(AREAS)]
+            number = 101 + i // len(AREAS)
+            subjects.append(Subject(
+                code=f'{prefix}{number}', name=f'{area} {number}',
+                description=f'Synthetic {area.lower()} course.',
+                credits=self.random.randint(2, 6),
+            ))
+        subjects = Subject.objects.using(self.using).bulk_create(subjects)
+        counts['subjects'] = len(subjects)
+        return [s.pk for s in subjects]
+
+    def _create_classes(self, teacher_ids, subject_ids, counts):
+        """Classes in free teacher slots; returns (id, semester, day, capacity) rows"""
+        slots = [(semester, day, time)
+                 for semester in self.semesters for day in DAYS for time in TIMES]
+        free = {}  # teacher id -> its untaken slots, in random order
+        rows = []
+        for chunk in chunked(range(self.classes), self.chunk_size):
+            objs = []
+            for i in chunk:
+                # Round robin: the check() above guarantees a free slot
+                teacher_id = teacher_ids[i % len(teacher_ids)]
+                if teacher_id not in free:
+                    free[teacher_id] = self.random.sample(slots, len(slots))
+                semester, day, time = free[teacher_id].pop()
+                objs.append(Class(
+                    subject_id=self.random.choice(subject_ids), teacher_id=teacher_id,
+                    schedule=f'{day} {time}', room=f'Room {self.random.randint(100, 499)}',
+                    semester=semester, max_students=self.random.choice(CAPACITIES),
+                ))
+            for class_obj in Class.objects.using(self.using).bulk_create(objs):
+                day = class_obj.schedule.split()[0]
+                rows.append((class_obj.pk, class_obj.semester, day, class_obj.max_students))
+            self.log(f'  {len(rows)}/{self.classes} classes')
+        counts['classes'] = len(rows)
+        return rows
+
+    def _enroll(self, student_ids, classes, counts):
+        """
+        Classes sharing a semester and day split one shuffle of the students
+        between them, so nobody gets two classes on the same day
+        """
+        by_day = {}
+        for class_id, semester, day, capacity in classes:
+            by_day.setdefault((semester, day), []).append((class_id, capacity))
+
+        through = Class.students.through
+        pending = []
+        written = 0
+        for day_classes in by_day.values():
+            order = self.random.sample(student_ids, len(student_ids))
+            start = 0
+            for class_id, capacity in day_classes:
+                size = min(round(capacity * self.density), len(order) - start)
+                pending += [through(class_id=class_id, student_id=student_id)
+                            for student_id in order[start:start + size]]
+                start += size
+                if len(pending) >= self.chunk_size:
+                    through.objects.using(self.using).bulk_create(pending)
+                    written += len(pending)
+                    pending = []
+                    self.log(f'  {written} enrollments')
+        through.objects.using(self.using).bulk_create(pending)
+        counts['enrollments'] = written + len(pending)
+
+
+def _sqlite_connection(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        raise ValueError(f'Snapshots need SQLite; "{using}" is {connection.vendor}')
+    connection.ensure_connection()
+    return connection
+
+
+def dump_snapshot(path, using='default'):
+    """Copy database `using` to the file `path`"""
+    connection = _sqlite_connection(using)
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+
+
+def load_snapshot(path, using='default'):
+    """Replace database `using` with the snapshot at `path`"""
+    connection = _sqlite_connection(using)
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        source.backup(connection.connection)
+    finally:
+        source.close()
+    # Cached pages, versions and the in-memory indexes describe the old data
+    reset_backends()
+    cache.clear()
+    autocomplete_index.reset()
+    enrollment_matrix.reset()
+    principal_cache.clear()
+    reference_data.clear(shared=True)
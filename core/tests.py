@@ -1,3 +1,1157 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from accounts.models import Student, Teacher
+from core.admin import ClassAdmin, PaginatedInlineFormSet
+from core import bulk
+from core.archive import archive_semester, restore_semester
+from core.models import ArchivedClass, CatalogStatistics, Class, Semester, Subject
+from core.autocomplete import RadixTrie, autocomplete_index
+from core.bus import ORIGIN, SQLiteOutboxTransport, UnixSocketTransport, bus
+from core.importing import TimetableImporter
+from core.middleware import PrimaryPinMiddleware
+from core.query_budget import QueryRecorder, record_queries
+from core.routers import PrimaryReplicaRouter, routing_scope
+from core.matrix import enrollment_matrix
+from core.refdata import reference_data
+from core.search import get_backend, search_classes
+from core.shared_catalog import CatalogFile, shared_catalog, write_catalog_file
+from backend_service.services import ClassService
+from core.stats import (
+    STATS_PK, compute, compute_semesters, enrollments_by_semester, popular_queryset, rebuild,
+)
+from core.synthetic import Generator
+
+
+class CatalogTestData:
+    """Small catalog shared by the query budget tests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        cls.teacher_users = [
+            User.objects.create_user(f'prof{i}', password=None, is_staff=True,
+                                     first_name='Prof', last_name=str(i))
+            for i in range(2)
+        ]
+        cls.student_users = [
+            User.objects.create_user(f'student{i}', password=None,
+                                     first_name='Student', last_name=str(i))
+            for i in range(4)
+        ]
+        cls.teachers = [u.teacher_profile for u in cls.teacher_users]
+        cls.students = [u.student_profile for u in cls.student_users]
+
+        cls.subjects = [
+            Subject.objects.create(code=f'CS{i}01', name=f'Subject {i}', credits=4)
+            for i in range(3)
+        ]
+        days = ['MON', 'TUE', 'WED', 'THU']
+        cls.classes = [
+            Class.objects.create(subject=cls.subjects[i % 3], teacher=cls.teachers[i % 2],
+                                 schedule=f'{days[i]} 10:00-12:00', room=f'Room {i}',
+                                 semester='2025.1', max_students=30)
+            for i in range(4)
+        ]
+        for i, class_obj in enumerate(cls.classes):
+            class_obj.students.add(*cls.students[:i + 1])
+
+        cls.student_user = cls.student_users[0]
+        cls.teacher_user = cls.teacher_users[0]
+        rebuild()
+
+    def setUp(self):
+        super().setUp()
+        # Cached pages, fragments, the matrix and the reference data would
+        # outlive each test's rollback. The matrix is then loaded again, as
+        # config/wsgi.py and asgi.py load it when a worker starts.
+        cache.clear()
+        enrollment_matrix.reset()
+        enrollment_matrix.warm()
+        reference_data.reset()
+
+
+def url_names(urlconf_module, namespace):
+    resolver = get_resolver(urlconf_module)
+    names = set()
+    for pattern in resolver.url_patterns:
+        for sub in getattr(pattern, 'url_patterns', [pattern]):
+            if getattr(sub, 'name', None):
+                names.add(f'{namespace}:{sub.name}')
+    return names
+
+
+class QueryRecorderTests(TestCase):
+
+    def test_groups_in_lists_into_one_shape(self):
+        with record_queries() as recorder:
+            list(Subject.objects.filter(pk__in=[1, 2]))
+            list(Subject.objects.filter(pk__in=[1, 2, 3]))
+        self.assertEqual(recorder.count, 2)
+        self.assertEqual(len(recorder.shapes), 1)
+
+    def test_reports_origin_of_repeated_shapes(self):
+        with record_queries() as recorder:
+            for _ in range(3):
+                Subject.objects.filter(code='X').exists()
+        [(count, origin, sql)] = recorder.repeated(3)
+        self.assertEqual(count, 3)
+        self.assertTrue(origin.startswith('core/tests.py:'), origin)
+
+    def test_recorder_is_isolated(self):
+        self.assertEqual(QueryRecorder().count, 0)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class CoreViewQueryBudgetTests(CatalogTestData, TestCase):
+    """
+    Every view in core/urls.py, exercised as the users that reach its
+    heaviest path. QueryBudgetMiddleware raises when a view goes over the
+    budget pinned in settings.QUERY_BUDGETS.
+    """
+
+    def test_every_view_has_a_budget(self):
+        missing = url_names('core.urls', 'classes') - set(settings.QUERY_BUDGETS)
+        self.assertFalse(missing, f'No query budget for {sorted(missing)}')
+
+    def get(self, name, *args, user=None, status=200):
+        if user is not None:
+            self.client.force_login(user)
+        response = self.client.get(reverse(name, args=args))
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def post(self, name, *args, user=None, data=None, status=302):
+        if user is not None:
+            self.client.force_login(user)
+        response = self.client.post(reverse(name, args=args), data or {})
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_dashboard(self):
+        self.get('classes:dashboard')
+        self.get('classes:dashboard', user=self.student_user)
+        self.get('classes:dashboard', user=self.teacher_user)
+
+    def test_list(self):
+        self.get('classes:list')
+        self.get('classes:list', user=self.student_user)
+        self.client.get(reverse('classes:list'), {'search': 'CS', 'semester': '2025.1'})
+
+    def test_detail(self):
+        self.get('classes:detail', self.classes[3].pk)
+        self.get('classes:detail', self.classes[3].pk, user=self.student_user)
+
+    def test_create(self):
+        self.get('classes:create', user=self.teacher_user)
+        self.post('classes:create', user=self.teacher_user, data={
+            'subject': self.subjects[0].pk, 'schedule': 'FRI 08:00-10:00',
+            'semester': '2025.1', 'max_students': 20, 'is_active': 'on',
+        })
+
+    def test_edit(self):
+        self.get('classes:edit', self.classes[0].pk, user=self.teacher_user)
+        self.post('classes:edit', self.classes[0].pk, user=self.teacher_user, data={
+            'schedule': 'MON 10:00-12:00', 'semester': '2025.1', 'max_students': 25,
+            'is_active': 'on',
+        })
+
+    def test_delete(self):
+        self.post('classes:delete', self.classes[0].pk, user=self.teacher_user)
+
+    def test_enroll(self):
+        self.post('classes:enroll', self.classes[0].pk, user=self.student_users[3])
+
+    def test_unenroll(self):
+        self.post('classes:unenroll', self.classes[3].pk, user=self.student_user)
+
+    def test_my_classes(self):
+        self.get('classes:my_classes', user=self.student_user)
+
+    def test_my_teaching(self):
+        self.get('classes:my_teaching', user=self.teacher_user)
+
+    def test_exports(self):
+        self.get('classes:roster_export', self.classes[0].pk, 'csv', user=self.teacher_user)
+        self.get('classes:my_rosters_export', 'jsonl', user=self.teacher_user)
+        self.get('classes:semester_enrollments_export', '2025.1', 'csv', user=self.admin)
+
+    def test_subject_list(self):
+        self.get('classes:subject_list')
+
+    def test_subject_create(self):
+        self.get('classes:subject_create', user=self.admin)
+        self.post('classes:subject_create', user=self.admin, data={
+            'code': 'NEW101', 'name': 'New', 'credits': 3,
+        })
+
+
+class ClassSearchTests(CatalogTestData, TestCase):
+    """core.search against the index kept in sync by core.signals"""
+
+    def search(self, query):
+        return list(search_classes(Class.objects.all(), query).values_list('pk', flat=True))
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.search('cs2'), [self.classes[2].pk])
+        self.assertEqual(self.search('cs1 prof'), [self.classes[1].pk])
+
+    def test_operators_in_input_are_literal(self):
+        self.assertEqual(self.search('"cs0 OR'), [])
+        self.assertEqual(len(self.search('*')), 4)
+
+    def test_subject_code_outranks_room(self):
+        self.subjects[2].description = 'Taught in room 3'
+        self.subjects[2].save()
+        self.assertEqual(self.search('cs2')[0], self.classes[2].pk)
+        self.assertEqual(self.search('room 3'), [self.classes[3].pk, self.classes[2].pk])
+
+    def test_matches_past_the_ranked_ones_follow_by_id(self):
+        self.subjects[2].description = 'Taught in room 3'
+        self.subjects[2].save()
+        with mock.patch('core.search.RANKED_MATCHES', 1), self.assertNumQueries(2):
+            # classes[2] matches in its room and its subject's description
+            self.assertEqual(self.search('room'), [self.classes[i].pk for i in (2, 0, 1, 3)])
+
+    def test_signals_keep_index_in_sync(self):
+        self.teacher_users[1].last_name = 'Ramanujan'
+        self.teacher_users[1].save()
+        self.assertEqual(self.search('raman'), [self.classes[1].pk, self.classes[3].pk])
+        self.classes[1].delete()
+        self.assertEqual(self.search('raman'), [self.classes[3].pk])
+
+    def test_rebuild(self):
+        backend = get_backend()
+        backend.remove_classes([c.pk for c in self.classes])
+        self.assertEqual(self.search('cs0'), [])
+        backend.rebuild()
+        self.assertEqual(self.search('cs0'), [self.classes[0].pk, self.classes[3].pk])
+
+
+class PageCacheTests(CatalogTestData, TestCase):
+    """core.caching: anonymous page cache and versioned fragments"""
+
+    def test_anonymous_page_is_served_from_cache(self):
+        url = reverse('classes:list')
+        first = self.client.get(url, {'semester': '2025.1'})
+        with self.assertNumQueries(0):
+            second = self.client.get(url, {'semester': '2025.1'})
+        self.assertEqual(first.content, second.content)
+
+    def test_authenticated_page_is_not_cached(self):
+        self.client.force_login(self.student_user)
+        response = self.client.get(reverse('classes:list'))
+        self.assertContains(response, 'You are enrolled')
+
+    def test_enrollment_invalidates_page_and_card(self):
+        url = reverse('classes:list')
+        self.client.get(url)
+        self.client.force_login(self.student_users[3])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classes[0].students.add(self.students[3])
+        self.client.logout()
+        # 1 enrolled of 30 before, 2 after
+        self.assertContains(self.client.get(url), '28/30')
+
+    def test_rename_invalidates_dashboard(self):
+        url = reverse('classes:dashboard')
+        self.assertContains(self.client.get(url), 'CS001')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subjects[0].code = 'CS999'
+            self.subjects[0].save()
+        self.assertContains(self.client.get(url), 'CS999')
+
+
+class CatalogStatisticsTests(CatalogTestData, TestCase):
+    """The row kept by the after-commit deltas always equals a full recompute"""
+
+    def assertStatsCurrent(self):
+        stats = CatalogStatistics.objects.get(pk=STATS_PK)
+        expected = compute()
+        for field in ('total_classes', 'total_students', 'total_teachers', 'total_subjects',
+                      'popular_classes'):
+            self.assertEqual(getattr(stats, field), getattr(expected, field), field)
+        self.assertEqual(enrollments_by_semester(),
+                         {s.semester: s.enrollments for s in compute_semesters()})
+
+    def test_roster_changes(self):
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classes[0].students.add(*self.students[1:])
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classes[3].students.remove(self.students[0], self.students[1])
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[2].enrolled_classes.remove(self.classes[2], self.classes[0])
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[3].enrolled_classes.clear()
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[1].enrolled_classes.add(self.classes[1])
+            self.classes[2].students.clear()
+        self.assertStatsCurrent()
+
+    def test_class_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            extra = [
+                Class.objects.create(subject=self.subjects[i % 3], teacher=self.teachers[0],
+                                     schedule=f'FRI {8 + 2 * i:02d}:00-{9 + 2 * i:02d}:00',
+                                     semester='2024.2')
+                for i in range(4)
+            ]
+            extra[0].students.add(*self.students)
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classes[3].is_active = False
+            self.classes[3].save()
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            extra[0].semester = '2025.2'
+            extra[0].save()
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classes[2].delete()
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Enrolled in the same transaction that deactivates it
+            extra[1].students.add(*self.students[:2])
+            extra[1].is_active = False
+            extra[1].save()
+        self.assertStatsCurrent()
+
+    def test_profile_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student_users[2].delete()
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teachers[1].delete()
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subjects[0].delete()
+        self.assertStatsCurrent()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('late', password=None, is_staff=True)
+            Subject.objects.create(code='NEW101', name='New', credits=2)
+        self.assertStatsCurrent()
+
+    def test_writers_leave_the_row_to_the_commit(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.classes[0].students.add(*self.students[1:])
+                self.classes[2].delete()
+        self.assertFalse([q for q in queries if 'statistics' in q['sql']])
+        self.assertEqual(CatalogStatistics.objects.get(pk=STATS_PK).total_classes, 4)
+        for callback in callbacks:
+            callback()
+        self.assertStatsCurrent()
+
+    def test_missing_row_is_rebuilt(self):
+        CatalogStatistics.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            Subject.objects.create(code='NEW101', name='New', credits=2)
+        self.assertStatsCurrent()
+
+    def test_dashboard_fragments_follow_the_row(self):
+        url = reverse('classes:dashboard')
+        self.client.force_login(self.student_user)
+        self.assertContains(self.client.get(url), 'Subject 0')
+        # Another process applied a change: no cache version of ours moved
+        CatalogStatistics.objects.update(total_subjects=42, updated_at=timezone.now())
+        self.assertContains(self.client.get(url), '42')
+
+
+class SemesterArchiveTests(CatalogTestData, TestCase):
+    """core.archive and the archive-aware Class.objects.for_semester()"""
+
+    def setUp(self):
+        super().setUp()
+        self.old = Class.objects.create(subject=self.subjects[0], teacher=self.teachers[1],
+                                        schedule='FRI 08:00-10:00', semester='2024.2')
+        self.old.students.add(*self.students[:2])
+        self.semester = Semester.objects.get(code='2024.2')
+        self.semester.status = Semester.CLOSED
+        self.semester.save()
+
+    def archive(self):
+        archive_semester(self.semester, batch_size=1)
+        self.semester.refresh_from_db()
+
+    def test_archive_moves_classes_and_rosters(self):
+        self.archive()
+        self.assertEqual(self.semester.status, Semester.ARCHIVED)
+        self.assertFalse(Class.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(Class.students.through.objects.filter(class_id=self.old.pk).exists())
+
+        archived = Class.objects.for_semester('2024.2').with_stats().get()
+        self.assertIsInstance(archived, ArchivedClass)
+        self.assertEqual(archived.pk, self.old.pk)
+        self.assertEqual(archived.student_count, 2)
+        self.assertEqual(archived.created_at, self.old.created_at)
+        self.assertEqual(
+            list(Class.objects.for_semester('2025.1')), list(Class.objects.all())
+        )
+
+    def test_live_indexes_forget_archived_classes(self):
+        self.archive()
+        self.assertEqual(compute().total_classes, 4)
+        self.assertNotIn(self.old.pk, search_classes(Class.objects.all(), 'prof 1')
+                         .values_list('pk', flat=True))
+        self.assertEqual(
+            list(search_classes(Class.objects.for_semester('2024.2'), 'prof 1')
+                 .values_list('pk', flat=True)),
+            [self.old.pk]
+        )
+
+    def test_restore(self):
+        self.archive()
+        restore_semester(self.semester, batch_size=1)
+        self.semester.refresh_from_db()
+        self.assertEqual(self.semester.status, Semester.CLOSED)
+        self.assertFalse(ArchivedClass.objects.exists())
+        restored = Class.objects.with_stats().get(pk=self.old.pk)
+        self.assertEqual(restored.student_count, 2)
+        self.assertEqual(restored.created_at, self.old.created_at)
+        self.assertEqual(compute().total_classes, 5)
+
+    def test_open_semester_is_not_archived(self):
+        with self.assertRaises(ValueError):
+            archive_semester(Semester.objects.get(code='2025.1'))
+
+    def test_archived_class_pages(self):
+        self.archive()
+        response = self.client.get(reverse('classes:list'), {'semester': '2024.2'})
+        self.assertContains(response, 'FRI 08:00-10:00')
+        self.assertContains(response, '2024.2 (archived)')
+        self.client.force_login(self.student_user)
+        response = self.client.get(reverse('classes:detail', args=[self.old.pk]))
+        self.assertContains(response, '(archived)')
+        self.assertNotContains(response, 'Unenroll from Class')
+
+    def test_classes_only_go_into_open_semesters(self):
+        result = ClassService.create_class({
+            'subject_id': self.subjects[1].pk, 'teacher_id': self.teachers[0].pk,
+            'schedule': 'SAT 08:00-10:00', 'semester': '2024.2',
+        })
+        self.assertFalse(result['success'])
+        self.assertEqual(result['message'], 'Semester 2024.2 is not open')
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class AdminQueryBudgetTests(CatalogTestData, TestCase):
+    """The Class admin pages run a fixed number of queries at any catalog size"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def test_class_changelist(self):
+        response = self.client.get(reverse('admin:core_class_changelist'))
+        self.assertContains(response, self.classes[3].subject.code)
+        self.client.get(reverse('admin:core_class_changelist'), {'o': '6', 'q': 'CS'})
+
+    def test_class_change_roster_pages(self):
+        class_obj = self.classes[3]
+        url = reverse('admin:core_class_change', args=[class_obj.pk])
+        with mock.patch.object(PaginatedInlineFormSet, 'per_page', 3):
+            first = self.client.get(url)
+            second = self.client.get(url, {'roster_page': 2})
+        self.assertContains(first, 'Page 1 of 2')
+        for student in self.students[:3]:
+            self.assertContains(first, student.enrollment_number)
+        self.assertNotContains(first, self.students[3].enrollment_number)
+        self.assertContains(second, self.students[3].enrollment_number)
+
+    def test_roster_edits_go_through_signals(self):
+        class_obj = self.classes[1]  # students 0 and 1
+        url = reverse('admin:core_class_change', args=[class_obj.pk])
+        page = self.client.get(url).context['inline_admin_formsets']
+        enrolled, enroll = (formset.formset for formset in page)
+        data = {
+            'subject': class_obj.subject_id, 'teacher': class_obj.teacher_id,
+            'semester': class_obj.semester, 'schedule': class_obj.schedule,
+            'room': class_obj.room, 'max_students': class_obj.max_students, 'is_active': 'on',
+        }
+        for formset in (enrolled, enroll):
+            management = formset.management_form
+            data.update({management.add_prefix(k): v for k, v in management.initial.items()})
+        for i, form in enumerate(enrolled.forms):
+            data[form.add_prefix('id')] = form.instance.pk
+            data[form.add_prefix('class')] = class_obj.pk
+            if form.instance.student_id == self.students[0].pk:
+                data[form.add_prefix('DELETE')] = 'on'
+        data[enroll.forms[0].add_prefix('student')] = self.students[3].pk
+        data[enroll.forms[0].add_prefix('class')] = class_obj.pk
+
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(set(class_obj.students.values_list('pk', flat=True)),
+                         {self.students[1].pk, self.students[3].pk})
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class BulkClassOperationTests(CatalogTestData, TestCase):
+    """
+    core.bulk and the ClassAdmin actions built on it; each action has its
+    own query budget
+    """
+
+    def test_every_action_has_a_budget(self):
+        actions = {f'admin:core_class_changelist:{name}' for name in ClassAdmin.actions}
+        missing = actions - set(settings.QUERY_BUDGETS)
+        self.assertFalse(missing, f'No query budget for {sorted(missing)}')
+
+    def action(self, action, classes, **extra):
+        self.client.force_login(self.admin)
+        return self.client.post(reverse('admin:core_class_changelist'), {
+            'action': action, '_selected_action': [c.pk for c in classes], **extra,
+        })
+
+    def test_deactivate_and_add_seats(self):
+        self.action('deactivate_classes', self.classes[:2])
+        self.assertEqual(Class.objects.filter(is_active=False).count(), 2)
+        self.action('activate_classes', self.classes[:1])
+        self.assertEqual(Class.objects.filter(is_active=False).count(), 1)
+
+        self.action('add_seats', self.classes[2:], seats='5')
+        self.assertEqual(
+            set(Class.objects.filter(pk__in=[c.pk for c in self.classes[2:]]).values_list(
+                'max_students', flat=True)),
+            {35},
+        )
+
+    def test_move_students(self):
+        source, target = self.classes[3], self.classes[2]  # 4 and 3 students
+        with self.assertRaisesMessage(ValueError, 'free seats'):
+            target.max_students = 3
+            target.save()
+            bulk.move_students(source, target)
+        # Students 0-2 are in target already; student 3 is free on its day
+        target.max_students = 30
+        target.save()
+        self.assertEqual(bulk.move_students(source, target), 1)
+        self.assertEqual(source.students.count(), 0)
+        self.assertEqual(target.students.count(), 4)
+
+        # Moving onto a day a student already has a class
+        other = Class.objects.create(subject=self.subjects[1], teacher=self.teachers[1],
+                                     schedule='MON 14:00-16:00', semester='2025.1')
+        with self.assertRaisesMessage(ValueError, 'another class at the time'):
+            bulk.move_students(target, other)
+
+    def test_move_students_action(self):
+        response = self.action('move_students', [self.classes[0]], target=str(self.classes[1].pk))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.classes[0].students.count(), 0)
+        self.assertEqual(self.classes[1].students.count(), 2)
+
+
+class RosterExportTests(CatalogTestData, TestCase):
+    """core.exports and the streaming export views"""
+
+    def rows(self, response):
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        return list(csv.DictReader(io.StringIO(content.decode())))
+
+    def test_class_roster(self):
+        class_obj = self.classes[2]
+        self.client.force_login(self.teacher_user)
+        response = self.client.get(reverse('classes:roster_export', args=[class_obj.pk, 'csv']),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = self.rows(response)
+        self.assertEqual([r['enrollment_number'] for r in rows],
+                         [s.enrollment_number for s in self.students[:3]])
+        self.assertEqual(rows[0]['subject_code'], class_obj.subject.code)
+
+        # Students can't export rosters
+        self.client.force_login(self.student_user)
+        response = self.client.get(reverse('classes:roster_export', args=[class_obj.pk, 'csv']))
+        self.assertRedirects(response, reverse('classes:detail', args=[class_obj.pk]))
+
+    def test_teacher_rosters_jsonl(self):
+        self.client.force_login(self.teacher_user)
+        response = self.client.get(reverse('classes:my_rosters_export', args=['jsonl']))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        # prof0 teaches classes 0 and 2, with 1 and 3 students
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({r['class_id'] for r in rows}, {self.classes[0].pk, self.classes[2].pk})
+
+    def test_archived_semester(self):
+        semester = Semester.objects.get(code='2025.1')
+        semester.status = Semester.CLOSED
+        semester.save()
+        archive_semester(semester)
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('classes:semester_enrollments_export', args=['2025.1', 'csv'])
+        )
+        self.assertEqual(len(self.rows(response)), 1 + 2 + 3 + 4)
+        response = self.client.get(
+            reverse('classes:semester_enrollments_export', args=['2025.1', 'xml'])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class TimetableImportTests(CatalogTestData, TestCase):
+    """core.importing: the rules of ClassService and EnrollmentService, in bulk"""
+
+    def class_record(self, subject, teacher, schedule, semester='2025.1', **extra):
+        return {'subject_code': subject.code, 'employee_id': teacher.employee_id,
+                'schedule': schedule, 'semester': semester, **extra}
+
+    def test_import(self):
+        cs001, cs101 = self.subjects[:2]
+        prof0, prof1 = self.teachers
+        s0, s1, s2, s3 = [s.enrollment_number for s in self.students]
+        new_class = self.class_record(cs001, prof0, 'MON 14:00-16:00')
+        tiny_class = self.class_record(cs101, prof1, 'FRI 08:00-10:00', max_students='1')
+        records = list(enumerate([
+            new_class,
+            tiny_class,
+            self.class_record(cs001, prof0, 'MON 10:00-12:00'),  # exists
+            self.class_record(cs001, prof0, 'TUE 08:00-10:00', semester='2099.1'),
+            {**new_class, 'subject_code': 'NOPE'},
+            {'enrollment_number': s3, **new_class},
+            {'enrollment_number': s1, **tiny_class},
+            {'enrollment_number': s2, **tiny_class},  # full
+            {'enrollment_number': s0, **new_class},  # s0 takes MON 10:00 already
+            {'enrollment_number': s0, 'class_id': str(self.classes[0].pk)},  # exists
+            {'enrollment_number': 'S99999', 'class_id': str(self.classes[0].pk)},
+        ], 1))
+        report = TimetableImporter(chunk_size=4).run(records)
+
+        self.assertEqual((report.classes, report.enrollments, report.existing), (2, 2, 2))
+        self.assertEqual(report.rejected, [
+            (4, 'Semester 2099.1 is not open'), (5, 'Subject not found'),
+            (8, 'Class is full'), (9, f'Schedule conflict with {cs001.code}'),
+            (11, 'Student not found'),
+        ])
+        created = Class.objects.get(subject=cs001, schedule='MON 14:00-16:00')
+        self.assertEqual(list(created.students.all()), [self.students[3]])
+        self.assertIn(created.pk, get_backend().search(cs001.code))
+        self.assertEqual(enrollments_by_semester(),
+                         {s.semester: s.enrollments for s in compute_semesters()})
+
+        # A second run finds everything in place
+        report = TimetableImporter().run(records)
+        self.assertEqual((report.classes, report.enrollments, report.existing), (0, 0, 6))
+
+
+class SyntheticCatalogTests(TestCase):
+    """core.synthetic.Generator: bulk-created, but valid under the business rules"""
+
+    def test_generated_catalog(self):
+        counts = Generator(students=60, teachers=3, classes=40, density=0.9, seed=1).run()
+        self.assertEqual(counts['students'], Student.objects.count())
+        self.assertEqual(counts['enrollments'], Class.students.through.objects.count())
+
+        classes = list(Class.objects.with_stats())
+        self.assertEqual(len(classes), 40)
+        self.assertTrue(all(c.student_count <= c.max_students for c in classes))
+        slots = {(c.teacher_id, c.semester, c.schedule) for c in classes}
+        self.assertEqual(len(slots), 40)
+
+        days = {c.pk: (c.semester, c.schedule.split()[0]) for c in classes}
+        taken = [(student_id, days[class_id]) for class_id, student_id
+                 in Class.students.through.objects.values_list('class_id', 'student_id')]
+        self.assertEqual(len(taken), len(set(taken)))
+
+        self.assertEqual(enrollments_by_semester(),
+                         {s.semester: s.enrollments for s in compute_semesters()})
+        self.assertTrue(self.client.login(username='student000001', password='student123'))
+
+    def test_too_few_teachers(self):
+        with self.assertRaises(ValueError):
+            Generator(students=10, teachers=1, classes=500).check()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Routing decisions only; no query reaches the (unconfigured) replica"""
+
+    router = PrimaryReplicaRouter()
+
+    def test_reads_use_replica_until_a_write(self):
+        with routing_scope():
+            self.assertEqual(self.router.db_for_read(Class), 'replica')
+            self.assertEqual(self.router.db_for_write(Class), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_read(Class), DEFAULT_DB_ALIAS)
+        with routing_scope():
+            self.assertEqual(self.router.db_for_read(Class), 'replica')
+
+    def test_pinned_scope_and_transactions_read_primary(self):
+        with routing_scope(pinned=True):
+            self.assertEqual(self.router.db_for_read(Class), DEFAULT_DB_ALIAS)
+        connection = connections[DEFAULT_DB_ALIAS]
+        with routing_scope():
+            connection.in_atomic_block = True
+            try:
+                self.assertEqual(self.router.db_for_read(Class), DEFAULT_DB_ALIAS)
+            finally:
+                connection.in_atomic_block = False
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'core'))
+
+    def test_middleware_pins_client_after_write(self):
+        def reading_view(request):
+            return HttpResponse(self.router.db_for_read(Class))
+
+        def writing_view(request):
+            self.router.db_for_write(Class)
+            return HttpResponse(self.router.db_for_read(Class))
+
+        cookie = PrimaryPinMiddleware.cookie_name
+        request = RequestFactory().get('/')
+        response = PrimaryPinMiddleware(reading_view)(request)
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(cookie, response.cookies)
+
+        response = PrimaryPinMiddleware(writing_view)(RequestFactory().post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertIn(cookie, response.cookies)
+
+        request.COOKIES[cookie] = '1'
+        response = PrimaryPinMiddleware(reading_view)(request)
+        self.assertEqual(response.content, b'default')
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    """core.backends.sqlite3: the OPTIONS config.settings_production relies on"""
+
+    def connect(self, path, **options):
+        # A handler of its own: the test database is not touched
+        handler = ConnectionHandler({DEFAULT_DB_ALIAS: {
+            'ENGINE': 'core.backends.sqlite3', 'NAME': path, 'OPTIONS': options,
+        }})
+        self.addCleanup(handler.close_all)
+        return handler[DEFAULT_DB_ALIAS]
+
+    def test_init_command_and_transaction_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            connection = self.connect(
+                os.path.join(directory, 'db.sqlite3'),
+                init_command='PRAGMA journal_mode=WAL; PRAGMA busy_timeout=1234',
+                transaction_mode='immediate',
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone(), ('wal',))
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone(), (1234,))
+
+            statements = []
+            with connection.execute_wrapper(
+                lambda execute, sql, *args: statements.append(sql) or execute(sql, *args)
+            ):
+                # What atomic() calls to open a transaction on SQLite
+                connection._start_transaction_under_autocommit()
+                connection.connection.rollback()
+            self.assertIn('BEGIN IMMEDIATE', statements)
+            connection.close()
+
+    def test_rejects_unknown_transaction_mode(self):
+        connection = self.connect(':memory:', transaction_mode='LAZY')
+        with self.assertRaises(ImproperlyConfigured):
+            connection.ensure_connection()
+
+
+# A table read row by row: "SCAN core_class", not "SCAN core_class USING INDEX ..."
+FULL_SCAN = re.compile(r'\bSCAN (\w+)(?: AS \w+)?$')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class QueryPlanTests(CatalogTestData, TestCase):
+    """Hot-path queries keep using the indexes added for them"""
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, queryset):
+        plan = self.plan(queryset)
+        scans = [step for step in plan if FULL_SCAN.search(step)]
+        self.assertEqual(scans, [], '\n'.join(plan))
+        return plan
+
+    def test_class_list(self):
+        active = Class.objects.filter(is_active=True).with_stats().select_related(
+            'subject', 'teacher', 'teacher__user'
+        )
+        plan = self.assertNoFullScan(active)
+        self.assertIn('SCAN core_class USING INDEX core_class_active_semester', plan)
+        plan = self.assertNoFullScan(active.filter(semester='2025.1'))
+        self.assertIn('SEARCH core_class USING INDEX core_class_active_semester (semester=?)', plan)
+
+    def test_student_classes(self):
+        student_id = self.students[0].pk
+        plan = self.assertNoFullScan(
+            Class.objects.for_student(student_id).order_by().values_list('pk', flat=True)
+        )
+        self.assertIn(
+            'SEARCH core_class_students USING COVERING INDEX '
+            'core_class_students_student_class (student_id=?)', plan
+        )
+        self.assertNoFullScan(
+            Class.objects.for_student(student_id).filter(is_active=True)
+            .select_related('subject', 'teacher', 'teacher__user')
+        )
+
+    def test_teacher_classes(self):
+        self.assertNoFullScan(
+            Class.objects.for_teacher(self.teachers[0].pk).filter(is_active=True)
+            .with_stats().select_related('subject')
+        )
+
+    def test_enrollment_check(self):
+        self.assertNoFullScan(
+            self.classes[0].students.filter(pk=self.students[0].pk)
+        )
+
+    def test_popular_classes(self):
+        self.assertNoFullScan(popular_queryset())
+
+    def test_people_lists_are_read_in_name_order(self):
+        for queryset in (Teacher.objects.select_related('user'),
+                         Student.objects.select_related('user')):
+            plan = self.assertNoFullScan(queryset)
+            self.assertIn('SCAN auth_user USING INDEX accounts_user_name_idx', plan)
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+
+class RadixTrieTests(TestCase):
+
+    def test_split_and_merge(self):
+        trie = RadixTrie()
+        for key in ('cs101', 'cs102', 'cs2'):
+            trie.insert(key, key)
+        self.assertEqual(set(trie.root.children['c'].children), {'1', '2'})
+        self.assertEqual(trie.complete('cs1', 10), ['cs101', 'cs102'])
+        trie.remove('cs102', 'cs102')
+        trie.remove('cs2', 'cs2')
+        self.assertEqual(trie.root.children['c'].label, 'cs101')
+        self.assertEqual((trie.key_count, trie.node_count()), (1, 2))
+
+    def test_prefix_inside_an_edge(self):
+        trie = RadixTrie()
+        trie.insert('database systems', 1)
+        self.assertEqual(trie.complete('datab', 10), [1])
+        self.assertEqual(trie.complete('datax', 10), [])
+
+
+class AutocompleteIndexTests(CatalogTestData, TestCase):
+
+    def setUp(self):
+        autocomplete_index.reset()
+
+    def labels(self, query):
+        return [result['label'] for result in autocomplete_index.complete(query)]
+
+    def test_matches_any_word_ignoring_case_and_accents(self):
+        self.teacher_users[0].last_name = 'Conceição'
+        self.teacher_users[0].save()
+        self.assertEqual(self.labels('CONCEI'), ['Prof Conceição'])
+        self.assertEqual(self.labels('subject 2'), ['CS201 - Subject 2'])
+
+    def test_signals_update_the_built_index(self):
+        self.assertEqual(self.labels('cs0'), ['CS001 - Subject 0'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subjects[0].code = 'MA001'
+            self.subjects[0].save()
+            self.teacher_users[1].first_name = 'Ada'
+            self.teacher_users[1].save()
+        self.assertEqual(self.labels('cs0'), [])
+        self.assertEqual(self.labels('ma0'), ['MA001 - Subject 0'])
+        self.assertEqual(self.labels('ada'), ['Ada 1'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teachers[1].delete()
+        self.assertEqual(self.labels('ada'), [])
+
+
+class EnrollmentMatrixTests(CatalogTestData, TestCase):
+    """core.matrix, loaded from the roster table and kept current by core.signals"""
+
+    def assertMatchesDatabase(self):
+        enrolled = set(Class.students.through.objects.values_list('class_id', 'student_id'))
+        for class_obj in Class.objects.all():
+            self.assertEqual(sorted(enrollment_matrix.roster(class_obj.pk)),
+                             sorted(s for c, s in enrolled if c == class_obj.pk))
+        for student in Student.objects.all():
+            self.assertEqual(sorted(enrollment_matrix.student_classes(student.pk)),
+                             sorted(c for c, s in enrolled if s == student.pk))
+        self.assertEqual(enrollment_matrix.stats()['enrollments'], len(enrolled))
+
+    def test_class_list_badges_without_the_bus_come_from_the_database(self):
+        # Another process's enrollment: this process's matrix never hears of it
+        Class.students.through.objects.bulk_create([
+            Class.students.through(class_id=self.classes[0].pk, student_id=self.students[3].pk)
+        ])
+        self.client.force_login(self.student_users[3])
+        self.assertContains(self.client.get(reverse('classes:list')), 'You are enrolled',
+                            count=2)
+
+    def test_lookups_skip_the_database(self):
+        first, last = self.students[0], self.students[3]
+        with self.assertNumQueries(0):
+            self.assertTrue(enrollment_matrix.is_enrolled(first.pk, self.classes[0].pk))
+            self.assertFalse(enrollment_matrix.is_enrolled(last.pk, self.classes[0].pk))
+            self.assertEqual(enrollment_matrix.roster_size(self.classes[3].pk), 4)
+            self.assertEqual(enrollment_matrix.student_classes(last.pk, '2025.1'),
+                             [self.classes[3].pk])
+            self.assertEqual(enrollment_matrix.student_classes(last.pk, '2024.2'), [])
+        self.assertMatchesDatabase()
+
+    def test_conflict(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            thursday = Class.objects.create(subject=self.subjects[1], teacher=self.teachers[0],
+                                            schedule='THU 14:00-16:00', semester='2025.1')
+        student = self.students[3]  # only in classes[3], on THU
+        self.assertEqual(enrollment_matrix.conflict(student.pk, thursday.pk), self.classes[3].pk)
+        self.assertEqual(enrollment_matrix.conflict(student.pk, self.classes[0].pk), None)
+
+    def test_signals_keep_it_current(self):
+        enrollment_matrix.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classes[0].students.add(self.students[3])
+            self.students[2].enrolled_classes.remove(self.classes[2])
+            self.classes[1].students.clear()
+            self.students[0].enrolled_classes.clear()
+            self.classes[3].delete()
+            self.students[1].delete()
+            created = Class.objects.create(subject=self.subjects[2], teacher=self.teachers[1],
+                                           schedule='FRI 08:00-10:00', semester='2025.1')
+            created.students.add(self.students[2])
+        self.assertMatchesDatabase()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.set_active(Class.objects.filter(pk=created.pk), False)
+        self.assertFalse(enrollment_matrix.is_built)
+        self.assertMatchesDatabase()
+
+
+class SharedCatalogFileTests(CatalogTestData, TestCase):
+    """core.shared_catalog: the file written from the database and its readers"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'catalog.bin')
+        self.addCleanup(shared_catalog.reset)
+
+    def test_lookups_match_the_database(self):
+        Class.objects.filter(pk=self.classes[2].pk).update(is_active=False)
+        write_catalog_file(self.path)
+        with CatalogFile(self.path) as catalog, self.assertNumQueries(0):
+            self.assertEqual(len(catalog), 3)
+            self.assertEqual((catalog.subject_count, catalog.teacher_count), (3, 2))
+            entry = catalog.get_class(self.classes[3].pk)
+            self.assertEqual(entry.subject_code, self.subjects[0].code)
+            self.assertEqual(entry.teacher_name, self.teachers[1].full_name)
+            self.assertEqual((entry.schedule, entry.room, entry.semester),
+                             ('THU 10:00-12:00', 'Room 3', '2025.1'))
+            self.assertEqual(catalog.seats(self.classes[3].pk), (4, 30))
+            self.assertNotIn(self.classes[2].pk, catalog)
+            self.assertIsNone(catalog.get_class(self.classes[2].pk))
+            self.assertIsNone(catalog.seats(0))
+            self.assertEqual([c.id for c in catalog.classes('2025.1')],
+                             [self.classes[i].pk for i in (0, 1, 3)])
+            self.assertEqual(list(catalog.classes('2024.2')), [])
+
+    def test_writes_schedule_one_rewrite_and_readers_remap(self):
+        with override_settings(CATALOG_FILE=self.path, CATALOG_FILE_CHECK_INTERVAL=0):
+            self.assertIsNone(shared_catalog.get())
+            write_catalog_file(self.path)
+            before = shared_catalog.get()
+            self.assertEqual(before.seats(self.classes[0].pk), (1, 30))
+
+            with mock.patch('core.shared_catalog.threading.Timer') as timer:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.classes[0].students.add(self.students[3])
+                    self.classes[1].save()
+            timer.assert_called_once()
+            # What the timer runs, minus closing this thread's connection
+            write_catalog_file(self.path)
+            after = shared_catalog.get()
+            self.assertIsNot(after, before)
+            self.assertEqual(after.seats(self.classes[0].pk), (2, 30))
+            self.assertGreater(after.generation, before.generation)
+            # The old mapping stays readable for threads still using it
+            self.assertEqual(before.seats(self.classes[0].pk), (1, 30))
+
+
+class InvalidationBusTests(CatalogTestData, TestCase):
+    """core.bus: events published on commit and applied in another process"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.outbox = os.path.join(directory.name, 'bus.sqlite3')
+        self.settings = override_settings(INVALIDATION_BUS={'TRANSPORT': 'sqlite',
+                                                            'PATH': self.outbox})
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(bus.reset)
+        self.addCleanup(enrollment_matrix.reset)
+
+    def published(self):
+        """The events in the outbox, as another process receives them"""
+        reader = SQLiteOutboxTransport(self.outbox)
+        reader.cursor = 0
+        events = [json.loads(data) for data in reader.receive(0)]
+        reader.close()
+        return events
+
+    def remote(self, **event):
+        """An event from another process"""
+        event = {'origin': 'elsewhere', 'seq': 1, 'at': time.time(), 'pks': [], 'class_ids': [],
+                 'semesters': [], **event}
+        return bus.receive(event)
+
+    def test_writes_are_published_once_committed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classes[0].students.add(self.students[3])
+            self.subjects[1].save()
+            self.students[2].delete()
+            self.assertEqual(self.published(), [])
+        events = self.published()
+        self.assertEqual([e['seq'] for e in events], list(range(1, len(events) + 1)))
+        self.assertTrue(all(e['origin'] == ORIGIN for e in events))
+        kinds = [(e['model'], e['action']) for e in events]
+        self.assertIn(('class', 'enroll'), kinds)
+        self.assertIn(('subject', 'save'), kinds)
+        self.assertIn(('student', 'delete'), kinds)
+        enroll = events[kinds.index(('class', 'enroll'))]
+        self.assertEqual(enroll['pairs'], [[self.classes[0].pk, self.students[3].pk]])
+        self.assertEqual(enroll['semesters'], ['2025.1'])
+        # This process's own events are not applied twice
+        self.assertEqual([bus.receive(event) for event in events], [False] * len(events))
+
+    def test_events_from_elsewhere_update_the_local_caches(self):
+        enrollment_matrix.build()
+        autocomplete_index.build()
+        class_id, student_id = self.classes[0].pk, self.students[3].pk
+        Class.students.through.objects.create(class_id=class_id, student_id=student_id)
+        with self.assertNumQueries(0):
+            self.remote(model='class', action='enroll', pks=[class_id], class_ids=[class_id],
+                        semesters=['2025.1'], pairs=[[class_id, student_id]])
+        self.assertTrue(enrollment_matrix.is_enrolled(student_id, class_id))
+        self.assertTrue(autocomplete_index.is_built)
+
+        self.remote(model='subject', action='save', seq=2, pks=[self.subjects[0].pk])
+        self.assertFalse(autocomplete_index.is_built)
+        with self.assertLogs('core.bus', 'WARNING'):
+            self.remote(model='class', action='save', seq=5, classes=[])
+        self.assertFalse(enrollment_matrix.is_built)
+        stats = bus.stats()
+        self.assertEqual((stats['received'], stats['gaps']), (3, 1))
+        self.assertIsNotNone(stats['lag_p99_ms'])
+
+    def test_unix_sockets_deliver_to_the_other_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        sockets = os.path.join(directory.name, 'bus')
+        web = UnixSocketTransport(sockets, origin='web')
+        grpc = UnixSocketTransport(sockets, origin='grpc')
+        self.addCleanup(web.close)
+        self.addCleanup(grpc.close)
+        self.assertEqual(grpc.receive(0.01), [])  # binds its socket
+        web.send(b'{}')
+        web.send(b'[]')
+        self.assertEqual(grpc.receive(1), [b'{}', b'[]'])
+
+
+    def test_class_list_badges_come_from_the_matrix(self):
+        class_id, student_id = self.classes[0].pk, self.students[3].pk
+        self.remote(model='class', action='enroll', pks=[class_id], class_ids=[class_id],
+                    semesters=['2025.1'], pairs=[[class_id, student_id]])
+        self.client.force_login(self.student_users[3])
+        self.assertContains(self.client.get(reverse('classes:list')), 'You are enrolled',
+                            count=2)
+
+
+class ReferenceDataTests(CatalogTestData, TestCase):
+    """core.refdata: the local and shared tiers and their invalidation"""
+
+    def test_lookups_hit_the_local_tier_until_a_write_commits(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(reference_data.subject(self.subjects[0].pk).code, 'CS001')
+            self.assertEqual(reference_data.teacher(str(self.teachers[1].pk)).full_name, 'Prof 1')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(reference_data.subjects()), 3)
+            self.assertIsNone(reference_data.subject('garbage'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Subject.objects.filter(pk=self.subjects[0].pk).update(name='Renamed')
+            self.subjects[0].refresh_from_db()
+            self.subjects[0].save()
+        with self.assertNumQueries(1):
+            self.assertEqual(reference_data.subject(self.subjects[0].pk).name, 'Renamed')
+        stats = reference_data.stats()['subjects']
+        self.assertEqual((stats['local'], stats['miss'], stats['invalidated']), (2, 2, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_shared_tier_serves_the_other_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                  'LOCATION': directory.name}
+        with override_settings(CACHES={**settings.CACHES, 'shared': shared},
+                               REFDATA_SHARED_CACHE='shared'):
+            with self.assertNumQueries(1):
+                reference_data.semesters()
+            # A process whose local tier is empty
+            reference_data.reset()
+            with self.assertNumQueries(0):
+                self.assertIn('2025.1', [s.code for s in reference_data.semesters()])
+            self.assertEqual(reference_data.stats()['semesters']['shared'], 1)
+
+            # Another process's write bumps the shared version
+            reference_data.invalidate('semesters')
+            reference_data.reset()
+            with self.assertNumQueries(1):
+                reference_data.semesters()
+
+    def test_class_creation_checks_the_database(self):
+        gone = Subject.objects.create(code='CS999', name='Gone', credits=2)
+        # Warm, then stale: written behind the signals' back
+        reference_data.semesters()
+        reference_data.subjects()
+        Semester.objects.filter(code='2025.1').update(status=Semester.CLOSED)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_subject WHERE id = %s', [gone.pk])
+        data = {'subject_id': self.subjects[1].pk, 'teacher_id': self.teachers[0].pk,
+                'schedule': 'SAT 08:00-10:00', 'semester': '2025.1'}
+        self.assertEqual(ClassService.create_class(data)['message'], 'Semester 2025.1 is not open')
+        data.update(subject_id=gone.pk, semester='2025.2')
+        self.assertEqual(ClassService.create_class(data)['message'], 'Subject not found')
@@ -22,6 +22,12 @@ urlpatterns = [
     path('my-classes/', views.my_classes, name='my_classes'),
     path('my-teaching/', views.my_teaching, name='my_teaching'),
     
+    # Exports (format: csv or jsonl)
+    path('<int:pk>/roster.<str:format>', views.class_roster_export, name='roster_export'),
+    path('my-teaching/rosters.<str:format>', views.my_rosters_export, name='my_rosters_export'),
+    path('semesters/<str:semester>/enrollments.<str:format>', views.semester_enrollments_export,
+         name='semester_enrollments_export'),
+    
     # Subjects
     path('subjects/', views.subject_list, name='subject_list'),
     path('subjects/create/', views.subject_create, name='subject_create'),
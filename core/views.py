@@ -1,56 +1,77 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, StreamingHttpResponse
+from django.views.decorators.gzip import gzip_page
 from django.contrib import messages
-from django.db.models import Q, Sum, Count
-from .models import Class, Subject
-from accounts.models import Teacher, Student
+from django.db import transaction
+from django.db.models import Sum, Count
+from .models import ArchivedClass, Class, Semester, Subject
+from . import exports
+from .bus import bus
+from .caching import attach_class_versions, cache_anonymous_page, cache_timeout, catalog_version, get_versions
+from .matrix import enrollment_matrix
+from .refdata import reference_data
+from .search import search_classes
+from .stats import CatalogStats
+from backend_service import feed
 from backend_service.services import EnrollmentService, ClassService, SubjectService
 
 
+@cache_anonymous_page
 def class_list(request):
     """List all active classes with optional filtering"""
-    classes = Class.objects.filter(is_active=True).select_related(
-        'subject', 'teacher', 'teacher__user'
-    ).prefetch_related('students')
-    
-    # Filter by semester
+    # Filter by semester; archived ones are read from the archive tables
     semester = request.GET.get('semester')
-    if semester:
-        classes = classes.filter(semester=semester)
+    classes = Class.objects.for_semester(semester) if semester else Class.objects.all()
+    classes = classes.filter(is_active=True).with_stats().select_related(
+        'subject', 'teacher', 'teacher__user'
+    )
     
     # Filter by subject
     subject_id = request.GET.get('subject')
     if subject_id:
         classes = classes.filter(subject_id=subject_id)
     
-    # Search
+    # Full-text search, best match first
     search = request.GET.get('search')
     if search:
-        classes = classes.filter(
-            Q(subject__code__icontains=search) |
-            Q(subject__name__icontains=search) |
-            Q(teacher__user__first_name__icontains=search) |
-            Q(teacher__user__last_name__icontains=search)
-        )
+        classes = search_classes(classes, search)
+    
+    enrolled_class_ids = set()
+    if request.role.is_student:
+        student_id = request.role.student_id
+        # The matrix only hears of other processes' writes over the bus
+        if bus.enabled:
+            enrolled_class_ids = set(enrollment_matrix.student_classes(student_id))
+        else:
+            enrolled_class_ids = set(
+                Class.objects.for_student(student_id).values_list('pk', flat=True)
+            )
     
     return render(request, 'classes/list.html', {
-        'classes': classes,
+        'classes': attach_class_versions(classes),
         'current_semester': semester,
+        'semesters': reference_data.semesters(),
+        'enrolled_class_ids': enrolled_class_ids,
+        'cache_timeout': cache_timeout(),
     })
 
 
 def class_detail(request, pk):
     """Show class details"""
-    class_obj = get_object_or_404(
-        Class.objects.select_related('subject', 'teacher', 'teacher__user')
-        .prefetch_related('students', 'students__user'),
-        pk=pk
-    )
+    related = ('subject', 'teacher', 'teacher__user')
+    roster = ('students', 'students__user')
+    class_obj = Class.objects.select_related(*related).prefetch_related(*roster).filter(pk=pk).first()
+    if class_obj is None:
+        # Archived classes keep the pk they had
+        class_obj = get_object_or_404(
+            ArchivedClass.objects.select_related(*related).prefetch_related(*roster), pk=pk
+        )
     
     # Check if current user is enrolled (if student)
     is_enrolled = False
-    if request.user.is_authenticated and hasattr(request.user, 'student_profile'):
-        is_enrolled = request.user.student_profile in class_obj.students.all()
+    if request.role.is_student:
+        is_enrolled = any(s.pk == request.role.student_id for s in class_obj.students.all())
     
     return render(request, 'classes/detail.html', {
         'class': class_obj,
@@ -62,12 +83,12 @@ def class_detail(request, pk):
 def class_create(request):
     """Create a new class"""
     # Only teachers and staff can create classes
-    if not (hasattr(request.user, 'teacher_profile') or request.user.is_staff):
+    if not (request.role.is_teacher or request.user.is_staff):
         messages.error(request, 'Only teachers can create classes.')
         return redirect('classes:list')
     
-    subjects = Subject.objects.all().order_by('code')
-    teachers = Teacher.objects.select_related('user').all()
+    subjects = reference_data.subjects()
+    teachers = reference_data.teachers()
     
     if request.method == 'POST':
         # Get form data
@@ -80,8 +101,8 @@ def class_create(request):
         is_active = request.POST.get('is_active') == 'on'
         
         # If user is a teacher, use their profile
-        if hasattr(request.user, 'teacher_profile') and not teacher_id:
-            teacher_id = request.user.teacher_profile.id
+        if request.role.is_teacher and not teacher_id:
+            teacher_id = request.role.teacher_id
         
         # Prepare data for service
         data = {
@@ -106,17 +127,19 @@ def class_create(request):
     return render(request, 'classes/create.html', {
         'subjects': subjects,
         'teachers': teachers,
+        'semesters': reference_data.semesters(Semester.OPEN),
+        'default_semester': Class._meta.get_field('semester').get_default(),
     })
 
 
 @login_required
 def class_edit(request, pk):
     """Edit an existing class"""
-    class_obj = get_object_or_404(Class, pk=pk)
+    class_obj = get_object_or_404(Class.objects.select_related('subject', 'teacher__user'), pk=pk)
     
     # Only the teacher who owns the class or staff can edit
-    if hasattr(request.user, 'teacher_profile'):
-        if class_obj.teacher != request.user.teacher_profile and not request.user.is_staff:
+    if request.role.is_teacher:
+        if class_obj.teacher_id != request.role.teacher_id and not request.user.is_staff:
             messages.error(request, 'You can only edit your own classes.')
             return redirect('classes:detail', pk=pk)
     elif not request.user.is_staff:
@@ -132,25 +155,32 @@ def class_edit(request, pk):
         class_obj.is_active = request.POST.get('is_active') == 'on'
         
         try:
-            class_obj.save()
+            with transaction.atomic():
+                class_obj.save()
+                feed.record_class(class_obj)
             messages.success(request, 'Class updated successfully!')
             return redirect('classes:detail', pk=pk)
         except Exception as e:
             messages.error(request, f'Error updating class: {str(e)}')
     
+    # Open semesters, plus the class's own if it has been closed since
+    semesters = [s for s in reference_data.semesters()
+                 if s.is_open or s.code == class_obj.semester]
+    
     return render(request, 'classes/edit.html', {
         'class': class_obj,
+        'semesters': semesters,
     })
 
 
 @login_required
 def class_delete(request, pk):
     """Delete a class"""
-    class_obj = get_object_or_404(Class, pk=pk)
+    class_obj = get_object_or_404(Class.objects.select_related('subject', 'teacher__user'), pk=pk)
     
     # Only the teacher who owns the class or staff can delete
-    if hasattr(request.user, 'teacher_profile'):
-        if class_obj.teacher != request.user.teacher_profile and not request.user.is_staff:
+    if request.role.is_teacher:
+        if class_obj.teacher_id != request.role.teacher_id and not request.user.is_staff:
             messages.error(request, 'You can only delete your own classes.')
             return redirect('classes:detail', pk=pk)
     elif not request.user.is_staff:
@@ -159,7 +189,9 @@ def class_delete(request, pk):
     
     if request.method == 'POST':
         class_name = str(class_obj)
-        class_obj.delete()
+        with transaction.atomic():
+            class_obj.delete()
+            feed.record_class_deleted(pk)
         messages.success(request, f'Class "{class_name}" deleted successfully!')
         return redirect('classes:list')
     
@@ -170,15 +202,13 @@ def class_delete(request, pk):
 def enroll_class(request, pk):
     """Enroll student in a class"""
     # Only students can enroll
-    if not hasattr(request.user, 'student_profile'):
+    if not request.role.is_student:
         messages.error(request, 'Only students can enroll in classes.')
         return redirect('classes:detail', pk=pk)
     
     if request.method == 'POST':
-        student = request.user.student_profile
-        
         # Use business logic service
-        result = EnrollmentService.enroll_student(pk, student.id)
+        result = EnrollmentService.enroll_student(pk, request.role.student_id)
         
         if result['success']:
             messages.success(request, result['message'])
@@ -192,15 +222,13 @@ def enroll_class(request, pk):
 def unenroll_class(request, pk):
     """Unenroll student from a class"""
     # Only students can unenroll
-    if not hasattr(request.user, 'student_profile'):
+    if not request.role.is_student:
         messages.error(request, 'Only students can unenroll from classes.')
         return redirect('classes:detail', pk=pk)
     
     if request.method == 'POST':
-        student = request.user.student_profile
-        
         # Use business logic service
-        result = EnrollmentService.unenroll_student(pk, student.id)
+        result = EnrollmentService.unenroll_student(pk, request.role.student_id)
         
         if result['success']:
             messages.success(request, result['message'])
@@ -214,14 +242,12 @@ def unenroll_class(request, pk):
 def my_classes(request):
     """Show student's enrolled classes"""
     # Only students can view their enrolled classes
-    if not hasattr(request.user, 'student_profile'):
+    if not request.role.is_student:
         messages.error(request, 'This page is only for students.')
         return redirect('classes:list')
     
-    student = request.user.student_profile
-    
     # Get enrolled classes
-    enrolled_classes = student.enrolled_classes.filter(
+    enrolled_classes = Class.objects.for_student(request.role.student_id).filter(
         is_active=True
     ).select_related('subject', 'teacher', 'teacher__user')
     
@@ -240,16 +266,14 @@ def my_classes(request):
 def my_teaching(request):
     """Show teacher's classes"""
     # Only teachers can view their teaching schedule
-    if not hasattr(request.user, 'teacher_profile'):
+    if not request.role.is_teacher:
         messages.error(request, 'This page is only for teachers.')
         return redirect('classes:list')
     
-    teacher = request.user.teacher_profile
-    
     # Get teaching classes
-    teaching_classes = teacher.classes.filter(
+    teaching_classes = Class.objects.for_teacher(request.role.teacher_id).filter(
         is_active=True
-    ).select_related('subject').prefetch_related('students')
+    ).with_stats().select_related('subject')
     
     # Calculate total students
     total_students = sum(c.enrolled_count for c in teaching_classes)
@@ -260,9 +284,69 @@ def my_teaching(request):
     })
 
 
+def _export_response(queryset, filename, format):
+    if format not in exports.FORMATS:
+        raise Http404(f'Unknown export format "{format}"')
+    response = StreamingHttpResponse(
+        exports.stream(queryset, format), content_type=exports.FORMATS[format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{format}"'
+    return response
+
+
+@gzip_page
+@login_required
+def class_roster_export(request, pk, format):
+    """Stream a class roster"""
+    # Archived classes keep the pk they had
+    owner = Class.objects.filter(pk=pk).order_by().values_list('teacher_id', flat=True).first()
+    archived = owner is None
+    if archived:
+        owner = get_object_or_404(
+            ArchivedClass.objects.order_by().values_list('teacher_id', flat=True), pk=pk
+        )
+    
+    # Only the teacher who owns the class or staff can export its roster
+    if owner != request.role.teacher_id and not request.user.is_staff:
+        messages.error(request, 'You can only export the rosters of your own classes.')
+        return redirect('classes:detail', pk=pk)
+    
+    return _export_response(exports.class_roster(pk, archived=archived), f'roster-{pk}', format)
+
+
+@gzip_page
+@login_required
+def my_rosters_export(request, format):
+    """Stream the rosters of every class the teacher teaches"""
+    if not request.role.is_teacher:
+        messages.error(request, 'This page is only for teachers.')
+        return redirect('classes:list')
+    
+    semester = request.GET.get('semester')
+    queryset = exports.teacher_rosters(request.role.teacher_id, semester)
+    filename = f'rosters-{semester}' if semester else 'rosters'
+    return _export_response(queryset, filename, format)
+
+
+@gzip_page
+@login_required
+def semester_enrollments_export(request, semester, format):
+    """Stream every enrollment of a semester"""
+    if not request.user.is_staff:
+        messages.error(request, 'Only administrators can export semester enrollments.')
+        return redirect('classes:list')
+    
+    semester = get_object_or_404(Semester, code=semester)
+    return _export_response(
+        exports.semester_enrollments(semester.code, archived=semester.is_archived),
+        f'enrollments-{semester.code}', format,
+    )
+
+
+@cache_anonymous_page
 def subject_list(request):
     """List all subjects"""
-    subjects = Subject.objects.all().prefetch_related('classes').order_by('code')
+    subjects = Subject.objects.with_stats().order_by('code')
     
     return render(request, 'classes/subject_list.html', {
         'subjects': subjects,
@@ -304,64 +388,34 @@ def subject_create(request):
     return render(request, 'classes/subject_create.html', {})
 
 
+@cache_anonymous_page
 def dashboard(request):
     """System dashboard with statistics"""
     
-    # Total counts
-    total_classes = Class.objects.filter(is_active=True).count()
-    total_students = Student.objects.count()
-    total_teachers = Teacher.objects.count()
-    total_subjects = Subject.objects.count()
-    
-    # Enrollments by semester
-    enrollments = Class.objects.filter(is_active=True).values('semester').annotate(
-        count=Count('students')
-    ).order_by('-semester')
-    enrollments_by_semester = {e['semester']: e['count'] for e in enrollments}
-    
-    # Popular classes (top 5 by enrollment)
-    # Use 'student_count' instead of 'enrolled_count' to avoid property conflict
-    popular_classes_qs = Class.objects.filter(is_active=True).annotate(
-        student_count=Count('students')
-    ).select_related('subject').order_by('-student_count')[:5]
-    
-    # Convert to list with custom structure
-    popular_classes = []
-    for c in popular_classes_qs:
-        popular_classes.append({
-            'pk': c.pk,
-            'subject': c.subject,
-            'max_students': c.max_students,
-            'student_count': c.student_count,
-        })
+    # The statistics row is read for its updated_at, part of the fragment
+    # cache keys; the semester figures only when their fragment misses
+    stats = CatalogStats()
+    semester_versions = get_versions('semester', Semester.objects.values_list('code', flat=True))
     
     # User-specific stats
     user_stats = {}
-    if request.user.is_authenticated:
-        if hasattr(request.user, 'student_profile'):
-            student = request.user.student_profile
-            user_stats = {
-                'type': 'student',
-                'enrolled_count': student.enrolled_classes.filter(is_active=True).count(),
-                'total_credits': student.enrolled_classes.filter(is_active=True).aggregate(
-                    total=Sum('subject__credits')
-                )['total'] or 0,
-            }
-        elif hasattr(request.user, 'teacher_profile'):
-            teacher = request.user.teacher_profile
-            teaching_classes = teacher.classes.filter(is_active=True)
-            user_stats = {
-                'type': 'teacher',
-                'teaching_count': teaching_classes.count(),
-                'total_students': sum(c.enrolled_count for c in teaching_classes),
-            }
+    if request.role.is_student:
+        user_stats = Class.objects.for_student(request.role.student_id).filter(
+            is_active=True
+        ).aggregate(enrolled_count=Count('pk'), total_credits=Sum('subject__credits'))
+        user_stats['type'] = 'student'
+        user_stats['total_credits'] = user_stats['total_credits'] or 0
+    elif request.role.is_teacher:
+        # distinct: the join through students repeats each class per student
+        user_stats = Class.objects.for_teacher(request.role.teacher_id).filter(
+            is_active=True
+        ).aggregate(teaching_count=Count('pk', distinct=True), total_students=Count('students'))
+        user_stats['type'] = 'teacher'
     
     return render(request, 'classes/dashboard.html', {
-        'total_classes': total_classes,
-        'total_students': total_students,
-        'total_teachers': total_teachers,
-        'total_subjects': total_subjects,
-        'enrollments_by_semester': enrollments_by_semester,
-        'popular_classes': popular_classes,
+        'stats': stats,
         'user_stats': user_stats,
+        'cache_timeout': cache_timeout(),
+        'catalog_version': catalog_version(),
+        'semester_version': '.'.join(semester_versions.values()),
     })
\ No newline at end of file
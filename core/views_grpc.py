@@ -13,15 +13,13 @@ from backend_service.grpc_client import (
 @login_required
 def enroll_class_grpc(request, pk):
     """Enroll student using gRPC"""
-    if not hasattr(request.user, 'student_profile'):
+    if not request.role.is_student:
         messages.error(request, 'Only students can enroll in classes.')
         return redirect('classes:detail', pk=pk)
     
     if request.method == 'POST':
-        student = request.user.student_profile
-        
         # Call gRPC service instead of direct service
-        result = enroll_student_grpc(pk, student.id)
+        result = enroll_student_grpc(pk, request.role.student_id)
         
         if result['success']:
             messages.success(request, result['message'])
@@ -34,15 +32,13 @@ def enroll_class_grpc(request, pk):
 @login_required
 def unenroll_class_grpc(request, pk):
     """Unenroll student using gRPC"""
-    if not hasattr(request.user, 'student_profile'):
+    if not request.role.is_student:
         messages.error(request, 'Only students can unenroll from classes.')
         return redirect('classes:detail', pk=pk)
     
     if request.method == 'POST':
-        student = request.user.student_profile
-        
         # Call gRPC service
-        result = unenroll_student_grpc(pk, student.id)
+        result = unenroll_student_grpc(pk, request.role.student_id)
         
         if result['success']:
             messages.success(request, result['message'])